@@ -1,10 +1,35 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request
 from flask_cors import CORS
 from core.graph import RoadGraph
-from core.algorithms import dijkstra, a_star
+from core.algorithms import (dijkstra, a_star, bidirectional_dijkstra, bidirectional_a_star, bounded_dijkstra,
+                             alternative_routes)
 from core.constraints import ConstraintsManager
+from core.ch import ContractionHierarchy
+from core.crp import CellOverlay
+from core.landmarks import LandmarkTable
+from core.derived import DerivedStructure
+from core.snapshot import is_snapshot_fresh, load_snapshot
+from core.route_cache import RouteCache
+from core.matrix import MatrixPool, distance_matrix
+from core.geometry import convex_hull
+from core.csr import CSRGraph
+from core.rwlock import ReadWriteLock
+from core.shared import DEFAULT_SHARED_DIR, SharedGraphState
+from core.snapshot import build_snapshot
+from core.batch import BatchRunner, JobRegistry
+from core.metrics import MetricsRegistry, SearchStats
+from core.payloads import Payload, PayloadCache
+from core.arrayfile import dump_arrays
+from core.tiles import DETAIL_ZOOM, MAX_ZOOM, TileCache, edge_features, tile_bbox
+from array import array
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+import atexit
 import csv
+import json
 import os
+import threading
+import time
 
 app = Flask(__name__,
             template_folder='../frontend/templates',
@@ -15,21 +40,283 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
 NODES_CSV = os.path.join(DATA_DIR, 'nodes.csv')
 EDGES_CSV = os.path.join(DATA_DIR, 'edges.csv')
 CONSTRAINTS_CSV = os.path.join(DATA_DIR, 'constraints', 'constraints_edges.csv')
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+# Tạo bởi import_data.py (hoặc khi load từ CSV); chỉ dùng khi mới hơn nodes.csv và edges.csv
+GRAPH_SNAPSHOT = os.path.join(CACHE_DIR, 'graph.snapshot')
+# True: constraints được append vào change log (constraints_edges.csv.log) và gộp vào CSV định kỳ
+CONSTRAINTS_JOURNAL = False
 
+# 'csr': thuật toán chạy trên mảng CSR của graph, 'dict': chạy trên adjacency dict gốc
+ROUTING_BACKEND = 'csr'
+
+# Dựng (hoặc đọc từ cache) Contraction Hierarchies ở thread nền ngay sau khi load graph
+PREPARE_CH_ON_LOAD = True
+# Dựng overlay theo cell (thuật toán 'crp') ở thread nền sau khi load graph; sau đó chỉ customize lại cell có edge
+# đổi constraint. False: 'crp' dùng bidirectional_dijkstra
+PREPARE_CRP_ON_LOAD = True
+# Số landmark cho heuristic ALT (0 = tắt)
+NUM_LANDMARKS = LandmarkTable.DEFAULT_LANDMARKS
+# Cache kết quả /api/find-path (0 = tắt); TTL tính bằng giây
+ROUTE_CACHE_SIZE = 1024
+ROUTE_CACHE_TTL = 600.0
+# Giới hạn kích thước /api/distance-matrix (số ô nguồn × đích) và số tiến trình song song
+DISTANCE_MATRIX_MAX_CELLS = 250000
+DISTANCE_MATRIX_MAX_WORKERS = os.cpu_count() or 1
+# /api/find-paths: số thread tìm đường cho mọi batch cộng lại (để dành CPU cho /api/find-path),
+# số tác vụ mỗi batch được đẩy vào pool cùng lúc, số cặp tối đa mỗi batch, số job giữ lại
+BULK_ROUTING_WORKERS = 2
+BULK_ROUTING_MAX_PENDING = 16
+BULK_ROUTING_MAX_PAIRS = 10000
+BULK_ROUTING_MAX_JOBS = 100
+BULK_ROUTING_JOB_TTL = 3600.0
+# Số tile edge đã serialize giữ trong cache (xóa hết khi constraints đổi)
+EDGE_TILE_CACHE_SIZE = 2048
+# Số node tối đa mỗi /api/find-nearest (tham số k)
+MAX_NEAREST_K = 100
+# Số route thay thế tối đa mỗi /api/find-path (tham số alternatives)
+MAX_ALTERNATIVES = 3
+# Mặc định của snap_to_main_component: True thì điểm đầu/cuối chỉ snap vào node thuộc SCC lớn nhất
+SNAP_TO_MAIN_COMPONENT = False
+
+# graph không bao giờ bị sửa tại chỗ khi đang phục vụ: writer sửa trên graph.clone() rồi
+# gán lại biến global (thao tác nguyên tử), request đang chạy vẫn dùng bản đã lấy qua current_graph()
 graph = RoadGraph()
 constraints_manager = None
-edges_data_list = []
+# Writer: sửa constraints / load lại graph; reader: đọc constraints_manager
+constraints_lock = ReadWriteLock()
+route_cache = RouteCache(ROUTE_CACHE_SIZE, ROUTE_CACHE_TTL)
+# Chế độ nhiều worker process (gunicorn.conf.py): weights dùng chung + version phát cho mọi worker
+shared_state: Optional[SharedGraphState] = None
+shared_version = 0
+bulk_runner = BatchRunner(BULK_ROUTING_WORKERS, BULK_ROUTING_MAX_PENDING)
+bulk_jobs = JobRegistry(BULK_ROUTING_JOB_TTL, BULK_ROUTING_MAX_JOBS)
+# Histogram độ trễ cho /api/metrics (riêng từng process)
+metrics = MetricsRegistry()
+# Body đã serialize của /api/nodes, /api/edges, /api/constraints cho graph đang phục vụ
+payload_cache = PayloadCache()
+edge_tile_cache = TileCache(EDGE_TILE_CACHE_SIZE)
+# Process pool của /api/distance-matrix (workers > 1), tạo ở request đầu tiên cần đến
+matrix_pool = MatrixPool(GRAPH_SNAPSHOT, DISTANCE_MATRIX_MAX_WORKERS, DEFAULT_SHARED_DIR or CACHE_DIR)
+atexit.register(matrix_pool.close)
+# Overlay theo cell của graph đang phục vụ (partition cố định, clique theo constraints hiện tại)
+cell_overlay: Optional[CellOverlay] = None
+# Chỉ một thread tính lại nhãn SCC (graph.components) tại một thời điểm
+components_state_lock = threading.Lock()
+components_building = False
 
-def load_graph_data():
-    global graph, constraints_manager, edges_data_list
+# Cấu trúc tiền xử lý gắn với weights hiện tại; sau khi constraints đổi chúng được dựng lại
+# ở thread nền, trong lúc đó request dùng thuật toán dự phòng. Lưu theo signature trong CACHE_DIR;
+# nhiều worker process thì mmap file đó (worker đầu tiên dựng, các worker khác dùng chung)
+ch_index = DerivedStructure(
+    'contraction hierarchy',
+    lambda csr: ContractionHierarchy.load_or_build(csr, CACHE_DIR, use_mmap=shared_state is not None))
+landmark_index = DerivedStructure(
+    'landmark table',
+    lambda csr: LandmarkTable.load_or_build(csr, NUM_LANDMARKS, CACHE_DIR, use_mmap=shared_state is not None))
+
+def current_graph() -> RoadGraph:
+    """Graph đang phục vụ; mỗi request lấy một lần và dùng suốt request"""
+    return graph
+
+def routing_csr(routing_graph) -> CSRGraph:
+    return routing_graph if isinstance(routing_graph, CSRGraph) else routing_graph.csr
+
+def contraction_hierarchy(routing_graph, start: int, end: int, stats: Optional[SearchStats] = None):
+    csr = routing_csr(routing_graph)
+    hierarchy = ch_index.get(csr)
+    if hierarchy is None:
+        return bidirectional_dijkstra(csr, start, end, stats=stats)
+    return hierarchy.query(start, end, stats=stats)
+
+def cell_overlay_route(routing_graph, start: int, end: int, stats: Optional[SearchStats] = None):
+    # Overlay gắn với đúng csr được customize; graph đã bị thay (hoặc chưa có overlay) thì dùng dự phòng
+    csr = routing_csr(routing_graph)
+    overlay = cell_overlay
+    if overlay is None or overlay.csr is not csr:
+        return bidirectional_dijkstra(csr, start, end, stats=stats)
+    return overlay.query(start, end, stats=stats)
+
+def alt(routing_graph, start: int, end: int, stats: Optional[SearchStats] = None):
+    # landmarks=None → a_star dùng heuristic haversine trong lúc bảng đang được tính lại
+    csr = routing_csr(routing_graph)
+    return a_star(csr, start, end, landmarks=landmark_index.get(csr), stats=stats)
+
+def publish_constraint_changes(new_graph: RoadGraph, edge_ids, shared_weights=None):
+    """Patch bản sao new_graph cho các edge vừa đổi constraint rồi thay graph đang phục vụ.
+    Gọi trong constraints_lock.write_locked(). shared_weights: weights (cùng giá trị) trên
+    vùng nhớ dùng chung để dùng thay cho bản copy riêng của process."""
+    global graph, cell_overlay
+
+    old_graph = graph
+    edge_ids = list(edge_ids)
+    previous_costs = {}
+    for edge_id in edge_ids:
+        edge = old_graph.edges.get(edge_id)
+        from_index = old_graph.csr.index.get(edge['from_node']) if edge else None
+        if from_index is not None:
+            previous_costs[edge_id] = old_graph.csr.edge_weights(from_index, edge_id)
+
+    new_graph.apply_constraint_changes(edge_ids)
+    if shared_weights is not None:
+        new_graph.csr = new_graph.csr.with_weights(*shared_weights)
+    if cell_overlay is not None:
+        # Chỉ tính lại clique của các cell chứa edge vừa đổi; overlay cũ vẫn phục vụ graph cũ
+        cell_overlay = cell_overlay.customize(new_graph.csr, edge_ids)
+    # Invalidate trước khi swap: kết quả của graph cũ put vào sau đó sẽ bị bỏ qua vì version cũ hơn
+    route_cache.invalidate(new_graph, previous_costs)
+    graph = new_graph
+    if new_graph.components is None:
+        refresh_components()
+
+def refresh_components():
+    """Tính lại nhãn SCC của graph đang phục vụ ở thread nền (Tarjan trên cả graph, không chạy
+    trong write lock); trong lúc đó can_reach trả về True và snap không lọc theo SCC chính"""
+    global components_building
+    with components_state_lock:
+        if components_building:
+            return
+        components_building = True
+    threading.Thread(target=_build_components, daemon=True).start()
+
+def _build_components():
+    global components_building
+    while True:
+        with components_state_lock:
+            current = graph
+            if current.components is not None:
+                components_building = False
+                return
+        try:
+            components = current.build_components()
+        except Exception as e:
+            print(f"Error building connected components: {e}")
+            with components_state_lock:
+                components_building = False
+            return
+        with constraints_lock.write_locked():
+            # Graph đã được thay nhưng các chiều đi được không đổi (vd. chỉ đổi penalty) thì nhãn vẫn đúng
+            served = graph
+            if (served.components is None and served.components_version == current.components_version
+                    and served.csr.offsets is current.csr.offsets):
+                served.components = components
+
+@contextmanager
+def constraint_edit():
+    """Khóa cho một lần sửa constraints. Ở chế độ nhiều process còn khóa giữa các worker,
+    đồng bộ về version mới nhất trước khi sửa và phát weights mới cho các worker khác sau đó."""
+    global shared_version
+
+    with constraints_lock.write_locked():
+        if shared_state is None:
+            yield
+            return
+
+        with shared_state.write_lock:
+            _sync_shared_graph()
+            before = graph
+            yield
+            if graph is not before:
+                shared_version = shared_state.publish(graph.csr, *_constraint_delta(before, graph))
+
+def configure_shared_state(state: SharedGraphState):
+    global shared_state
+    shared_state = state
+
+def _constraint_delta(old_graph: RoadGraph, new_graph: RoadGraph) -> Tuple[Dict[int, Optional[Dict]], List[int]]:
+    """(edge_id → constraint mới hoặc None nếu đã xóa, các slot CSR của những edge đó) để phát
+    cho worker khác dưới dạng delta"""
+    changes: Dict[int, Optional[Dict]] = {}
+    slots: List[int] = []
+    csr = new_graph.csr
+    for edge_id in set(old_graph.constraints) | set(new_graph.constraints):
+        if old_graph.constraints.get(edge_id) == new_graph.constraints.get(edge_id):
+            continue
+        changes[edge_id] = constraints_manager.get_constraint_by_edge(edge_id)
+        edge = new_graph.edges.get(edge_id)
+        from_index = csr.index.get(edge['from_node']) if edge else None
+        edge_slots = csr.edge_slots(from_index, edge_id) if from_index is not None else None
+        if edge_slots is not None:
+            slots.extend(edge_slots)
+    return changes, slots
+
+def _sync_shared_graph():
+    """Chuyển sang version mới nhất do worker khác phát: áp các constraint trong delta và dùng
+    weights dùng chung; chỉ đọc lại toàn bộ file constraints khi không còn đủ delta"""
+    global constraints_manager, shared_version
 
+    version = shared_state.current_version()
+    if version == shared_version:
+        return
+
+    changes = shared_state.load_changes(shared_version, version)
+    new_graph = graph.clone()
+    if changes is None:
+        new_manager = ConstraintsManager(CONSTRAINTS_CSV, use_journal=CONSTRAINTS_JOURNAL)
+        new_graph.clear_constraints()
+        for constraint in new_manager.get_all_constraints():
+            new_graph.add_constraint(
+                constraint['edge_id'],
+                constraint['constraint_type'],
+                constraint['value'],
+                constraint['description']
+            )
+        changed = [edge_id for edge_id in set(graph.constraints) | set(new_graph.constraints)
+                   if graph.constraints.get(edge_id) != new_graph.constraints.get(edge_id)]
+        constraints_manager = new_manager
+    else:
+        for edge_id, constraint in changes.items():
+            new_graph.remove_constraint(edge_id)
+            if constraint is not None:
+                new_graph.add_constraint(
+                    edge_id,
+                    constraint['constraint_type'],
+                    constraint['value'],
+                    constraint['description']
+                )
+        changed = list(changes)
+        constraints_manager.apply_synced_changes(changes)
+
+    publish_constraint_changes(new_graph, changed, shared_state.load_weights(version))
+    shared_version = version
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None and request.endpoint is not None:
+        metrics.observe('routing_request_duration_seconds', time.perf_counter() - started,
+                        'Request handling time per endpoint (streamed bodies excluded)',
+                        endpoint=request.endpoint)
+    return response
+
+@app.before_request
+def sync_shared_graph():
+    if shared_state is not None and shared_state.current_version() != shared_version:
+        with constraints_lock.write_locked():
+            _sync_shared_graph()
+
+ALGORITHMS = {
+    'dijkstra': dijkstra,
+    'a_star': a_star,
+    'bidirectional_dijkstra': bidirectional_dijkstra,
+    'bidirectional_a_star': bidirectional_a_star,
+    'ch': contraction_hierarchy,
+    'alt': alt,
+    'crp': cell_overlay_route
+}
+
+def load_graph_csv():
+    """Trả về (graph, edges_data_list) đọc từ CSV, None nếu lỗi"""
     graph = RoadGraph()
     edges_data_list = []
 
     # Load Nodes
     if not os.path.exists(NODES_CSV):
         print(f"Error: nodes.csv not found at {NODES_CSV}")
-        return False
+        return None
 
     try:
         with open(NODES_CSV, 'r', encoding='utf-8-sig') as f:
@@ -40,15 +327,16 @@ def load_graph_data():
                     float(row['latitude']),
                     float(row['longitude'])
                 )
+        graph.build_spatial_index()
         print(f"Loaded {len(graph.nodes)} nodes")
     except Exception as e:
         print(f"Error loading nodes: {e}")
-        return False
+        return None
 
     # Load Edges
     if not os.path.exists(EDGES_CSV):
         print(f"Error: edges.csv not found at {EDGES_CSV}")
-        return False
+        return None
 
     try:
         with open(EDGES_CSV, 'r', encoding='utf-8-sig') as f:
@@ -70,30 +358,148 @@ def load_graph_data():
                     edge_info['distance'],
                     edge_info['is_oneway']
                 )
+        graph.build_edge_index()
         print(f"Loaded {len(graph.edges)} edges")
     except Exception as e:
         print(f"Error loading edges: {e}")
-        return False
-    
-    # Load constraints
-    constraints_manager = ConstraintsManager(CONSTRAINTS_CSV)
-    constraints = constraints_manager.get_all_constraints()
+        return None
+    return graph, edges_data_list
+
+def _load_base_graph():
+    """(graph chưa áp constraints, from_snapshot), None nếu lỗi"""
+    if is_snapshot_fresh(GRAPH_SNAPSHOT, NODES_CSV, EDGES_CSV):
+        try:
+            # Spatial index, edge index và nhãn thành phần liên thông đã nằm sẵn trong snapshot
+            new_graph = load_snapshot(GRAPH_SNAPSHOT)
+            print(f"Loaded {len(new_graph.nodes)} nodes and {len(new_graph.edges)} edges from snapshot")
+            return new_graph, True
+        except Exception as e:
+            print(f"Error loading graph snapshot: {e}")
+
+    loaded = load_graph_csv()
+    if loaded is None:
+        return None
+    try:
+        # Lần load sau đọc snapshot; process pool của distance matrix cũng mmap topology từ đây
+        _write_graph_snapshot(*loaded)
+    except Exception as e:
+        print(f"Error writing graph snapshot: {e}")
+    return loaded[0], False
+
+def _write_graph_snapshot(csv_graph: RoadGraph, csv_edges):
+    build_snapshot(
+        [{'node_id': node_id, 'latitude': lat, 'longitude': lon}
+         for node_id, (lat, lon) in csv_graph.nodes.items()],
+        csv_edges, GRAPH_SNAPSHOT)
+
+def _apply_stored_constraints(new_graph: RoadGraph, from_snapshot: bool) -> ConstraintsManager:
+    new_manager = ConstraintsManager(CONSTRAINTS_CSV, use_journal=CONSTRAINTS_JOURNAL)
+    constraints = new_manager.get_all_constraints()
 
     # Thêm constraints vào graph
     for constraint in constraints:
-        graph.add_constraint(
+        new_graph.add_constraint(
             constraint['edge_id'],
             constraint['constraint_type'],
             constraint['value'],
             constraint['description']
         )
-    
-    # Rebuild adjacency
-    graph.rebuild_adjacency()
+
+    # Snapshot đã có sẵn CSR chưa áp constraints: chỉ cập nhật các edge có constraint
+    if from_snapshot:
+        new_graph.apply_constraint_changes(constraint['edge_id'] for constraint in constraints)
+    else:
+        new_graph.rebuild_adjacency()
 
     print(f"Loaded {len(constraints)} constraints")
+    return new_manager
+
+def load_graph_data():
+    """Dựng graph mới trong khi graph cũ vẫn phục vụ, rồi thay graph/constraints_manager cùng lúc"""
+    global graph, constraints_manager, shared_version, cell_overlay
+
+    loaded = _load_base_graph()
+    if loaded is None:
+        return False
+    new_graph, from_snapshot = loaded
+
+    # Giữ write lock từ lúc đọc constraints tới lúc swap để không sửa đổi nào bị mất;
+    # request tìm đường vẫn chạy trên graph cũ trong suốt quá trình này
+    with constraints_lock.write_locked():
+        with shared_state.write_lock if shared_state is not None else nullcontext():
+            new_manager = _apply_stored_constraints(new_graph, from_snapshot)
+            if shared_state is not None:
+                # Weights tính từ cùng file constraints nên trùng với version đang phát
+                new_shared_version = shared_state.current_version()
+                new_graph.csr = new_graph.csr.with_weights(*shared_state.load_weights(new_shared_version))
+
+        # Version tăng liên tục qua các lần load để route cache nhận ra graph mới
+        new_graph.constraint_version += graph.constraint_version
+        graph, constraints_manager = new_graph, new_manager
+        # Overlay cũ thuộc graph cũ; 'crp' dùng dự phòng tới khi overlay mới dựng xong
+        cell_overlay = None
+        if shared_state is not None:
+            shared_version = new_shared_version
+
+    # Dựng cấu trúc tiền xử lý ở thread nền sau khi đã nhả khóa: sửa constraints không phải chờ,
+    # 'ch'/'alt'/'crp' dùng thuật toán dự phòng trong lúc dựng
+    if NUM_LANDMARKS > 0:
+        landmark_index.get(new_graph.csr)
+    if PREPARE_CH_ON_LOAD:
+        ch_index.get(new_graph.csr)
+    if PREPARE_CRP_ON_LOAD:
+        threading.Thread(target=_build_cell_overlay, args=(new_graph,), daemon=True).start()
+    if new_graph.components is None:
+        refresh_components()
     return True
 
+def _build_cell_overlay(loaded_graph: RoadGraph):
+    """Dựng overlay cho graph vừa load rồi gắn vào graph đang phục vụ. Constraints đổi trong lúc
+    dựng thì chỉ customize lại các edge có weights khác; graph đã bị load lại thì bỏ kết quả."""
+    global cell_overlay
+
+    try:
+        overlay = CellOverlay.load_or_build(loaded_graph.csr, CACHE_DIR, use_mmap=shared_state is not None)
+        while True:
+            current = graph
+            if current.csr.offsets is not loaded_graph.csr.offsets:
+                return
+            if overlay.csr is not current.csr:
+                overlay = overlay.customize(current.csr, _changed_edges(overlay.csr, current.csr))
+            with constraints_lock.write_locked():
+                if graph is current:
+                    cell_overlay = overlay
+                    break
+        partition = overlay.partition
+        print(f"Cell overlay ready ({partition.num_cells()} cells, {partition.num_levels} levels)")
+    except Exception as e:
+        print(f"Error building cell overlay: {e}")
+
+def _changed_edges(old_csr: CSRGraph, new_csr: CSRGraph) -> set:
+    """Edge có weights khác nhau giữa 2 csr cùng topology"""
+    old_weights, new_weights, edge_ids = old_csr.weights, new_csr.weights, new_csr.edge_ids
+    return {edge_ids[slot] for slot in range(new_csr.num_slots) if old_weights[slot] != new_weights[slot]}
+
+def prepare_shared_graph(directory: Optional[str] = None) -> Optional[SharedGraphState]:
+    """Chạy một lần trong process cha trước khi fork worker: đảm bảo graph snapshot còn mới
+    (worker mmap chung file này) và phát weights ban đầu"""
+    if not is_snapshot_fresh(GRAPH_SNAPSHOT, NODES_CSV, EDGES_CSV):
+        loaded = load_graph_csv()
+        if loaded is None:
+            return None
+        _write_graph_snapshot(*loaded)
+
+    loaded = _load_base_graph()
+    if loaded is None:
+        return None
+    base_graph, from_snapshot = loaded
+
+    state = SharedGraphState(directory or DEFAULT_SHARED_DIR or CACHE_DIR)
+    with state.write_lock:
+        _apply_stored_constraints(base_graph, from_snapshot)
+        state.publish(base_graph.csr)
+    return state
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -102,70 +508,224 @@ def index():
 def admin():
     return render_template('admin.html')
 
+# format: 'json' (list object như cũ), 'columnar' (JSON, mỗi cột một mảng),
+# 'binary' (định dạng của core/arrayfile.py: header JSON rồi các mảng số căn lề 8 byte)
+PAYLOAD_FORMATS = ('json', 'columnar', 'binary')
+
+def payload_response(payload: Payload) -> Response:
+    """Trả payload đã dựng sẵn: nén theo Accept-Encoding, ETag mạnh, 304 khi If-None-Match khớp"""
+    encoding = payload.encoding_for(lambda name: request.accept_encodings[name])
+    etag = payload.etag_for(encoding)
+    headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(payload.encoded(encoding), mimetype=payload.mimetype, headers=headers)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    return response
+
+def json_payload(data) -> Payload:
+    return Payload(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                   'application/json')
+
+def columns_payload(columns: Dict[str, array], payload_format: str) -> Payload:
+    if payload_format == 'binary':
+        return Payload(dump_arrays({}, columns), 'application/octet-stream')
+    if payload_format == 'columnar':
+        return json_payload({name: values.tolist() for name, values in columns.items()})
+    # 'json': mỗi phần tử một object, giữ nguyên dạng response cũ
+    names = list(columns)
+    return json_payload([dict(zip(names, row)) for row in zip(*columns.values())])
+
+def requested_format() -> Optional[str]:
+    payload_format = request.args.get('format', 'json')
+    return payload_format if payload_format in PAYLOAD_FORMATS else None
+
 @app.route('/api/nodes')
 def get_nodes():
-    nodes_list = [
-        {
-            'node_id': node_id,
-            'latitude': lat,
-            'longitude': lon
-        }
-        for node_id, (lat, lon) in graph.nodes.items()
-    ]
-    return jsonify(nodes_list)
+    graph = current_graph()
+    payload_format = requested_format()
+    if payload_format is None:
+        return jsonify({'error': f"format must be one of {', '.join(PAYLOAD_FORMATS)}"}), 400
+
+    def build():
+        return columns_payload({
+            'node_id': array('q', graph.nodes.keys()),
+            'latitude': array('d', (lat for lat, _ in graph.nodes.values())),
+            'longitude': array('d', (lon for _, lon in graph.nodes.values()))
+        }, payload_format)
+
+    # nodes/edges không đổi khi sửa constraints (graph.clone() dùng chung), chỉ đổi khi load lại graph
+    return payload_response(payload_cache.get(('nodes', payload_format), graph.nodes, build))
 
 @app.route('/api/edges')
 def get_edges():
-    edges_list = [
-        {
-            'edge_id': edge_id,
-            'from_node': edge['from_node'],
-            'to_node': edge['to_node'],
-            'distance': edge['distance'],
-            'is_oneway': edge['is_oneway']
-        }
-        for edge_id, edge in graph.edges.items()
-    ]
-    return jsonify(edges_list)
+    graph = current_graph()
+    payload_format = requested_format()
+    if payload_format is None:
+        return jsonify({'error': f"format must be one of {', '.join(PAYLOAD_FORMATS)}"}), 400
+
+    def build():
+        edges = graph.edges.values()
+        return columns_payload({
+            'edge_id': array('q', graph.edges.keys()),
+            'from_node': array('q', (edge['from_node'] for edge in edges)),
+            'to_node': array('q', (edge['to_node'] for edge in edges)),
+            'distance': array('d', (edge['distance'] for edge in edges)),
+            'is_oneway': array('b', (edge['is_oneway'] for edge in edges))
+        }, payload_format)
+
+    return payload_response(payload_cache.get(('edges', payload_format), graph.edges, build))
 
 @app.route('/api/constraints')
 def get_constraints():
-    constraints = constraints_manager.get_all_constraints()
-    return jsonify(constraints)
+    # Mỗi lần sửa constraints đều thay graph (trong cùng write lock) nên graph là khóa của payload
+    with constraints_lock.read_locked():
+        payload = payload_cache.get('constraints', graph,
+                                    lambda: json_payload(constraints_manager.get_all_constraints()))
+    return payload_response(payload)
+
+@app.route('/api/edge-tiles/<int:z>/<int:x>/<int:y>')
+def get_edge_tile(z, x, y):
+    """Edge giao tile z/x/y (Web Mercator); dưới DETAIL_ZOOM các chuỗi edge được gộp và đơn giản hóa"""
+    if z > MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'error': 'Invalid tile'}), 400
+
+    graph = current_graph()
+    version = graph.constraint_version
+    payload = edge_tile_cache.get((z, x, y), version)
+    if payload is None:
+        features = edge_features(graph, graph.find_edges_in_bbox(*tile_bbox(z, x, y)), z)
+        # Không đưa version vào body: tile không đổi nội dung vẫn giữ ETag sau khi sửa constraints nơi khác
+        payload = json_payload({'z': z, 'x': x, 'y': y, 'features': features})
+        edge_tile_cache.put((z, x, y), version, payload)
+    return payload_response(payload)
+
+@app.route('/api/edges-in-bbox')
+def get_edges_in_bbox():
+    """Như /api/edge-tiles nhưng cho viewport bất kỳ (không cache):
+    ?min_lat=&min_lon=&max_lat=&max_lon=&zoom="""
+    graph = current_graph()
+    try:
+        bbox = [float(request.args[name]) for name in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        zoom = int(request.args.get('zoom', DETAIL_ZOOM))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'min_lat, min_lon, max_lat, max_lon are required numbers'}), 400
+    # Cùng khoảng zoom với /api/edge-tiles (zoom âm làm tolerance tràn số, zoom quá lớn chỉ tốn công)
+    zoom = max(0, min(zoom, MAX_ZOOM))
+
+    features = edge_features(graph, graph.find_edges_in_bbox(*bbox), zoom)
+    return payload_response(json_payload({'zoom': zoom, 'features': features}))
 
 @app.route('/api/find-nearest', methods=['POST'])
 def find_nearest():
+    graph = current_graph()
     data = request.json
     lat = float(data['latitude'])
     lon = float(data['longitude'])
+    max_distance = data.get('max_distance')
+    if max_distance is not None:
+        max_distance = float(max_distance)
+    k = int(data.get('k', 1))
+    if k > MAX_NEAREST_K:
+        return jsonify({'error': f'k must be at most {MAX_NEAREST_K}'}), 400
+    main_component = bool(data.get('main_component', False))
 
-    nearest_node, distance = graph.find_nearest_node(lat, lon)
+    candidates = graph.find_k_nearest_nodes(lat, lon, max(k, 1), max_distance, main_component)
 
-    return jsonify({
+    if not candidates:
+        return jsonify({'error': 'No node found within max_distance'}), 404
+
+    nearest_node, distance = candidates[0]
+    result = {
         'node_id': nearest_node,
         'distance': distance
-    })
+    }
+    if k > 1:
+        result['candidates'] = [
+            {'node_id': node_id, 'distance': node_distance}
+            for node_id, node_distance in candidates
+        ]
 
-@app.route('/api/find-path', methods=['POST'])
-def find_path():
-    data = request.json
-    start_lat = float(data['start_lat'])
-    start_lon = float(data['start_lon'])
-    end_lat = float(data['end_lat'])
-    end_lon = float(data['end_lon'])
-    algorithm = data.get('algorithm', 'dijkstra')
+    return jsonify(result)
+
+def compute_route(graph: RoadGraph, start_lat: float, start_lon: float,
+                  end_lat: float, end_lon: float, algorithm: str,
+                  stats: Optional[SearchStats] = None, timings: Optional[Dict[str, float]] = None,
+                  alternatives: int = 0, alternative_stats: Optional[SearchStats] = None,
+                  snap_to_main: bool = False) -> Tuple[Optional[Dict], bool]:
+    """Snap 2 điểm về node gần nhất rồi tìm đường; trả về (dict kết quả như /api/find-path hoặc
+    None nếu không có đường, True nếu route chính lấy từ route cache).
+
+    stats: nhận bộ đếm của lần search (không đổi nếu kết quả lấy từ cache);
+    timings: nhận thời gian (giây) của từng bước 'snap', 'search', 'serialize';
+    alternatives > 0: thêm tối đa chừng đó route thay thế vào result['alternatives']
+    (không cache), bộ đếm của chúng ghi vào alternative_stats;
+    snap_to_main: chỉ snap vào node thuộc SCC lớn nhất của graph.
+    """
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
+    start_node, start_distance = graph.find_nearest_node(start_lat, start_lon, main_component=snap_to_main)
+    end_node, end_distance = graph.find_nearest_node(end_lat, end_lon, main_component=snap_to_main)
+    snapped = time.perf_counter()
+    timings['snap'] = snapped - started
 
-    start_node, start_distance = graph.find_nearest_node(start_lat, start_lon)
-    end_node, end_distance = graph.find_nearest_node(end_lat, end_lon)
+    routing_graph = graph.csr if ROUTING_BACKEND == 'csr' and graph.csr is not None else graph
 
-    if algorithm == 'a_star':
-        path, total_distance = a_star(graph, start_node, end_node)
+    if algorithm not in ALGORITHMS:
+        algorithm = 'dijkstra'
+    cache_key = (start_node, end_node, algorithm)
+    version = graph.constraint_version
+    cached_route = route_cache.get(cache_key, version)
+    cached = cached_route is not None
+    if cached:
+        path, total_distance = cached_route
+    elif not graph.can_reach(start_node, end_node):
+        # Khác thành phần liên thông: không cần search cạn cả thành phần của start mới biết
+        path, total_distance = None, None
+        metrics.increment('routing_unreachable_rejections_total', 1,
+                          'Queries rejected by the component index without searching')
     else:
-        path, total_distance = dijkstra(graph, start_node, end_node)
+        search_stats = stats if stats is not None else SearchStats()
+        path, total_distance = ALGORITHMS[algorithm](routing_graph, start_node, end_node, stats=search_stats)
+        route_cache.put(cache_key, version, path, total_distance)
+        metrics.observe('routing_search_duration_seconds', search_stats.elapsed,
+                        'Search time per algorithm (route cache misses only)', algorithm=algorithm)
+        metrics.increment('routing_search_settled_nodes_total', search_stats.settled,
+                          'Nodes settled by searches', algorithm=algorithm)
+
+    routes = []
+    if path is not None and alternatives > 0:
+        search_stats = alternative_stats if alternative_stats is not None else SearchStats()
+        # Luôn chạy trên CSR (penalty theo edge_id), phạt luôn từ route chính thay vì tìm lại;
+        # route trùng route chính bị bỏ
+        routes = [(other_path, distance) for other_path, distance in
+                  alternative_routes(graph.csr, start_node, end_node, alternatives + 1,
+                                     shortest=(path, total_distance), stats=search_stats)
+                  if other_path != path][:alternatives]
+        metrics.observe('routing_search_duration_seconds', search_stats.elapsed,
+                        'Search time per algorithm (route cache misses only)', algorithm='alternatives')
+        metrics.increment('routing_search_settled_nodes_total', search_stats.settled,
+                          'Nodes settled by searches', algorithm='alternatives')
+    searched = time.perf_counter()
+    timings['search'] = searched - snapped
 
     if path is None:
-        return jsonify({'error': 'No path found'}), 404
+        timings['serialize'] = 0.0
+        return None, cached
+
+    result = route_json(graph, path, total_distance, start_distance, end_distance)
+    if alternatives > 0:
+        result['alternatives'] = [route_json(graph, other_path, distance, start_distance, end_distance)
+                                  for other_path, distance in routes]
+    timings['serialize'] = time.perf_counter() - searched
+    return result, cached
 
+def route_json(graph: RoadGraph, path, total_distance: float, start_distance: float, end_distance: float):
     path_coordinates = []
     for node_id in path:
         lat, lon = graph.nodes[node_id]
@@ -175,7 +735,7 @@ def find_path():
 
     path_string = ' → '.join([str(node_id) for node_id in path])
 
-    return jsonify({
+    return {
         'path': path,
         'path_coordinates': path_coordinates,
         'path_string': path_string,
@@ -184,81 +744,235 @@ def find_path():
         'end_offset': end_distance,
         'total_distance': total_distance_with_endpoints,
         'num_nodes': len(path)
+    }
+
+def record_route_timings(endpoint: str, timings: Dict[str, float]):
+    for stage, seconds in timings.items():
+        metrics.observe('routing_stage_duration_seconds', seconds,
+                        'Time spent in each stage of a routing request', endpoint=endpoint, stage=stage)
+
+@app.route('/api/find-path', methods=['POST'])
+def find_path():
+    graph = current_graph()
+    data = request.json
+    start_lat = float(data['start_lat'])
+    start_lon = float(data['start_lon'])
+    end_lat = float(data['end_lat'])
+    end_lon = float(data['end_lon'])
+    algorithm = data.get('algorithm', 'dijkstra')
+    include_stats = bool(data.get('include_stats', False))
+    alternatives = max(0, min(int(data.get('alternatives', 0)), MAX_ALTERNATIVES))
+    snap_to_main = bool(data.get('snap_to_main_component', SNAP_TO_MAIN_COMPONENT))
+
+    stats = SearchStats()
+    alternative_stats = SearchStats()
+    timings: Dict[str, float] = {}
+    result, cached = compute_route(graph, start_lat, start_lon, end_lat, end_lon, algorithm, stats, timings,
+                                   alternatives, alternative_stats, snap_to_main)
+
+    if result is None:
+        record_route_timings('find_path', timings)
+        return jsonify({'error': 'No path found'}), 404
+
+    if include_stats:
+        # Khi kết quả lấy từ route cache (cached = True) không có search nên các bộ đếm bằng 0
+        result['stats'] = dict(stats.to_dict(),
+                               algorithm=algorithm if algorithm in ALGORITHMS else 'dijkstra',
+                               cached=cached,
+                               timings_ms={stage: round(seconds * 1000, 3) for stage, seconds in timings.items()})
+        if alternatives > 0:
+            result['stats']['alternatives'] = alternative_stats.to_dict()
+
+    started = time.perf_counter()
+    response = jsonify(result)
+    timings['serialize'] += time.perf_counter() - started
+    record_route_timings('find_path', timings)
+    return response
+
+@app.route('/api/find-paths', methods=['POST'])
+def find_paths():
+    """Tìm đường cho nhiều cặp điểm. mode='stream': trả NDJSON, mỗi dòng một kết quả ngay khi
+    xong (kèm 'index' của cặp); mode='job': trả job_id để hỏi lại qua GET /api/find-paths/<job_id>"""
+    graph = current_graph()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('pairs'), list):
+        return jsonify({'error': "Body must be a JSON object with a 'pairs' list"}), 400
+    algorithm = data.get('algorithm', 'dijkstra')
+    mode = data.get('mode', 'stream')
+    snap_to_main = bool(data.get('snap_to_main_component', SNAP_TO_MAIN_COMPONENT))
+    try:
+        pairs = [
+            (float(pair['start_lat']), float(pair['start_lon']), float(pair['end_lat']), float(pair['end_lon']))
+            for pair in data['pairs']
+        ]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each pair needs numeric start_lat, start_lon, end_lat, end_lon'}), 400
+
+    if len(pairs) > BULK_ROUTING_MAX_PAIRS:
+        return jsonify({'error': f'Too many pairs (max {BULK_ROUTING_MAX_PAIRS})'}), 400
+    if mode not in ('stream', 'job'):
+        return jsonify({'error': "mode must be 'stream' or 'job'"}), 400
+
+    # Cả batch dùng cùng một graph, kể cả khi constraints đổi giữa chừng
+    def route(pair):
+        timings: Dict[str, float] = {}
+        result, _ = compute_route(graph, *pair, algorithm, timings=timings, snap_to_main=snap_to_main)
+        record_route_timings('find_paths', timings)
+        return result
+
+    def results():
+        runs = bulk_runner.run(pairs, route)
+        try:
+            for index, result in runs:
+                if isinstance(result, Exception):
+                    yield index, {'index': index, 'error': str(result)}
+                elif result is None:
+                    yield index, {'index': index, 'error': 'No path found'}
+                else:
+                    yield index, dict(result, index=index)
+        finally:
+            runs.close()
+
+    if mode == 'stream':
+        def stream():
+            rows = results()
+            try:
+                for _, result in rows:
+                    yield json.dumps(result, ensure_ascii=False) + '\n'
+            finally:
+                # Client ngắt kết nối giữa chừng: Response.close() tới đây, hủy các cặp chưa chạy
+                rows.close()
+
+        return Response(stream(), mimetype='application/x-ndjson')
+
+    job = bulk_jobs.create(len(pairs))
+    if job is None:
+        return jsonify({'error': 'Too many batch jobs, try again later'}), 429
+
+    def run_job():
+        try:
+            for index, result in results():
+                job.set_result(index, result)
+            job.finish()
+        except Exception as e:
+            print(f"Error running batch job {job.id}: {e}")
+            job.finish('failed')
+
+    bulk_runner.start(run_job)
+    return jsonify(job.to_dict(include_results=False)), 202
+
+@app.route('/api/find-paths/<job_id>')
+def find_paths_job(job_id):
+    job = bulk_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/distance-matrix', methods=['POST'])
+def get_distance_matrix():
+    graph = current_graph()
+    data = request.json
+    sources = [(float(p['latitude']), float(p['longitude'])) for p in data['sources']]
+    destinations = [(float(p['latitude']), float(p['longitude'])) for p in data['destinations']]
+    workers = max(1, min(int(data.get('workers', 1)), DISTANCE_MATRIX_MAX_WORKERS))
+
+    if len(sources) * len(destinations) > DISTANCE_MATRIX_MAX_CELLS:
+        return jsonify({
+            'error': f'Matrix too large (max {DISTANCE_MATRIX_MAX_CELLS} cells)'
+        }), 400
+
+    distances, source_snaps, destination_snaps = distance_matrix(graph, sources, destinations, workers,
+                                                                   pool=matrix_pool)
+
+    total_distances = [
+        [None if distance is None else distance + start_offset + end_offset
+         for distance, (_, end_offset) in zip(row, destination_snaps)]
+        for row, (_, start_offset) in zip(distances, source_snaps)
+    ]
+
+    def snaps_json(snaps):
+        return [{'node_id': node_id, 'offset': offset if node_id is not None else None}
+                for node_id, offset in snaps]
+
+    return jsonify({
+        'distances': distances,
+        'total_distances': total_distances,
+        'sources': snaps_json(source_snaps),
+        'destinations': snaps_json(destination_snaps)
     })
 
+@app.route('/api/isochrone', methods=['POST'])
+def isochrone():
+    graph = current_graph()
+    data = request.json
+    lat = float(data['latitude'])
+    lon = float(data['longitude'])
+    max_distance = float(data['max_distance'])
+    include_hull = bool(data.get('include_hull', False))
+
+    start_node, start_distance = graph.find_nearest_node(lat, lon)
+    if start_node is None:
+        return jsonify({'error': 'No node found'}), 404
+
+    # Quãng đường từ điểm click tới node gần nhất cũng tính vào ngân sách (như total_distance)
+    distances, reached_edges = bounded_dijkstra(graph.csr, start_node, max_distance - start_distance)
+
+    result = {
+        'start_node': start_node,
+        'start_offset': start_distance,
+        'nodes': [
+            {'node_id': node_id, 'distance': distance + start_distance}
+            for node_id, distance in distances.items()
+        ],
+        'edges': [
+            {
+                'edge_id': edge_id,
+                'from_node': graph.edges[edge_id]['from_node'],
+                'to_node': graph.edges[edge_id]['to_node'],
+                'reached': fraction
+            }
+            for edge_id, fraction in reached_edges.items()
+        ]
+    }
+    if include_hull:
+        result['hull'] = [list(point) for point in convex_hull([graph.nodes[node_id] for node_id in distances])]
+
+    return jsonify(result)
+
 @app.route('/api/edges-in-polygon', methods=['POST'])
 def edges_in_polygon():
+    graph = current_graph()
     data = request.json
-    polygon = data['polygon']
-
-    def point_in_polygon(point, polygon):
-        x, y = point
-        n = len(polygon)
-        inside = False
-
-        p1x, p1y = polygon[0]
-        for i in range(1, n + 1):
-            p2x, p2y = polygon[i % n]
-            if y > min(p1y, p2y):
-                if y <= max(p1y, p2y):
-                    if x <= max(p1x, p2x):
-                        if p1y != p2y:
-                            xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                        if p1x == p2x or x <= xinters:
-                            inside = not inside
-            p1x, p1y = p2x, p2y
-
-        return inside
-
-    affected_edges = []
-
-    for edge_id, edge in graph.edges.items():
-        from_node = edge['from_node']
-        to_node = edge['to_node']
-
-        from_lat, from_lon = graph.nodes[from_node]
-        to_lat, to_lon = graph.nodes[to_node]
-
-        if point_in_polygon((from_lat, from_lon), polygon) or \
-           point_in_polygon((to_lat, to_lon), polygon):
-            affected_edges.append({
-                'edge_id': edge_id,
-                'from_node': from_node,
-                'to_node': to_node,
-                'distance': edge['distance']
-            })
+    polygon = [tuple(point) for point in data['polygon']]
+
+    affected_edges = [edge_summary(graph, edge_id) for edge_id in graph.find_edges_in_polygon(polygon)]
 
     return jsonify({'edges': affected_edges})
 
 @app.route('/api/edges-in-circle', methods=['POST'])
 def edges_in_circle():
+    graph = current_graph()
     data = request.json
     center_lat = float(data['center_lat'])
     center_lon = float(data['center_lon'])
     radius = float(data['radius'])
 
-    affected_edges = []
-
-    for edge_id, edge in graph.edges.items():
-        from_node = edge['from_node']
-        to_node = edge['to_node']
-
-        from_lat, from_lon = graph.nodes[from_node]
-        to_lat, to_lon = graph.nodes[to_node]
-
-        from_distance = graph.haversine_distance(center_lat, center_lon, from_lat, from_lon)
-        to_distance = graph.haversine_distance(center_lat, center_lon, to_lat, to_lon)
-
-        if from_distance <= radius or to_distance <= radius:
-            affected_edges.append({
-                'edge_id': edge_id,
-                'from_node': from_node,
-                'to_node': to_node,
-                'distance': edge['distance']
-            })
+    affected_edges = [
+        edge_summary(graph, edge_id)
+        for edge_id in graph.find_edges_in_circle(center_lat, center_lon, radius)
+    ]
 
     return jsonify({'edges': affected_edges})
 
+def edge_summary(graph: RoadGraph, edge_id: int):
+    edge = graph.edges[edge_id]
+    return {
+        'edge_id': edge_id,
+        'from_node': edge['from_node'],
+        'to_node': edge['to_node'],
+        'distance': edge['distance']
+    }
+
 @app.route('/api/add-constraints', methods=['POST'])
 def add_constraints():
     data = request.json
@@ -271,11 +985,10 @@ def add_constraints():
     if constraint_type == 'oneway' and value =='both':
         invalid_edges = []
 
-        # Tạo dict từ edges_data_list để lookup nhanh hơn
-        edges_dict = {e['edge_id']: e for e in edges_data_list}
+        edges = current_graph().edges
 
         for edge_id in edge_ids:
-            edge = edges_dict.get(edge_id)
+            edge = edges.get(edge_id)
             
             if edge:
                 # Kiểm tra edge có phải là một chiều gốc không
@@ -293,38 +1006,68 @@ def add_constraints():
                         f'Các edge sau là hai chiều hoặc không tồn tại: {invalid_edges}'
             }), 400
     
-    # Thêm constraints nếu validation passed
-    for edge_id in edge_ids:
-        constraints_manager.add_constraint(
-            edge_id,
-            constraint_type,
-            value,
-            description
-        ) 
+    with constraint_edit():
+        # Thêm constraints nếu validation passed (ghi file một lần cho cả lô)
+        success = constraints_manager.add_constraints_batch([
+            {
+                'edge_id': edge_id,
+                'constraint_type': constraint_type,
+                'value': value,
+                'description': description
+            }
+            for edge_id in edge_ids
+        ])
+        if not success:
+            return jsonify({'success': False, 'error': 'Failed to save constraints'}), 500
 
-    load_graph_data()
+        new_graph = graph.clone()
+        for edge_id in edge_ids:
+            new_graph.add_constraint(edge_id, constraint_type, value, description)
+
+        # Chỉ cập nhật adjacency của các edge bị ảnh hưởng thay vì load lại toàn bộ graph
+        publish_constraint_changes(new_graph, edge_ids)
     return jsonify({'success': True})
 
 @app.route('/api/remove-constraint/<int:edge_id>', methods=['DELETE'])
 def remove_constraint(edge_id):
-    success = constraints_manager.remove_constraint(edge_id)
+    with constraint_edit():
+        success = constraints_manager.remove_constraint(edge_id)
+
+        if success:
+            new_graph = graph.clone()
+            new_graph.remove_constraint(edge_id)
+            publish_constraint_changes(new_graph, [edge_id])
 
     if success:
-        load_graph_data()
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'error': 'Failed to remove constraint'}), 500
 
 @app.route('/api/clear-constraints', methods=['POST'])
 def clear_constraints():
-    success = constraints_manager.clear_all_constraints()
+    with constraint_edit():
+        success = constraints_manager.clear_all_constraints()
+
+        if success:
+            new_graph = graph.clone()
+            edge_ids = list(new_graph.constraints)
+            new_graph.clear_constraints()
+            publish_constraint_changes(new_graph, edge_ids)
 
     if success:
-        load_graph_data()
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'error': 'Failed to clear constraints'}), 500
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Histogram độ trễ theo định dạng text của Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/route-cache')
+def route_cache_stats():
+    return jsonify(route_cache.stats())
+
 @app.route('/api/reload-graph', methods=['POST'])
 def reload_graph():
     load_graph_data()
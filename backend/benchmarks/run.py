@@ -0,0 +1,395 @@
+"""Benchmark các thuật toán tìm đường trên dữ liệu thật và graph sinh ngẫu nhiên (seed cố định).
+
+Chạy từ thư mục backend:
+    python -m benchmarks.run --output report.json
+    python -m benchmarks.run --graphs grid:100000,rgg:100000 --algorithms dijkstra,a_star,alt
+    python -m benchmarks.run --output new.json --baseline report.json   # exit 1 nếu chậm đi
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.algorithms import a_star, bidirectional_a_star, bidirectional_dijkstra, dijkstra
+from core.ch import ContractionHierarchy
+from core.crp import CellOverlay
+from core.geometry import haversine_distance, np
+from core.graph import RoadGraph
+from core.landmarks import LandmarkTable
+from core.metrics import SearchStats
+from import_data import import_edges, import_nodes
+
+from .synthetic import grid_graph, random_geometric_graph
+
+REPORT_FORMAT = 1
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+
+DEFAULT_GRAPHS = 'real,grid:10000,rgg:10000'
+DEFAULT_SCENARIOS = 'none,constrained'
+DEFAULT_QUERIES = 30
+DEFAULT_SEED = 42
+
+# Phân loại truy vấn theo khoảng cách thẳng giữa 2 đầu, tính theo tỉ lệ đường chéo bbox của graph
+QUERY_CLASSES = (('short', 0.0, 0.1), ('medium', 0.1, 0.3), ('long', 0.3, math.inf))
+# Tỉ lệ edge bị gắn constraint trong kịch bản 'constrained'
+CONSTRAINT_RATIOS = {'block': 0.03, 'penalty': 0.05, 'oneway': 0.03}
+
+
+class Scenario:
+    """Graph đã áp constraints cùng các cấu trúc tiền xử lý mà thuật toán cần"""
+
+    def __init__(self, graph: RoadGraph):
+        self.graph = graph
+        self.csr = graph.csr
+        self.hierarchy: Optional[ContractionHierarchy] = None
+        self.landmarks: Optional[LandmarkTable] = None
+        self.overlay: Optional[CellOverlay] = None
+
+
+# name -> (hàm search(scenario, start, end, stats), cấu trúc tiền xử lý cần dựng)
+ALGORITHMS: Dict[str, Tuple[Callable, Optional[str]]] = {
+    'dijkstra': (lambda s, start, end, stats: dijkstra(s.csr, start, end, stats=stats), None),
+    'dijkstra_dict': (lambda s, start, end, stats: dijkstra(s.graph, start, end, stats=stats), None),
+    'a_star': (lambda s, start, end, stats: a_star(s.csr, start, end, stats=stats), None),
+    'bidirectional_dijkstra': (
+        lambda s, start, end, stats: bidirectional_dijkstra(s.csr, start, end, stats=stats), None),
+    'bidirectional_a_star': (
+        lambda s, start, end, stats: bidirectional_a_star(s.csr, start, end, stats=stats), None),
+    'ch': (lambda s, start, end, stats: s.hierarchy.query(start, end, stats=stats), 'ch'),
+    'alt': (lambda s, start, end, stats: a_star(s.csr, start, end, landmarks=s.landmarks, stats=stats), 'alt'),
+    'crp': (lambda s, start, end, stats: s.overlay.query(start, end, stats=stats), 'crp'),
+}
+
+
+def load_graph_spec(spec: str, seed: int) -> Tuple[List[Dict], List[Dict]]:
+    """'real' = data/nodes.csv + edges.csv; 'grid:N' / 'rgg:N' = graph sinh ngẫu nhiên N node"""
+    if spec == 'real':
+        # import_data in tiến độ ra stdout; chuyển sang stderr để --output - vẫn là JSON hợp lệ
+        with contextlib.redirect_stdout(sys.stderr):
+            return (import_nodes(os.path.join(DATA_DIR, 'nodes.csv')),
+                    import_edges(os.path.join(DATA_DIR, 'edges.csv')))
+
+    kind, _, size = spec.partition(':')
+    num_nodes = int(float(size))
+    if kind == 'grid':
+        return grid_graph(num_nodes, seed)
+    if kind == 'rgg':
+        return random_geometric_graph(num_nodes, seed)
+    raise ValueError(f"Unknown graph spec: {spec}")
+
+
+def build_graph(nodes: List[Dict], edges: List[Dict], constraints: List[Dict]) -> RoadGraph:
+    graph = RoadGraph()
+    for node in nodes:
+        graph.add_node(node['node_id'], node['latitude'], node['longitude'])
+    for edge in edges:
+        graph.add_edge(edge['edge_id'], edge['from_node'], edge['to_node'], edge['distance'], edge['is_oneway'])
+    for constraint in constraints:
+        graph.add_constraint(constraint['edge_id'], constraint['constraint_type'], constraint['value'])
+    graph.rebuild_adjacency()
+    return graph
+
+
+def random_constraints(edges: List[Dict], seed: int) -> List[Dict]:
+    """Block / penalty ×1.5–4 / oneway (forward, backward; 'both' cho đường một chiều gốc)"""
+    rng = random.Random(seed)
+    chosen = rng.sample(edges, min(len(edges), round(len(edges) * sum(CONSTRAINT_RATIOS.values()))))
+    constraints = []
+    start = 0
+    for constraint_type, ratio in CONSTRAINT_RATIOS.items():
+        count = round(len(edges) * ratio)
+        for edge in chosen[start:start + count]:
+            if constraint_type == 'penalty':
+                value = str(round(rng.uniform(1.5, 4.0), 2))
+            elif constraint_type == 'oneway':
+                value = 'both' if edge['is_oneway'] == 1 else rng.choice(('forward', 'backward'))
+            else:
+                value = ''
+            constraints.append({'edge_id': edge['edge_id'], 'constraint_type': constraint_type, 'value': value})
+        start += count
+    return constraints
+
+
+def largest_component(nodes: List[Dict], edges: List[Dict]) -> List[int]:
+    """Node của thành phần liên thông (vô hướng) lớn nhất, để truy vấn ít khi rơi vào cặp không nối"""
+    parent = {node['node_id']: node['node_id'] for node in nodes}
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for edge in edges:
+        a, b = find(edge['from_node']), find(edge['to_node'])
+        if a != b:
+            parent[a] = b
+
+    components: Dict[int, List[int]] = {}
+    for node_id in parent:
+        components.setdefault(find(node_id), []).append(node_id)
+    return max(components.values(), key=len)
+
+
+def make_queries(graph: RoadGraph, candidates: List[int], per_class: int,
+                 seed: int) -> Dict[str, List[Tuple[int, int]]]:
+    """per_class cặp (start, end) cho mỗi lớp short/medium/long, chọn bằng rejection sampling"""
+    rng = random.Random(seed)
+    lats = [graph.nodes[node_id][0] for node_id in candidates]
+    lons = [graph.nodes[node_id][1] for node_id in candidates]
+    diagonal = haversine_distance(min(lats), min(lons), max(lats), max(lons)) or 1.0
+
+    queries: Dict[str, List[Tuple[int, int]]] = {name: [] for name, _, _ in QUERY_CLASSES}
+    attempts = per_class * len(QUERY_CLASSES) * 200
+    while attempts and any(len(pairs) < per_class for pairs in queries.values()):
+        attempts -= 1
+        start, end = rng.choice(candidates), rng.choice(candidates)
+        if start == end:
+            continue
+        ratio = haversine_distance(*graph.nodes[start], *graph.nodes[end]) / diagonal
+        for name, low, high in QUERY_CLASSES:
+            if low <= ratio < high and len(queries[name]) < per_class:
+                queries[name].append((start, end))
+                break
+    return queries
+
+
+def prepare(scenario: Scenario, algorithms: List[str]) -> Dict[str, float]:
+    """Dựng CH / bảng landmark / overlay theo cell nếu có thuật toán cần; trả về thời gian dựng (giây)"""
+    needed = {ALGORITHMS[name][1] for name in algorithms}
+    timings = {}
+    if 'ch' in needed:
+        started = time.perf_counter()
+        scenario.hierarchy = ContractionHierarchy.build(scenario.csr)
+        timings['ch'] = time.perf_counter() - started
+    if 'alt' in needed:
+        started = time.perf_counter()
+        scenario.landmarks = LandmarkTable.build(scenario.csr)
+        timings['alt'] = time.perf_counter() - started
+    if 'crp' in needed:
+        started = time.perf_counter()
+        scenario.overlay = CellOverlay.build(scenario.csr)
+        timings['crp'] = time.perf_counter() - started
+    return timings
+
+
+def run_query_set(scenario: Scenario, algorithm: str, queries: List[Tuple[int, int]],
+                  reference: List[Optional[float]]) -> Dict:
+    search = ALGORITHMS[algorithm][0]
+    latencies = []
+    settled = []
+    pushes = []
+    relaxations = []
+    found = 0
+    mismatches = 0
+
+    if queries:
+        search(scenario, *queries[0], None)  # warm-up: workspace, heuristic, ...
+
+    for (start, end), expected in zip(queries, reference):
+        stats = SearchStats()
+        path, distance = search(scenario, start, end, stats)
+        latencies.append(stats.elapsed * 1000)
+        settled.append(stats.settled)
+        pushes.append(stats.pushes)
+        relaxations.append(stats.relaxations)
+        if path is not None:
+            found += 1
+        if (distance is None) != (expected is None) or \
+                (distance is not None and abs(distance - expected) > 1e-6 * max(1.0, expected)):
+            mismatches += 1
+
+    # Lượt riêng để đo bộ nhớ: tracemalloc làm chậm đáng kể nên không đo chung với độ trễ
+    tracemalloc.start()
+    for start, end in queries:
+        search(scenario, start, end, None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'algorithm': algorithm,
+        'queries': len(queries),
+        'found': found,
+        'mismatches': mismatches,
+        'latency_ms': _summary(latencies, 4),
+        'settled': _summary(settled, 1),
+        'heap_pushes_mean': round(statistics.mean(pushes), 1) if pushes else None,
+        'relaxations_mean': round(statistics.mean(relaxations), 1) if relaxations else None,
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+
+def _summary(values: List[float], digits: int) -> Dict[str, Optional[float]]:
+    if not values:
+        return {'mean': None, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+    return {
+        'mean': round(statistics.mean(ordered), digits),
+        'p50': round(_percentile(ordered, 0.50), digits),
+        'p90': round(_percentile(ordered, 0.90), digits),
+        'p99': round(_percentile(ordered, 0.99), digits),
+        'max': round(ordered[-1], digits)
+    }
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    """Nội suy tuyến tính giữa 2 phần tử gần nhất (như numpy.percentile mặc định)"""
+    position = (len(ordered) - 1) * fraction
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def benchmark_graph(spec: str, scenarios: List[str], algorithms: List[str],
+                    per_class: int, seed: int) -> Dict:
+    started = time.perf_counter()
+    nodes, edges = load_graph_spec(spec, seed)
+    generate_seconds = time.perf_counter() - started
+    candidates = largest_component(nodes, edges)
+
+    report = {
+        'name': spec,
+        'nodes': len(nodes),
+        'edges': len(edges),
+        'generate_s': round(generate_seconds, 3),
+        'scenarios': []
+    }
+
+    queries = None
+    for scenario_name in scenarios:
+        constraints = random_constraints(edges, seed) if scenario_name == 'constrained' else []
+        started = time.perf_counter()
+        scenario = Scenario(build_graph(nodes, edges, constraints))
+        build_seconds = time.perf_counter() - started
+        if queries is None:
+            # Cùng bộ truy vấn cho mọi kịch bản để so sánh được với nhau
+            queries = make_queries(scenario.graph, candidates, per_class, seed)
+
+        preprocessing = prepare(scenario, algorithms)
+        print(f"{spec} [{scenario_name}]: {len(nodes)} nodes, {len(edges)} edges, "
+              f"{len(constraints)} constraints, build {build_seconds:.2f}s", file=sys.stderr)
+
+        results = []
+        for class_name, pairs in queries.items():
+            reference = [dijkstra(scenario.csr, start, end)[1] for start, end in pairs]
+            for algorithm in algorithms:
+                result = run_query_set(scenario, algorithm, pairs, reference)
+                result['query_class'] = class_name
+                results.append(result)
+                print(f"  {class_name:<6} {algorithm:<24} p50 {result['latency_ms']['p50']} ms, "
+                      f"settled {result['settled']['mean']}, mismatches {result['mismatches']}",
+                      file=sys.stderr)
+
+        report['scenarios'].append({
+            'name': scenario_name,
+            'constraints': len(constraints),
+            'build_s': round(build_seconds, 3),
+            'preprocessing_s': {name: round(seconds, 3) for name, seconds in preprocessing.items()},
+            'results': results
+        })
+    return report
+
+
+def compare_reports(report: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Các dòng mô tả regression: p50 chậm hơn baseline quá tolerance (và quá min_delta_ms,
+    để nhiễu đo của truy vấn dưới 1 ms không bị tính), settled tăng, kết quả sai"""
+    def keyed(data: Dict) -> Dict[Tuple[str, str, str, str], Dict]:
+        return {(g['name'], s['name'], r['query_class'], r['algorithm']): r
+                for g in data['graphs'] for s in g['scenarios'] for r in s['results']}
+
+    old_results = keyed(baseline)
+    regressions = []
+    for key, result in sorted(keyed(report).items()):
+        label = '/'.join(key)
+        if result['mismatches']:
+            regressions.append(f"{label}: {result['mismatches']} wrong distances")
+        old = old_results.get(key)
+        if old is None or not result['queries']:
+            continue
+        new_p50, old_p50 = result['latency_ms']['p50'], old['latency_ms']['p50']
+        if old_p50 and new_p50 > old_p50 * (1 + tolerance) and new_p50 - old_p50 > min_delta_ms:
+            regressions.append(f"{label}: p50 {old_p50} ms -> {new_p50} ms")
+        # settled không phụ thuộc máy chạy nên chỉ cho sai lệch rất nhỏ
+        new_settled, old_settled = result['settled']['mean'], old['settled']['mean']
+        if old_settled is not None and new_settled > old_settled * 1.01:
+            regressions.append(f"{label}: settled {old_settled} -> {new_settled}")
+    return regressions
+
+
+def peak_rss_kb() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark routing algorithms')
+    parser.add_argument('--graphs', default=DEFAULT_GRAPHS,
+                        help="comma-separated: real, grid:N, rgg:N (e.g. grid:1e6)")
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help='comma-separated: none, constrained')
+    parser.add_argument('--algorithms', default=','.join(ALGORITHMS), help='comma-separated algorithm names')
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help='queries per class')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', help="write the JSON report here ('-' = stdout)")
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown vs baseline (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.2,
+                        help='ignore p50 slowdowns smaller than this many milliseconds')
+    args = parser.parse_args(argv)
+
+    algorithms = [name for name in args.algorithms.split(',') if name]
+    unknown = [name for name in algorithms if name not in ALGORITHMS]
+    if unknown:
+        parser.error(f"unknown algorithms: {', '.join(unknown)}")
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    if any(name not in ('none', 'constrained') for name in scenarios):
+        parser.error("scenarios must be 'none' or 'constrained'")
+
+    report = {
+        'format': REPORT_FORMAT,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np is not None,
+        'seed': args.seed,
+        'queries_per_class': args.queries,
+        'graphs': [benchmark_graph(spec, scenarios, algorithms, args.queries, args.seed)
+                   for spec in args.graphs.split(',') if spec]
+    }
+    report['peak_rss_kb'] = peak_rss_kb()
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print('No regressions against baseline', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import math
+import random
+from typing import Dict, List, Tuple
+
+from core.geometry import haversine_distance
+
+# Tọa độ gốc của graph sinh ra (quanh phường Hoàng Liệt) và khoảng cách trung bình giữa 2 node
+ORIGIN_LAT = 20.96
+ORIGIN_LON = 105.81
+DEFAULT_SPACING = 60.0
+METERS_PER_DEGREE = 111320.0
+
+
+def grid_graph(num_nodes: int, seed: int, spacing: float = DEFAULT_SPACING,
+               oneway_ratio: float = 0.05) -> Tuple[List[Dict], List[Dict]]:
+    """Lưới xấp xỉ num_nodes node, nối 4 hướng; tọa độ lệch ngẫu nhiên ±20% spacing.
+
+    Trả về (nodes, edges) cùng dạng với import_data.import_nodes / import_edges.
+    """
+    rng = random.Random(seed)
+    side = max(2, round(math.sqrt(num_nodes)))
+    dlat, dlon = _degree_steps(spacing)
+
+    nodes = []
+    for row in range(side):
+        for col in range(side):
+            nodes.append({
+                'node_id': row * side + col + 1,
+                'latitude': ORIGIN_LAT + (row + rng.uniform(-0.2, 0.2)) * dlat,
+                'longitude': ORIGIN_LON + (col + rng.uniform(-0.2, 0.2)) * dlon
+            })
+
+    pairs = []
+    for row in range(side):
+        for col in range(side):
+            node_id = row * side + col + 1
+            if col + 1 < side:
+                pairs.append((node_id, node_id + 1))
+            if row + 1 < side:
+                pairs.append((node_id, node_id + side))
+
+    return nodes, _make_edges(nodes, pairs, rng, oneway_ratio)
+
+
+def random_geometric_graph(num_nodes: int, seed: int, spacing: float = DEFAULT_SPACING,
+                           average_degree: float = 6.0,
+                           oneway_ratio: float = 0.05) -> Tuple[List[Dict], List[Dict]]:
+    """num_nodes điểm ngẫu nhiên đều trong hình vuông, nối mọi cặp cách nhau không quá r
+    (r chọn để bậc trung bình ≈ average_degree). Có thể không liên thông."""
+    rng = random.Random(seed)
+    side = math.sqrt(num_nodes) * spacing
+    radius = spacing * math.sqrt(average_degree / math.pi)
+    dlat, dlon = _degree_steps(1.0)
+
+    points = [(rng.uniform(0, side), rng.uniform(0, side)) for _ in range(num_nodes)]
+    nodes = [
+        {'node_id': i + 1, 'latitude': ORIGIN_LAT + y * dlat, 'longitude': ORIGIN_LON + x * dlon}
+        for i, (x, y) in enumerate(points)
+    ]
+
+    # Chia ô cạnh radius: chỉ cần xét ô của mình và 8 ô xung quanh
+    cells: Dict[Tuple[int, int], List[int]] = {}
+    for i, (x, y) in enumerate(points):
+        cells.setdefault((int(x // radius), int(y // radius)), []).append(i)
+
+    pairs = []
+    radius_squared = radius * radius
+    for (cx, cy), members in cells.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                others = cells.get((cx + dx, cy + dy))
+                if others is None:
+                    continue
+                for i in members:
+                    xi, yi = points[i]
+                    for j in others:
+                        if j <= i:
+                            continue
+                        xj, yj = points[j]
+                        if (xi - xj) ** 2 + (yi - yj) ** 2 <= radius_squared:
+                            pairs.append((i + 1, j + 1))
+
+    pairs.sort()
+    return nodes, _make_edges(nodes, pairs, rng, oneway_ratio)
+
+
+def _degree_steps(meters: float) -> Tuple[float, float]:
+    dlat = meters / METERS_PER_DEGREE
+    dlon = meters / (METERS_PER_DEGREE * math.cos(math.radians(ORIGIN_LAT)))
+    return dlat, dlon
+
+
+def _make_edges(nodes: List[Dict], pairs: List[Tuple[int, int]], rng: random.Random,
+                oneway_ratio: float) -> List[Dict]:
+    """Độ dài edge = khoảng cách thẳng × hệ số 1.0–1.2 (đường không thẳng), làm tròn 0.1 m như edges.csv"""
+    by_id = {node['node_id']: node for node in nodes}
+    edges = []
+    for edge_id, (from_node, to_node) in enumerate(pairs, start=1):
+        a, b = by_id[from_node], by_id[to_node]
+        straight = haversine_distance(a['latitude'], a['longitude'], b['latitude'], b['longitude'])
+        if rng.random() < 0.5:
+            from_node, to_node = to_node, from_node
+        edges.append({
+            'edge_id': edge_id,
+            'from_node': from_node,
+            'to_node': to_node,
+            'distance': max(0.1, round(straight * rng.uniform(1.0, 1.2), 1)),
+            'is_oneway': 1 if rng.random() < oneway_ratio else 0
+        })
+    return edges
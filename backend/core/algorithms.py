@@ -1,18 +1,41 @@
+import bisect
 import heapq
 import math
-from typing import List, Tuple, Optional, Dict
+from typing import Callable, List, Tuple, Optional, Dict, Union
 from .graph import RoadGraph
+from .csr import CSRGraph, INF
+from .geometry import EARTH_RADIUS
+from .landmarks import LandmarkTable
+from .metrics import SearchStats, timed_search
+
+Graph = Union[RoadGraph, CSRGraph]
+
+# Route thay thế (penalty method): weight của edge thuộc route vừa tìm được nhân thêm
+# ALTERNATIVE_PENALTY mỗi lần; chỉ nhận route dài không quá ALTERNATIVE_MAX_STRETCH lần route
+# ngắn nhất và trùng không quá ALTERNATIVE_MAX_OVERLAP chiều dài với mỗi route đã nhận.
+# Tổng số node settle thêm không vượt ALTERNATIVE_SETTLE_FACTOR lần số node settle của lần search
+# đầu (search không phạt, hoặc lần search có phạt đầu tiên khi đã có sẵn route ngắn nhất).
+ALTERNATIVE_PENALTY = 1.4
+ALTERNATIVE_MAX_STRETCH = 1.5
+ALTERNATIVE_MAX_OVERLAP = 0.7
+ALTERNATIVE_SETTLE_FACTOR = 3.0
+
+@timed_search
+def dijkstra(graph: Graph, start: int, end: int,
+             stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+    if isinstance(graph, CSRGraph):
+        return _dijkstra_csr(graph, start, end, stats)
 
-def dijkstra(graph: RoadGraph, start: int, end: int) -> Tuple[Optional[List[int]], Optional[float]]:
     if start not in graph.nodes or end not in graph.nodes:
         return None, None
 
-    distances: Dict[int, float] = {node: float('inf') for node in graph.nodes}
-    distances[start] = 0
-    previous: Dict[int, Optional[int]] = {node: None for node in graph.nodes}
+    # Dict được điền dần: node chưa có trong distances coi như inf
+    distances: Dict[int, float] = {start: 0}
+    previous: Dict[int, Optional[int]] = {start: None}
 
     priority_queue = [(0, start)]
     visited = set()
+    pushes = relaxations = 0
 
     while priority_queue:
         current_distance, current_node = heapq.heappop(priority_queue)
@@ -25,18 +48,21 @@ def dijkstra(graph: RoadGraph, start: int, end: int) -> Tuple[Optional[List[int]
         if current_node == end:
             break
 
-        if current_distance > distances[current_node]:
-            continue
-
-        for neighbor_id, edge_id, cost in graph.get_neighbors(current_node):
+        neighbors = graph.get_neighbors(current_node)
+        relaxations += len(neighbors)
+        for neighbor_id, edge_id, cost in neighbors:
             distance = current_distance + cost
 
-            if distance < distances[neighbor_id]:
+            if distance < distances.get(neighbor_id, INF):
                 distances[neighbor_id] = distance
                 previous[neighbor_id] = current_node
                 heapq.heappush(priority_queue, (distance, neighbor_id))
+                pushes += 1
 
-    if distances[end] == float('inf'):
+    if stats is not None:
+        stats.record(len(visited), pushes, 1 + pushes - len(priority_queue), relaxations)
+
+    if end not in distances:
         return None, None
 
     path = []
@@ -49,25 +75,30 @@ def dijkstra(graph: RoadGraph, start: int, end: int) -> Tuple[Optional[List[int]
 
     return path, distances[end]
 
-def a_star(graph: RoadGraph, start: int, end: int) -> Tuple[Optional[List[int]], Optional[float]]:
+@timed_search
+def a_star(graph: Graph, start: int, end: int, landmarks: Optional[LandmarkTable] = None,
+           stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+    """A* với heuristic haversine, hoặc ALT khi truyền landmarks (luôn chạy trên CSR)"""
+    if landmarks is not None:
+        return _a_star_csr(_as_csr(graph), start, end, landmarks, stats)
+    if isinstance(graph, CSRGraph):
+        return _a_star_csr(graph, start, end, stats=stats)
+
     if start not in graph.nodes or end not in graph.nodes:
         return None, None
 
+    end_lat, end_lon = graph.nodes[end]
+
     def heuristic(node_id: int) -> float:
         node_lat, node_lon = graph.nodes[node_id]
-        end_lat, end_lon = graph.nodes[end]
         return graph.haversine_distance(node_lat, node_lon, end_lat, end_lon)
 
-    g_score: Dict[int, float] = {node: float('inf') for node in graph.nodes}
-    g_score[start] = 0
-
-    f_score: Dict[int, float] = {node: float('inf') for node in graph.nodes}
-    f_score[start] = heuristic(start)
+    g_score: Dict[int, float] = {start: 0}
+    previous: Dict[int, Optional[int]] = {start: None}
 
-    previous: Dict[int, Optional[int]] = {node: None for node in graph.nodes}
-
-    open_set = [(f_score[start], start)]
+    open_set = [(heuristic(start), start)]
     visited = set()
+    pushes = relaxations = 0
 
     while open_set:
         current_f, current_node = heapq.heappop(open_set)
@@ -80,16 +111,21 @@ def a_star(graph: RoadGraph, start: int, end: int) -> Tuple[Optional[List[int]],
         if current_node == end:
             break
 
-        for neighbor_id, edge_id, cost in graph.get_neighbors(current_node):
+        neighbors = graph.get_neighbors(current_node)
+        relaxations += len(neighbors)
+        for neighbor_id, edge_id, cost in neighbors:
             tentative_g_score = g_score[current_node] + cost
 
-            if tentative_g_score < g_score[neighbor_id]:
+            if tentative_g_score < g_score.get(neighbor_id, INF):
                 previous[neighbor_id] = current_node
                 g_score[neighbor_id] = tentative_g_score
-                f_score[neighbor_id] = tentative_g_score + heuristic(neighbor_id)
-                heapq.heappush(open_set, (f_score[neighbor_id], neighbor_id))
+                heapq.heappush(open_set, (tentative_g_score + heuristic(neighbor_id), neighbor_id))
+                pushes += 1
+
+    if stats is not None:
+        stats.record(len(visited), pushes, 1 + pushes - len(open_set), relaxations)
 
-    if g_score[end] == float('inf'):
+    if end not in g_score:
         return None, None
 
     path = []
@@ -101,3 +137,532 @@ def a_star(graph: RoadGraph, start: int, end: int) -> Tuple[Optional[List[int]],
     path.reverse()
 
     return path, g_score[end]
+
+def _dijkstra_csr(csr: CSRGraph, start: int, end: int,
+                  stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+    source = csr.index.get(start)
+    target = csr.index.get(end)
+    if source is None or target is None:
+        return None, None
+
+    offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+
+    workspace = csr.workspace()
+    generation = workspace.next_generation()
+    distances, previous = workspace.distances, workspace.previous
+    seen, closed = workspace.seen, workspace.closed
+
+    seen[source] = generation
+    distances[source] = 0.0
+    previous[source] = -1
+
+    priority_queue = [(0.0, source)]
+    settled = pushes = relaxations = 0
+
+    while priority_queue:
+        current_distance, u = heapq.heappop(priority_queue)
+
+        if closed[u] == generation:
+            continue
+        closed[u] = generation
+        settled += 1
+
+        if u == target:
+            break
+
+        first, last = offsets[u], offsets[u + 1]
+        relaxations += last - first
+        for slot in range(first, last):
+            v = targets[slot]
+            distance = current_distance + weights[slot]
+
+            if seen[v] != generation:
+                # Slot bị chặn có weight = inf
+                if distance == INF:
+                    continue
+                seen[v] = generation
+            elif distance >= distances[v]:
+                continue
+
+            distances[v] = distance
+            previous[v] = u
+            heapq.heappush(priority_queue, (distance, v))
+            pushes += 1
+
+    if stats is not None:
+        stats.record(settled, pushes, 1 + pushes - len(priority_queue), relaxations)
+
+    if seen[target] != generation:
+        return None, None
+
+    return csr.unpack_path(previous, target), distances[target]
+
+def haversine_heuristic(csr: CSRGraph, target: int) -> Callable[[int], float]:
+    """Haversine tới target dùng radian/cos đã tính sẵn trong csr, nhân heuristic_scale.
+    Tính lười cho từng node được push: không vector hóa cho cả graph vì mỗi truy vấn sẽ lại
+    tốn O(V) trước khi settle node đầu tiên (NumPy chỉ dùng cho kernel chạy trên cả graph)"""
+    lat_rad, lon_rad, cos_lat = csr.radians()
+    target_phi, target_lambda, target_cos = lat_rad[target], lon_rad[target], cos_lat[target]
+    factor = 2 * EARTH_RADIUS * csr.heuristic_scale
+
+    sin, asin, sqrt = math.sin, math.asin, math.sqrt
+
+    def heuristic(v: int) -> float:
+        a = sin((lat_rad[v] - target_phi) / 2) ** 2 + \
+            cos_lat[v] * target_cos * sin((lon_rad[v] - target_lambda) / 2) ** 2
+        return factor * asin(sqrt(min(a, 1.0)))
+
+    return heuristic
+
+def _a_star_csr(csr: CSRGraph, start: int, end: int, landmarks: Optional[LandmarkTable] = None,
+                stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+    source = csr.index.get(start)
+    target = csr.index.get(end)
+    if source is None or target is None:
+        return None, None
+
+    offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+
+    # Bảng landmark dựng cho weights khác (constraints đã đổi) không còn là cận dưới hợp lệ
+    if landmarks is not None and landmarks.signature == csr.signature():
+        heuristic = landmarks.heuristic(source, target)
+    else:
+        heuristic = haversine_heuristic(csr, target)
+
+    workspace = csr.workspace()
+    generation = workspace.next_generation()
+    g_score, previous = workspace.distances, workspace.previous
+    seen, closed = workspace.seen, workspace.closed
+
+    seen[source] = generation
+    g_score[source] = 0.0
+    previous[source] = -1
+
+    open_set = [(heuristic(source), source)]
+    settled = pushes = relaxations = 0
+
+    while open_set:
+        _, u = heapq.heappop(open_set)
+
+        if closed[u] == generation:
+            continue
+        closed[u] = generation
+        settled += 1
+
+        if u == target:
+            break
+
+        current_g = g_score[u]
+        first, last = offsets[u], offsets[u + 1]
+        relaxations += last - first
+        for slot in range(first, last):
+            v = targets[slot]
+            tentative_g_score = current_g + weights[slot]
+
+            if seen[v] != generation:
+                if tentative_g_score == INF:
+                    continue
+                seen[v] = generation
+            elif tentative_g_score >= g_score[v]:
+                continue
+
+            g_score[v] = tentative_g_score
+            previous[v] = u
+            h_score = heuristic(v)
+            # ALT trả về inf khi v chắc chắn không tới được end
+            if h_score != INF:
+                heapq.heappush(open_set, (tentative_g_score + h_score, v))
+                pushes += 1
+
+    if stats is not None:
+        stats.record(settled, pushes, 1 + pushes - len(open_set), relaxations)
+
+    if seen[target] != generation:
+        return None, None
+
+    return csr.unpack_path(previous, target), g_score[target]
+
+@timed_search
+def bidirectional_dijkstra(graph: Graph, start: int, end: int,
+                           stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+    """Dijkstra chạy đồng thời từ start (trên weights) và từ end (trên reverse_weights)"""
+    return _bidirectional_csr(_as_csr(graph), start, end, use_potential=False, stats=stats)
+
+@timed_search
+def bidirectional_a_star(graph: Graph, start: int, end: int,
+                         stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+    """A* 2 chiều với potential trung bình p(v) = (h_end(v) - h_start(v)) / 2 (nhất quán cho cả 2 chiều)"""
+    return _bidirectional_csr(_as_csr(graph), start, end, use_potential=True, stats=stats)
+
+def _as_csr(graph: Graph) -> CSRGraph:
+    if isinstance(graph, CSRGraph):
+        return graph
+    if graph.csr is None:
+        graph.csr = CSRGraph.from_road_graph(graph)
+    return graph.csr
+
+def _bidirectional_csr(csr: CSRGraph, start: int, end: int, use_potential: bool,
+                       stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+    source = csr.index.get(start)
+    target = csr.index.get(end)
+    if source is None or target is None:
+        return None, None
+    if source == target:
+        return [start], 0.0
+
+    offsets, targets = csr.offsets, csr.targets
+
+    if use_potential:
+        to_end = haversine_heuristic(csr, target)
+        to_start = haversine_heuristic(csr, source)
+
+        def potential(v: int) -> float:
+            return (to_end(v) - to_start(v)) / 2
+    else:
+        def potential(v: int) -> float:
+            return 0.0
+
+    forward = csr.workspace('forward')
+    backward = csr.workspace('backward')
+    sides = []
+    for workspace, weights, node, sign in ((forward, csr.weights, source, 1.0),
+                                           (backward, csr.reverse_weights, target, -1.0)):
+        generation = workspace.next_generation()
+        workspace.seen[node] = generation
+        workspace.distances[node] = 0.0
+        workspace.previous[node] = -1
+        # Khóa của chiều đi là d + p(v), chiều về là d - p(v)
+        sides.append((workspace, generation, weights, sign, [(sign * potential(node), node)]))
+
+    best = INF
+    meeting = -1
+    settled = pushes = pops = relaxations = 0
+
+    while sides[0][4] and sides[1][4]:
+        # Dừng khi tổng 2 khóa nhỏ nhất không thể cải thiện đường tốt nhất
+        if sides[0][4][0][0] + sides[1][4][0][0] >= best:
+            break
+
+        side = 0 if sides[0][4][0][0] <= sides[1][4][0][0] else 1
+        workspace, generation, weights, sign, heap = sides[side]
+        other, other_generation = sides[1 - side][0], sides[1 - side][1]
+
+        _, u = heapq.heappop(heap)
+        pops += 1
+        closed = workspace.closed
+        if closed[u] == generation:
+            continue
+        closed[u] = generation
+        settled += 1
+
+        distances, previous, seen = workspace.distances, workspace.previous, workspace.seen
+        other_distances, other_seen = other.distances, other.seen
+        current_distance = distances[u]
+
+        first, last = offsets[u], offsets[u + 1]
+        relaxations += last - first
+        for slot in range(first, last):
+            v = targets[slot]
+            distance = current_distance + weights[slot]
+
+            if seen[v] != generation:
+                if distance == INF:
+                    continue
+                seen[v] = generation
+            elif distance >= distances[v]:
+                continue
+
+            distances[v] = distance
+            previous[v] = u
+            heapq.heappush(heap, (distance + sign * potential(v), v))
+            pushes += 1
+
+            if other_seen[v] == other_generation:
+                candidate = distance + other_distances[v]
+                if candidate < best:
+                    best = candidate
+                    meeting = v
+
+    if stats is not None:
+        stats.record(settled, pushes, pops, relaxations)
+
+    if meeting == -1:
+        return None, None
+
+    # Nửa đầu: source → meeting theo previous của chiều đi,
+    # nửa sau: meeting → target theo previous (node kế tiếp) của chiều về
+    path = csr.unpack_path(forward.previous, meeting)
+    current = backward.previous[meeting]
+    while current != -1:
+        path.append(csr.node_ids[current])
+        current = backward.previous[current]
+
+    return path, best
+
+@timed_search
+def alternative_routes(graph: Graph, start: int, end: int, k: int = 3,
+                       shortest: Optional[Tuple[List[int], float]] = None,
+                       stats: Optional[SearchStats] = None) -> List[Tuple[List[int], float]]:
+    """Tối đa k route (path, distance) từ start tới end, route đầu là đường ngắn nhất.
+
+    Mỗi vòng chạy lại A* trên weights đã phạt các edge của route trước (dict phạt theo edge_id,
+    không copy mảng weights), dùng chung heuristic haversine đã tính cho target. Dừng khi đủ k
+    route, hết ngân sách node settle thêm hoặc sau 2k vòng.
+
+    shortest: (path, distance) đường ngắn nhất đã tìm được (vd. route chính của /api/find-path);
+    có thì phạt luôn từ route đó, không search lại. Ngân sách khi đó tính theo lần search có
+    phạt đầu tiên thay vì lần search không phạt.
+    """
+    csr = _as_csr(graph)
+    source = csr.index.get(start)
+    target = csr.index.get(end)
+    if source is None or target is None or k <= 0:
+        return []
+    if source == target:
+        return [([start], 0.0)]
+
+    weights, edge_ids = csr.weights, csr.edge_ids
+    heuristic = haversine_heuristic(csr, target)
+    penalties: Dict[int, float] = {}
+
+    def route_of(path_slots: List[int]) -> Tuple[List[int], float]:
+        return ([start] + [csr.node_ids[csr.targets[slot]] for slot in path_slots],
+                sum(weights[slot] for slot in path_slots))
+
+    slots = _path_slots(csr, shortest[0]) if shortest is not None else None
+    if slots is not None:
+        best_path, best_distance = shortest
+        budget = None
+    else:
+        slots, settled = _penalized_a_star_csr(csr, source, target, heuristic, penalties, None, stats)
+        if slots is None:
+            return []
+        best_path, best_distance = route_of(slots)
+        budget = ALTERNATIVE_SETTLE_FACTOR * settled
+
+    routes = [(best_path, best_distance)]
+    accepted_edges = [{edge_ids[slot] for slot in slots}]
+
+    for _ in range(2 * k):
+        if len(routes) >= k or (budget is not None and budget <= 0):
+            break
+        for slot in slots:
+            edge_id = edge_ids[slot]
+            penalties[edge_id] = penalties.get(edge_id, 1.0) * ALTERNATIVE_PENALTY
+
+        slots, settled = _penalized_a_star_csr(csr, source, target, heuristic, penalties, budget, stats)
+        if budget is None:
+            # Lần search có phạt đầu tiên settle gần bằng search không phạt: dùng làm mốc ngân sách
+            budget = ALTERNATIVE_SETTLE_FACTOR * settled
+        budget -= settled
+        if slots is None:
+            break
+
+        path, distance = route_of(slots)
+        if distance > best_distance * ALTERNATIVE_MAX_STRETCH:
+            continue
+        candidate_edges = [(edge_ids[slot], weights[slot]) for slot in slots]
+        if all(sum(weight for edge_id, weight in candidate_edges if edge_id in edges)
+               <= ALTERNATIVE_MAX_OVERLAP * distance for edges in accepted_edges):
+            routes.append((path, distance))
+            accepted_edges.append({edge_id for edge_id, _ in candidate_edges})
+
+    return routes
+
+def _path_slots(csr: CSRGraph, path: List[int]) -> Optional[List[int]]:
+    """Slot CSR (weight nhỏ nhất nếu có nhiều edge song song) của từng bước trên path;
+    None nếu path có bước không đi được trên csr"""
+    offsets, targets, weights, index = csr.offsets, csr.targets, csr.weights, csr.index
+    slots = []
+    for from_node, to_node in zip(path, path[1:]):
+        u, v = index.get(from_node), index.get(to_node)
+        if u is None or v is None:
+            return None
+        best = -1
+        for slot in range(offsets[u], offsets[u + 1]):
+            if targets[slot] == v and weights[slot] != INF and (best == -1 or weights[slot] < weights[best]):
+                best = slot
+        if best == -1:
+            return None
+        slots.append(best)
+    return slots
+
+def _penalized_a_star_csr(csr: CSRGraph, source: int, target: int, heuristic: Callable[[int], float],
+                          penalties: Dict[int, float], settle_limit: Optional[float],
+                          stats: Optional[SearchStats]) -> Tuple[Optional[List[int]], int]:
+    """A* theo chỉ số dày với weight × penalties[edge_id]; trả về (các slot trên đường đi, số node settle).
+    Slot = None khi không có đường hoặc đã settle đủ settle_limit node mà chưa tới target."""
+    offsets, targets, weights, edge_ids = csr.offsets, csr.targets, csr.weights, csr.edge_ids
+
+    workspace = csr.workspace()
+    generation = workspace.next_generation()
+    g_score, previous = workspace.distances, workspace.previous
+    seen, closed = workspace.seen, workspace.closed
+
+    seen[source] = generation
+    g_score[source] = 0.0
+    # previous lưu slot đi vào node (không phải node trước) để biết edge nào đã dùng
+    previous[source] = -1
+
+    open_set = [(heuristic(source), source)]
+    settled = pushes = relaxations = 0
+    found = False
+
+    while open_set:
+        _, u = heapq.heappop(open_set)
+
+        if closed[u] == generation:
+            continue
+        closed[u] = generation
+        settled += 1
+
+        if u == target:
+            found = True
+            break
+        if settle_limit is not None and settled >= settle_limit:
+            break
+
+        current_g = g_score[u]
+        first, last = offsets[u], offsets[u + 1]
+        relaxations += last - first
+        for slot in range(first, last):
+            v = targets[slot]
+            weight = weights[slot]
+            penalty = penalties.get(edge_ids[slot])
+            if penalty is not None:
+                weight *= penalty
+            tentative_g_score = current_g + weight
+
+            if seen[v] != generation:
+                if tentative_g_score == INF:
+                    continue
+                seen[v] = generation
+            elif tentative_g_score >= g_score[v]:
+                continue
+
+            g_score[v] = tentative_g_score
+            previous[v] = slot
+            heapq.heappush(open_set, (tentative_g_score + heuristic(v), v))
+            pushes += 1
+
+    if stats is not None:
+        stats.record(settled, pushes, 1 + pushes - len(open_set), relaxations)
+
+    if not found:
+        return None, settled
+
+    slots = []
+    v = target
+    while previous[v] != -1:
+        slot = previous[v]
+        slots.append(slot)
+        # Node đầu của slot: hàng u chứa slot (offsets[u] <= slot < offsets[u + 1])
+        v = bisect.bisect_right(offsets, slot) - 1
+    slots.reverse()
+    return slots, settled
+
+def one_to_many(graph: Graph, start: int, ends: List[int]) -> List[Optional[float]]:
+    """Một lần Dijkstra từ start, dừng khi mọi node trong ends đã settle; None = không tới được"""
+    csr = _as_csr(graph)
+    source = csr.index.get(start)
+    if source is None:
+        return [None] * len(ends)
+
+    target_indices = [csr.index.get(end) for end in ends]
+    remaining = {index for index in target_indices if index is not None}
+
+    offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+
+    workspace = csr.workspace()
+    generation = workspace.next_generation()
+    distances, seen, closed = workspace.distances, workspace.seen, workspace.closed
+
+    seen[source] = generation
+    distances[source] = 0.0
+
+    priority_queue = [(0.0, source)]
+
+    while priority_queue and remaining:
+        current_distance, u = heapq.heappop(priority_queue)
+
+        if closed[u] == generation:
+            continue
+        closed[u] = generation
+        remaining.discard(u)
+
+        for slot in range(offsets[u], offsets[u + 1]):
+            v = targets[slot]
+            distance = current_distance + weights[slot]
+
+            if seen[v] != generation:
+                if distance == INF:
+                    continue
+                seen[v] = generation
+            elif distance >= distances[v]:
+                continue
+
+            distances[v] = distance
+            heapq.heappush(priority_queue, (distance, v))
+
+    return [distances[index] if index is not None and closed[index] == generation else None
+            for index in target_indices]
+
+def bounded_dijkstra(graph: Graph, start: int,
+                     max_distance: float) -> Tuple[Dict[int, float], Dict[int, float]]:
+    """Dijkstra từ start dừng ở ngân sách max_distance (isochrone).
+
+    Trả về (distances, edges): distances[node_id] cho mọi node tới được trong ngân sách;
+    edges[edge_id] là phần của edge đi được (1.0 = trọn edge, < 1 = đi được một đoạn từ node đã tới).
+    Chỉ chạm vào các node trong ngân sách nhờ workspace, không khởi tạo dict cho cả graph.
+    """
+    csr = _as_csr(graph)
+    source = csr.index.get(start)
+    if source is None or max_distance < 0:
+        return {}, {}
+
+    offsets, targets, weights, edge_ids = csr.offsets, csr.targets, csr.weights, csr.edge_ids
+
+    workspace = csr.workspace()
+    generation = workspace.next_generation()
+    distances, seen, closed = workspace.distances, workspace.seen, workspace.closed
+
+    seen[source] = generation
+    distances[source] = 0.0
+
+    priority_queue = [(0.0, source)]
+    reached: Dict[int, float] = {}
+    edges: Dict[int, float] = {}
+
+    while priority_queue:
+        current_distance, u = heapq.heappop(priority_queue)
+
+        if closed[u] == generation:
+            continue
+        closed[u] = generation
+        reached[csr.node_ids[u]] = current_distance
+        remaining = max_distance - current_distance
+
+        for slot in range(offsets[u], offsets[u + 1]):
+            weight = weights[slot]
+            if weight == INF:
+                continue
+
+            edge_id = edge_ids[slot]
+            fraction = 1.0 if weight <= remaining else remaining / weight
+            if fraction > edges.get(edge_id, 0.0):
+                edges[edge_id] = fraction
+
+            distance = current_distance + weight
+            if distance > max_distance:
+                continue
+
+            v = targets[slot]
+            if seen[v] != generation:
+                seen[v] = generation
+            elif distance >= distances[v]:
+                continue
+
+            distances[v] = distance
+            heapq.heappush(priority_queue, (distance, v))
+
+    return reached, edges
@@ -0,0 +1,130 @@
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ArrayLike = Union[array, memoryview]
+
+MAGIC = b'RGARRAY1'
+_ALIGN = 8
+
+
+def save_arrays(path: str, meta: Dict, arrays: Dict[str, ArrayLike]):
+    """Ghi nhiều array vào 1 file nhị phân: MAGIC, độ dài header, header JSON, rồi dữ liệu thô.
+
+    Ghi ra file tạm rồi os.replace để tiến trình khác không bao giờ đọc phải file ghi dở.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        _write_arrays(f, meta, arrays)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Khóa giữa các process (flock trên path + '.lock'), vd. để chỉ một worker dựng một file
+    cache còn các worker khác chờ rồi đọc file đó. Không có fcntl (Windows) thì không khóa."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def dump_arrays(meta: Dict, arrays: Dict[str, ArrayLike]) -> bytes:
+    """Cùng định dạng với save_arrays nhưng trả về bytes (vd. làm body của response)"""
+    buffer = io.BytesIO()
+    _write_arrays(buffer, meta, arrays)
+    return buffer.getvalue()
+
+
+def _write_arrays(f: BinaryIO, meta: Dict, arrays: Dict[str, ArrayLike]):
+    entries = []
+    offset = 0
+    for name, values in arrays.items():
+        entries.append({
+            'name': name,
+            'typecode': values.typecode if isinstance(values, array) else values.format,
+            'length': len(values),
+            'offset': offset
+        })
+        offset += _padded(values.itemsize * len(values))
+
+    header = json.dumps({
+        'byteorder': sys.byteorder,
+        'meta': meta,
+        'arrays': entries
+    }).encode('utf-8')
+    data_start = _padded(len(MAGIC) + 8 + len(header))
+
+    f.write(MAGIC)
+    f.write(struct.pack('<Q', len(header)))
+    f.write(header)
+    f.write(b'\0' * (data_start - len(MAGIC) - 8 - len(header)))
+    for values in arrays.values():
+        raw = values.tobytes()
+        f.write(raw)
+        f.write(b'\0' * (_padded(len(raw)) - len(raw)))
+
+
+def load_arrays(path: str, use_mmap: bool = False,
+                copy_on_write: bool = False) -> Tuple[Dict, Dict[str, ArrayLike]]:
+    """Đọc file array. use_mmap=True trả về memoryview chỉ đọc trên file được map vào bộ nhớ:
+    không copy, và các tiến trình cùng map một file dùng chung page cache.
+    copy_on_write=True (cùng use_mmap): memoryview ghi được, trang nào bị ghi mới thành bản
+    riêng của process, file và các process khác không thấy thay đổi."""
+    with open(path, 'rb') as f:
+        if use_mmap:
+            access = mmap.ACCESS_COPY if copy_on_write else mmap.ACCESS_READ
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=access))
+        else:
+            buffer = f.read()
+
+    header, data_start = _parse_header(buffer)
+    arrays: Dict[str, ArrayLike] = {}
+    for entry in header['arrays']:
+        start = data_start + entry['offset']
+        if use_mmap:
+            itemsize = array(entry['typecode']).itemsize
+            view = buffer[start:start + itemsize * entry['length']]
+            arrays[entry['name']] = view.cast(entry['typecode'])
+        else:
+            values = array(entry['typecode'])
+            values.frombytes(buffer[start:start + values.itemsize * entry['length']])
+            arrays[entry['name']] = values
+
+    return header['meta'], arrays
+
+
+def _parse_header(buffer) -> Tuple[Dict, int]:
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError('Not an array file')
+
+    (header_length,) = struct.unpack_from('<Q', buffer, len(MAGIC))
+    header_start = len(MAGIC) + 8
+    header = json.loads(bytes(buffer[header_start:header_start + header_length]).decode('utf-8'))
+
+    if header['byteorder'] != sys.byteorder:
+        raise ValueError('Array file was written with a different byte order')
+
+    return header, _padded(header_start + header_length)
+
+
+def _padded(size: int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
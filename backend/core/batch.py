@@ -0,0 +1,113 @@
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+class BatchRunner:
+    """Chạy nhiều tác vụ nhỏ (tìm đường) trên một thread pool giới hạn.
+
+    max_workers giới hạn số tác vụ chạy đồng thời của mọi batch cộng lại; mỗi batch chỉ
+    đẩy tối đa max_pending tác vụ vào pool một lúc nên batch lớn không chiếm hết hàng đợi
+    và request tương tác vẫn được phục vụ xen kẽ.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+
+    def run(self, items: Sequence[Any], task: Callable[[Any], Any]) -> Iterator[Tuple[int, Any]]:
+        """Trả về (index, kết quả) theo thứ tự hoàn thành; lỗi của tác vụ được trả về dạng exception.
+        Đóng generator giữa chừng (close()) thì các tác vụ đã đẩy vào pool mà chưa chạy bị hủy."""
+        pending = {}
+        next_index = 0
+
+        try:
+            while next_index < len(items) or pending:
+                while next_index < len(items) and len(pending) < self.max_pending:
+                    pending[self._executor.submit(task, items[next_index])] = next_index
+                    next_index += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    error = future.exception()
+                    yield index, error if error is not None else future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def start(self, target: Callable[[], None]):
+        """Chạy target (vòng lặp điều phối của một job) ở thread nền riêng"""
+        threading.Thread(target=target, daemon=True).start()
+
+
+class BatchJob:
+    def __init__(self, total: int):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.results: List[Optional[Dict]] = [None] * total
+        self.completed = 0
+        self.status = 'running'
+        self.created = time.monotonic()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def set_result(self, index: int, result: Dict):
+        with self._lock:
+            self.results[index] = result
+            self.completed += 1
+
+    def finish(self, status: str = 'done'):
+        with self._lock:
+            self.status = status
+            self.finished = time.monotonic()
+
+    def to_dict(self, include_results: bool = True) -> Dict:
+        with self._lock:
+            data = {
+                'job_id': self.id,
+                'status': self.status,
+                'total': self.total,
+                'completed': self.completed
+            }
+            if include_results:
+                data['results'] = list(self.results)
+            return data
+
+
+class JobRegistry:
+    """Giữ các job theo id; job đã xong quá ttl giây (hoặc vượt max_jobs) thì bị xóa"""
+
+    def __init__(self, ttl: float = 3600.0, max_jobs: int = 100):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, BatchJob] = {}
+        self._lock = threading.Lock()
+
+    def create(self, total: int) -> Optional[BatchJob]:
+        """None khi đã có max_jobs job đang chạy"""
+        job = BatchJob(total)
+        with self._lock:
+            self._expire()
+            if len(self._jobs) >= self.max_jobs:
+                return None
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+
+        finished = sorted((job.finished, job_id) for job_id, job in self._jobs.items()
+                          if job.finished is not None)
+        while len(self._jobs) >= self.max_jobs and finished:
+            del self._jobs[finished.pop(0)[1]]
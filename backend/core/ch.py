@@ -0,0 +1,384 @@
+import glob
+import heapq
+import os
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .arrayfile import file_lock, load_arrays, save_arrays
+from .csr import CSRGraph, INF, WorkspacePool
+from .metrics import SearchStats, timed_search
+
+
+class ContractionHierarchy:
+    """Contraction Hierarchies dựng từ weights của CSRGraph (đã áp constraints).
+
+    Tiền xử lý co lần lượt từng node theo thứ tự ưu tiên và thêm shortcut khi đường
+    qua node bị co là đường ngắn nhất duy nhất. Truy vấn là Dijkstra 2 chiều chỉ đi
+    lên theo rank; shortcut được mở lại thành các edge gốc qua child1/child2.
+
+    up_*: edge u → w với rank[w] > rank[u] (search chiều đi).
+    down_*: edge w → u với rank[w] > rank[u], lưu ở hàng u (search chiều về).
+    """
+
+    # Giới hạn số node settle trong mỗi witness search; thấp hơn = tiền xử lý nhanh hơn,
+    # nhiều shortcut thừa hơn (kết quả vẫn đúng). Search còn dừng khi vượt chi phí qua node bị co
+    # nên trên bản đồ phường giới hạn này gần như không bao giờ chạm tới
+    WITNESS_SETTLE_LIMIT = 500
+    FILE_FORMAT = 2
+    # Số file hierarchy (ứng với các bộ constraints khác nhau) giữ lại trong cache
+    CACHE_KEEP = 8
+
+    def __init__(self, signature: str, node_ids: array, rank: array,
+                 up_offsets: array, up_targets: array, up_weights: array, up_edges: array,
+                 down_offsets: array, down_targets: array, down_weights: array, down_edges: array,
+                 edge_from: array, edge_to: array, edge_child1: array, edge_child2: array,
+                 workspaces: Optional[WorkspacePool] = None):
+        self.signature = signature
+        self.node_ids = node_ids
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_edges = up_edges
+        self.down_offsets = down_offsets
+        self.down_targets = down_targets
+        self.down_weights = down_weights
+        self.down_edges = down_edges
+        self.edge_from = edge_from
+        self.edge_to = edge_to
+        self.edge_child1 = edge_child1
+        self.edge_child2 = edge_child2
+        self.index: Dict[int, int] = {node_id: i for i, node_id in enumerate(node_ids)}
+        # Dùng chung pool của CSRGraph cùng topology: hierarchy mới sau mỗi lần sửa constraints
+        # không bắt thread cấp phát lại workspace
+        self._workspaces = workspaces if workspaces is not None else WorkspacePool(len(node_ids))
+
+    @property
+    def num_shortcuts(self) -> int:
+        return sum(1 for child in self.edge_child1 if child != -1)
+
+    @classmethod
+    def load_or_build(cls, csr: CSRGraph, cache_dir: str, use_mmap: bool = False) -> 'ContractionHierarchy':
+        """Đọc hierarchy từ cache nếu khớp signature của csr, nếu không thì dựng mới và lưu lại.
+
+        use_mmap=True (nhiều worker process): mảng của hierarchy là memoryview trên file cache nên
+        các worker dùng chung page cache; khóa file để chỉ một worker dựng, worker khác chờ rồi đọc.
+        """
+        signature = csr.signature()
+        path = os.path.join(cache_dir, f"ch_{signature[:16]}.bin")
+
+        with file_lock(os.path.join(cache_dir, 'ch')):
+            if os.path.exists(path):
+                try:
+                    hierarchy = cls.load(path, use_mmap, csr.workspaces)
+                    if hierarchy.signature == signature:
+                        return hierarchy
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error loading contraction hierarchy: {e}")
+
+            hierarchy = cls.build(csr)
+            try:
+                hierarchy.save(path)
+                cls._prune_cache(cache_dir)
+            except OSError as e:
+                print(f"Error saving contraction hierarchy: {e}")
+                return hierarchy
+        return cls.load(path, use_mmap, csr.workspaces) if use_mmap else hierarchy
+
+    @classmethod
+    def _prune_cache(cls, cache_dir: str):
+        files = sorted(glob.glob(os.path.join(cache_dir, 'ch_*.bin')), key=os.path.getmtime, reverse=True)
+        for old_file in files[cls.CACHE_KEEP:]:
+            os.remove(old_file)
+
+    @classmethod
+    def build(cls, csr: CSRGraph) -> 'ContractionHierarchy':
+        n = csr.num_nodes
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+
+        # Đồ thị còn lại (chỉ node chưa co): out_edges[u][w] / in_edges[w][u] = chỉ số edge
+        out_edges: List[Dict[int, int]] = [{} for _ in range(n)]
+        in_edges: List[Dict[int, int]] = [{} for _ in range(n)]
+        edge_from = array('i')
+        edge_to = array('i')
+        edge_weight = array('d')
+        edge_child1 = array('q')
+        edge_child2 = array('q')
+
+        def add_or_improve(u: int, w: int, weight: float, child1: int, child2: int):
+            existing = out_edges[u].get(w)
+            if existing is None:
+                edge = len(edge_to)
+                edge_from.append(u)
+                edge_to.append(w)
+                edge_weight.append(weight)
+                edge_child1.append(child1)
+                edge_child2.append(child2)
+                out_edges[u][w] = edge
+                in_edges[w][u] = edge
+            elif weight < edge_weight[existing]:
+                # Edge chưa được ghi vào hierarchy (cả 2 đầu chưa co) nên sửa tại chỗ
+                edge_weight[existing] = weight
+                edge_child1[existing] = child1
+                edge_child2[existing] = child2
+
+        for u in range(n):
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                if weights[slot] != INF and v != u:
+                    add_or_improve(u, v, weights[slot], -1, -1)
+
+        def witness_distances(source: int, excluded: int, max_cost: float) -> Dict[int, float]:
+            distances = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < cls.WITNESS_SETTLE_LIMIT:
+                distance, u = heapq.heappop(heap)
+                if distance > max_cost:
+                    break
+                if distance > distances[u]:
+                    continue
+                settled += 1
+                for w, edge in out_edges[u].items():
+                    if w == excluded:
+                        continue
+                    candidate = distance + edge_weight[edge]
+                    if candidate < distances.get(w, INF):
+                        distances[w] = candidate
+                        heapq.heappush(heap, (candidate, w))
+            return distances
+
+        def needed_shortcuts(v: int) -> List[Tuple[int, int, float, int, int]]:
+            shortcuts = []
+            for u, in_edge in in_edges[v].items():
+                via_costs = {w: edge_weight[in_edge] + edge_weight[out_edge]
+                             for w, out_edge in out_edges[v].items() if w != u}
+                if not via_costs:
+                    continue
+                distances = witness_distances(u, v, max(via_costs.values()))
+                for w, cost in via_costs.items():
+                    if distances.get(w, INF) > cost:
+                        shortcuts.append((u, w, cost, in_edge, out_edges[v][w]))
+            return shortcuts
+
+        deleted_neighbors = [0] * n
+
+        def priority(v: int, shortcuts: list) -> int:
+            # Shortcut tính gấp đôi: ưu tiên co node không sinh shortcut (ít shortcut hơn ~15%)
+            edge_difference = 2 * len(shortcuts) - len(in_edges[v]) - len(out_edges[v])
+            return edge_difference + deleted_neighbors[v]
+
+        heap = [(priority(v, needed_shortcuts(v)), v) for v in range(n)]
+        heapq.heapify(heap)
+
+        rank = array('i', [0]) * n
+        hierarchy_edges: List[int] = []
+        order = 0
+
+        while heap:
+            _, v = heapq.heappop(heap)
+
+            # Lazy update: tính lại ưu tiên, nếu không còn nhỏ nhất thì đẩy lại vào heap
+            shortcuts = needed_shortcuts(v)
+            current_priority = priority(v, shortcuts)
+            if heap and current_priority > heap[0][0]:
+                heapq.heappush(heap, (current_priority, v))
+                continue
+
+            hierarchy_edges.extend(in_edges[v].values())
+            hierarchy_edges.extend(out_edges[v].values())
+
+            for u, w, cost, child1, child2 in shortcuts:
+                add_or_improve(u, w, cost, child1, child2)
+
+            for u in in_edges[v]:
+                del out_edges[u][v]
+                deleted_neighbors[u] += 1
+            for w in out_edges[v]:
+                del in_edges[w][v]
+                deleted_neighbors[w] += 1
+            in_edges[v] = {}
+            out_edges[v] = {}
+
+            rank[v] = order
+            order += 1
+
+        up_rows: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        down_rows: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        for edge in hierarchy_edges:
+            u, w = edge_from[edge], edge_to[edge]
+            if rank[u] < rank[w]:
+                up_rows[u].append((w, edge_weight[edge], edge))
+            else:
+                down_rows[w].append((u, edge_weight[edge], edge))
+
+        return cls(csr.signature(), csr.node_ids, rank,
+                   *_rows_to_csr(up_rows), *_rows_to_csr(down_rows),
+                   edge_from, edge_to, edge_child1, edge_child2, csr.workspaces)
+
+    def save(self, path: str):
+        save_arrays(path, {'format': self.FILE_FORMAT, 'signature': self.signature}, {
+            'node_ids': self.node_ids,
+            'rank': self.rank,
+            'up_offsets': self.up_offsets,
+            'up_targets': self.up_targets,
+            'up_weights': self.up_weights,
+            'up_edges': self.up_edges,
+            'down_offsets': self.down_offsets,
+            'down_targets': self.down_targets,
+            'down_weights': self.down_weights,
+            'down_edges': self.down_edges,
+            'edge_from': self.edge_from,
+            'edge_to': self.edge_to,
+            'edge_child1': self.edge_child1,
+            'edge_child2': self.edge_child2
+        })
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = False,
+             workspaces: Optional[WorkspacePool] = None) -> 'ContractionHierarchy':
+        meta, arrays = load_arrays(path, use_mmap)
+        if meta.get('format') != cls.FILE_FORMAT:
+            raise ValueError(f"Unsupported contraction hierarchy format: {meta.get('format')}")
+
+        return cls(meta['signature'], arrays['node_ids'], arrays['rank'],
+                   arrays['up_offsets'], arrays['up_targets'], arrays['up_weights'], arrays['up_edges'],
+                   arrays['down_offsets'], arrays['down_targets'], arrays['down_weights'], arrays['down_edges'],
+                   arrays['edge_from'], arrays['edge_to'], arrays['edge_child1'], arrays['edge_child2'],
+                   workspaces)
+
+    @timed_search
+    def query(self, start: int, end: int,
+              stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+        source = self.index.get(start)
+        target = self.index.get(end)
+        if source is None or target is None:
+            return None, None
+        if source == target:
+            return [start], 0.0
+
+        forward = self._workspaces.get('forward')
+        backward = self._workspaces.get('backward')
+        # (workspace, generation, heap, hàng edge đi lên, hàng edge dùng để stall)
+        sides = []
+        for workspace, node, graph, stall_graph in (
+                (forward, source, self._up(), self._down()),
+                (backward, target, self._down(), self._up())):
+            generation = workspace.next_generation()
+            workspace.seen[node] = generation
+            workspace.distances[node] = 0.0
+            workspace.previous[node] = -1
+            sides.append((workspace, generation, [(0.0, node)], graph, stall_graph))
+
+        best = INF
+        meeting = -1
+        settled = pushes = pops = relaxations = 0
+
+        while True:
+            active = [side for side in sides if side[2] and side[2][0][0] < best]
+            if not active:
+                break
+            side = min(active, key=lambda s: s[2][0][0])
+            workspace, generation, heap, (offsets, targets, weights, edges), \
+                (stall_offsets, stall_targets, stall_weights, _) = side
+            other = sides[1] if side is sides[0] else sides[0]
+            other_workspace, other_generation = other[0], other[1]
+
+            distance, u = heapq.heappop(heap)
+            pops += 1
+            closed = workspace.closed
+            if closed[u] == generation:
+                continue
+            closed[u] = generation
+            settled += 1
+
+            distances, previous, seen = workspace.distances, workspace.previous, workspace.seen
+
+            if other_workspace.seen[u] == other_generation:
+                candidate = distance + other_workspace.distances[u]
+                if candidate < best:
+                    best = candidate
+                    meeting = u
+
+            # Stall-on-demand: u đến được rẻ hơn từ node rank cao hơn thì không cần mở rộng
+            stalled = False
+            for slot in range(stall_offsets[u], stall_offsets[u + 1]):
+                x = stall_targets[slot]
+                if seen[x] == generation and distances[x] + stall_weights[slot] < distance:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+
+            first, last = offsets[u], offsets[u + 1]
+            relaxations += last - first
+            for slot in range(first, last):
+                v = targets[slot]
+                candidate = distance + weights[slot]
+                if seen[v] != generation:
+                    seen[v] = generation
+                elif candidate >= distances[v]:
+                    continue
+                distances[v] = candidate
+                previous[v] = edges[slot]
+                heapq.heappush(heap, (candidate, v))
+                pushes += 1
+
+        if stats is not None:
+            stats.record(settled, pushes, pops, relaxations)
+
+        if meeting == -1:
+            return None, None
+
+        return self._unpack_path(source, meeting, forward, backward), best
+
+    def _up(self):
+        return self.up_offsets, self.up_targets, self.up_weights, self.up_edges
+
+    def _down(self):
+        return self.down_offsets, self.down_targets, self.down_weights, self.down_edges
+
+    def _unpack_path(self, source: int, meeting: int, forward, backward) -> List[int]:
+        edge_to = self.edge_to
+
+        # previous chứa chỉ số edge trong hierarchy; đi ngược từ meeting về source
+        forward_edges = []
+        node = meeting
+        while node != source:
+            edge = forward.previous[node]
+            forward_edges.append(edge)
+            node = self.edge_from[edge]
+        forward_edges.reverse()
+
+        backward_edges = []
+        edge = backward.previous[meeting]
+        while edge != -1:
+            backward_edges.append(edge)
+            edge = backward.previous[edge_to[edge]]
+
+        path = [self.node_ids[source]]
+        for edge in forward_edges + backward_edges:
+            stack = [edge]
+            while stack:
+                current = stack.pop()
+                child1 = self.edge_child1[current]
+                if child1 == -1:
+                    path.append(self.node_ids[edge_to[current]])
+                else:
+                    stack.append(self.edge_child2[current])
+                    stack.append(child1)
+        return path
+
+
+def _rows_to_csr(rows: List[List[Tuple[int, float, int]]]) -> Tuple[array, array, array, array]:
+    offsets = array('q', [0])
+    targets = array('i')
+    weights = array('d')
+    edges = array('q')
+    for row in rows:
+        for target, weight, edge in row:
+            targets.append(target)
+            weights.append(weight)
+            edges.append(edge)
+        offsets.append(len(targets))
+    return offsets, targets, weights, edges
@@ -0,0 +1,150 @@
+from array import array
+from typing import List
+
+from .csr import CSRGraph, INF
+
+
+class ComponentIndex:
+    """Nhãn thành phần liên thông theo chỉ số dày của CSRGraph, chỉ xét slot có weight hữu hạn.
+
+    labels[u]: thành phần liên thông mạnh (SCC) của u, đánh số theo thứ tự Tarjan hoàn thành
+    nên nếu SCC a tới được SCC b (a ≠ b) thì b < a. weak_labels[u]: thành phần liên thông yếu
+    (bỏ qua chiều). main: SCC nhiều node nhất, vùng mà gần như mọi truy vấn đều đi được.
+
+    Trên DAG các SCC (condensation): depths[c] là số cạnh của đường dài nhất từ c tới một SCC
+    không có cạnh ra, lows[c] là nhãn nhỏ nhất trong các SCC tới được từ c (kể cả c). a tới được
+    b thì depths[a] > depths[b] và lows[a] <= lows[b] <= b < a; vi phạm một điều kiện là loại
+    trừ được ngay, không cần search.
+    """
+
+    def __init__(self, labels: array, sizes: List[int], weak_labels: array,
+                 depths: array, lows: array):
+        self.labels = labels
+        self.sizes = sizes
+        self.weak_labels = weak_labels
+        self.depths = depths
+        self.lows = lows
+        self.main = max(range(len(sizes)), key=sizes.__getitem__) if sizes else -1
+
+    @property
+    def num_components(self) -> int:
+        return len(self.sizes)
+
+    @classmethod
+    def build(cls, csr: CSRGraph) -> 'ComponentIndex':
+        n = csr.num_nodes
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+
+        # Tarjan dạng lặp: call_stack giữ (node, slot tiếp theo cần xét)
+        order = array('i', [-1]) * n
+        low = array('i', [0]) * n
+        on_stack = bytearray(n)
+        labels = array('i', [-1]) * n
+        sizes: List[int] = []
+        stack: List[int] = []
+        counter = 0
+
+        for root in range(n):
+            if order[root] != -1:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            call_stack = [(root, offsets[root])]
+
+            while call_stack:
+                u, slot = call_stack[-1]
+                last = offsets[u + 1]
+                while slot < last:
+                    v = targets[slot]
+                    if weights[slot] != INF:
+                        if order[v] == -1:
+                            break
+                        if on_stack[v] and order[v] < low[u]:
+                            low[u] = order[v]
+                    slot += 1
+
+                if slot < last:
+                    call_stack[-1] = (u, slot + 1)
+                    v = targets[slot]
+                    order[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = 1
+                    call_stack.append((v, offsets[v]))
+                    continue
+
+                call_stack.pop()
+                if call_stack:
+                    parent = call_stack[-1][0]
+                    if low[u] < low[parent]:
+                        low[parent] = low[u]
+                if low[u] == order[u]:
+                    label = len(sizes)
+                    size = 0
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        labels[w] = label
+                        size += 1
+                        if w == u:
+                            break
+                    sizes.append(size)
+
+        # Liên thông yếu: BFS qua slot đi được theo ít nhất một chiều
+        reverse_weights = csr.reverse_weights
+        weak_labels = array('i', [-1]) * n
+        weak_count = 0
+        for root in range(n):
+            if weak_labels[root] != -1:
+                continue
+            weak_labels[root] = weak_count
+            queue = [root]
+            for u in queue:
+                for slot in range(offsets[u], offsets[u + 1]):
+                    v = targets[slot]
+                    if weak_labels[v] == -1 and (weights[slot] != INF or reverse_weights[slot] != INF):
+                        weak_labels[v] = weak_count
+                        queue.append(v)
+            weak_count += 1
+
+        depths, lows = cls._condensation_labels(csr, labels, len(sizes))
+        return cls(labels, sizes, weak_labels, depths, lows)
+
+    @staticmethod
+    def _condensation_labels(csr: CSRGraph, labels: array, count: int):
+        """depths/lows theo thứ tự nhãn tăng dần: SCC kề của c luôn có nhãn nhỏ hơn nên đã xong"""
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        members: List[List[int]] = [[] for _ in range(count)]
+        for u in range(csr.num_nodes):
+            members[labels[u]].append(u)
+
+        depths = array('i', [0]) * count
+        lows = array('i', range(count))
+        for c in range(count):
+            depth, low = 0, c
+            for u in members[c]:
+                for slot in range(offsets[u], offsets[u + 1]):
+                    d = labels[targets[slot]]
+                    if d != c and weights[slot] != INF:
+                        if depths[d] >= depth:
+                            depth = depths[d] + 1
+                        if lows[d] < low:
+                            low = lows[d]
+            depths[c] = depth
+            lows[c] = low
+        return depths, lows
+
+    def can_reach(self, source: int, target: int) -> bool:
+        """False: chắc chắn không có đường source → target. True: cùng SCC (chắc chắn có đường)
+        hoặc chưa loại trừ được, khi đó search quyết định."""
+        if self.weak_labels[source] != self.weak_labels[target]:
+            return False
+        a, b = self.labels[source], self.labels[target]
+        if a == b:
+            return True
+        return a > b and self.depths[a] > self.depths[b] and self.lows[a] <= self.lows[b]
+
+    def in_main(self, u: int) -> bool:
+        return self.labels[u] == self.main
@@ -1,10 +1,20 @@
 import csv
+import json
 import os
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
+
+FIELDNAMES = ['edge_id', 'constraint_type', 'value', 'description']
 
 class ConstraintsManager:
-    def __init__(self, csv_path: str):
+    # Số dòng trong change log trước khi gộp lại vào CSV
+    JOURNAL_COMPACT_THRESHOLD = 500
+
+    def __init__(self, csv_path: str, use_journal: bool = False):
         self.csv_path = csv_path
+        # use_journal: mỗi thay đổi chỉ append vào <csv>.log, CSV được ghi lại khi log đủ dài
+        self.use_journal = use_journal
+        self.journal_path = csv_path + '.log'
+        self.journal_entries = 0
         self.constraints: Dict[int, Dict] = {}
         self.load_constraints()
 
@@ -31,28 +41,117 @@ class ConstraintsManager:
                             'value': row.get('value', ''),
                             'description': row.get('description', '')
                         }
-            return list(self.constraints.values())
         except Exception as e:
             print(f"Error loading constraints: {e}")
             return []
 
+        self._replay_journal()
+        return list(self.constraints.values())
+
+    def _replay_journal(self):
+        """Áp các thay đổi trong change log (ghi sau lần gộp gần nhất) lên dữ liệu từ CSV"""
+        self.journal_entries = 0
+        if not os.path.exists(self.journal_path):
+            return
+
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Dòng cuối ghi dở khi tiến trình bị dừng
+                        continue
+                    self._apply_entry(entry, self.constraints)
+                    self.journal_entries += 1
+        except Exception as e:
+            print(f"Error replaying constraints log: {e}")
+
+    @staticmethod
+    def _apply_entry(entry: Dict, constraints: Dict[int, Dict]):
+        op = entry.get('op')
+        if op == 'set':
+            constraint = entry['constraint']
+            constraints[int(constraint['edge_id'])] = constraint
+        elif op == 'remove':
+            constraints.pop(int(entry['edge_id']), None)
+        elif op == 'clear':
+            constraints.clear()
+
     def _create_empty_csv(self):
         try:
             with open(self.csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=['edge_id', 'constraint_type', 'value', 'description'])
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
                 writer.writeheader()
         except Exception as e:
             print(f"Error creating constraints CSV: {e}")
 
-    def _save_constraints(self):
+    def _save_constraints(self, constraints: Optional[Dict[int, Dict]] = None):
+        """Ghi toàn bộ constraints (mặc định self.constraints) ra file tạm rồi os.replace,
+        người đọc không bao giờ thấy file ghi dở"""
+        if constraints is None:
+            constraints = self.constraints
+        tmp_path = f"{self.csv_path}.tmp{os.getpid()}"
         try:
-            with open(self.csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=['edge_id', 'constraint_type', 'value', 'description'])
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
                 writer.writeheader()
-                for constraint in self.constraints.values():
+                for constraint in constraints.values():
                     writer.writerow(constraint)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.csv_path)
         except Exception as e:
             print(f"Error saving constraints: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _commit(self, entries: List[Dict]):
+        """Áp một lô thay đổi lên bản sao, lưu xuống file rồi mới thay self.constraints:
+        ghi file lỗi (exception) thì dữ liệu trong bộ nhớ vẫn khớp với file"""
+        if not entries:
+            return
+
+        updated = dict(self.constraints)
+        for entry in entries:
+            self._apply_entry(entry, updated)
+
+        if not self.use_journal:
+            self._save_constraints(updated)
+            self.constraints = updated
+            return
+
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        # Từ đây thay đổi đã nằm trong change log
+        self.constraints = updated
+        self.journal_entries += len(entries)
+
+        if self.journal_entries >= self.JOURNAL_COMPACT_THRESHOLD:
+            try:
+                self.compact()
+            except Exception as e:
+                # Log vẫn còn nguyên nên không mất gì, lần ghi sau sẽ thử gộp lại
+                print(f"Error compacting constraints log: {e}")
+
+    def compact(self):
+        """Gộp change log vào CSV rồi xóa log"""
+        self._save_constraints()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_entries = 0
+
+    @staticmethod
+    def _set_entry(edge_id: int, constraint_type: str, value: str, description: str = "") -> Dict:
+        return {'op': 'set', 'constraint': {
+            'edge_id': edge_id,
+            'constraint_type': constraint_type,
+            'value': value,
+            'description': description
+        }}
 
     def add_constraint(self, edge_id: int, constraint_type: str, value: str, description: str = "") -> bool:
         try:
@@ -63,38 +162,38 @@ class ConstraintsManager:
                 # (Phần này cần được thêm từ bên ngoài hoặc tham chiếu đến edges_data)
                 pass
             
-            self.constraints[edge_id] = {
-                'edge_id': edge_id,
-                'constraint_type': constraint_type,
-                'value': value,
-                'description': description
-            }
-            self._save_constraints()
+            self._commit([self._set_entry(edge_id, constraint_type, value, description)])
             return True
         except Exception as e:
             print(f"Error adding constraint: {e}")
             return False
 
     def add_constraints_batch(self, constraints: List[Dict]) -> bool:
+        """Thêm nhiều constraints nhưng chỉ ghi file một lần cho cả lô"""
         try:
-            for constraint in constraints:
-                self.add_constraint(
+            entries = [
+                self._set_entry(
                     edge_id=constraint['edge_id'],
                     constraint_type=constraint['constraint_type'],
                     value=constraint['value'],
                     description=constraint.get('description', '')
                 )
-            self._save_constraints()
+                for constraint in constraints
+            ]
+            self._commit(entries)
             return True
         except Exception as e:
             print(f"Error adding batch constraints: {e}")
             return False
 
     def remove_constraint(self, edge_id: int) -> bool:
+        return self.remove_constraints_batch([edge_id])
+
+    def remove_constraints_batch(self, edge_ids: Iterable[int]) -> bool:
         try:
-            if edge_id in self.constraints:
-                del self.constraints[edge_id]
-                self._save_constraints()
+            entries = [{'op': 'remove', 'edge_id': edge_id}
+                       for edge_id in dict.fromkeys(edge_ids) if edge_id in self.constraints]
+            self._commit(entries)
             return True
         except Exception as e:
             print(f"Error removing constraint: {e}")
@@ -102,13 +201,33 @@ class ConstraintsManager:
 
     def clear_all_constraints(self) -> bool:
         try:
-            self.constraints.clear()
-            self._save_constraints()
+            if self.use_journal:
+                # Ghi 'clear' vào log trước; CSV rỗng là trạng thái gọn nhất nên gộp luôn (nếu lỗi,
+                # log vẫn đủ để đọc lại đúng)
+                self._commit([{'op': 'clear'}])
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"Error compacting constraints log: {e}")
+            else:
+                self._save_constraints({})
+                self.constraints = {}
             return True
         except Exception as e:
             print(f"Error clearing constraints: {e}")
             return False
 
+    def apply_synced_changes(self, changes: Dict[int, Optional[Dict]]):
+        """Cập nhật bộ nhớ theo thay đổi mà process khác đã ghi xuống file (không ghi lại file);
+        changes: edge_id → constraint mới, None nếu đã xóa"""
+        updated = dict(self.constraints)
+        for edge_id, constraint in changes.items():
+            if constraint is None:
+                self._apply_entry({'op': 'remove', 'edge_id': edge_id}, updated)
+            else:
+                self._apply_entry({'op': 'set', 'constraint': constraint}, updated)
+        self.constraints = updated
+
     def get_constraint_by_edge(self, edge_id: int) -> Optional[Dict]:
         return self.constraints.get(edge_id)
 
@@ -0,0 +1,441 @@
+import glob
+import heapq
+import math
+import os
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from .algorithms import haversine_heuristic
+from .arrayfile import ArrayLike, file_lock, load_arrays, save_arrays
+from .csr import CSRGraph, INF, SearchWorkspace
+from .metrics import SearchStats, timed_search
+
+
+class CellPartition:
+    """Phân hoạch nhiều mức bằng kd-bisection theo tọa độ, không phụ thuộc weights.
+
+    Chỉ dựa vào topology và tọa độ của CSRGraph nên dựng một lần và dùng chung cho mọi bộ
+    constraints. Mức 0 gồm các cell nhỏ nhất (≤ MAX_CELL_SIZE node); mỗi cell mức l + 1 là hợp
+    của các cell mức l (lớn hơn khoảng FANOUT lần). Boundary node mức l là node có slot (kể cả
+    slot weight = inf) sang cell mức l khác, nên boundary mức l + 1 ⊂ boundary mức l.
+
+    cell_of[l][u]: cell mức l của node u; boundary[l][c]: boundary node của cell c ở mức l;
+    boundary_position[l][u]: vị trí của u trong boundary[l][cell_of[l][u]], -1 nếu không phải boundary;
+    edge_cells[edge_id] = (mức thấp nhất mà 2 đầu edge cùng cell, một đầu của edge).
+    """
+
+    MAX_CELL_SIZE = 64
+    FANOUT = 8
+
+    def __init__(self, offsets: array, cell_of: List[ArrayLike], boundary: List[List[ArrayLike]],
+                 boundary_position: List[ArrayLike], edge_cells: Union[Dict[int, Tuple[int, int]], 'PackedEdgeCells']):
+        self.offsets = offsets
+        self.cell_of = cell_of
+        self.boundary = boundary
+        self.boundary_position = boundary_position
+        self.edge_cells = edge_cells
+
+    @property
+    def num_levels(self) -> int:
+        return len(self.cell_of)
+
+    def num_cells(self, level: int = 0) -> int:
+        return len(self.boundary[level])
+
+    def num_boundary_nodes(self, level: int = 0) -> int:
+        return sum(len(nodes) for nodes in self.boundary[level])
+
+    @classmethod
+    def build(cls, csr: CSRGraph, max_cell_size: Optional[int] = None,
+              fanout: Optional[int] = None) -> 'CellPartition':
+        max_cell_size = max_cell_size or cls.MAX_CELL_SIZE
+        fanout = fanout or cls.FANOUT
+        n = csr.num_nodes
+        lats, lons = csr.lats, csr.lons
+        lon_scale = math.cos(math.radians(sum(lats) / n)) if n else 1.0
+
+        # Kích thước tối đa của cell từng mức; mức cao nhất vẫn có ít nhất 2 cell
+        limits = [max_cell_size]
+        while limits[-1] * fanout < n:
+            limits.append(limits[-1] * fanout)
+        num_levels = len(limits)
+
+        cell_of = [array('i', [0]) * n for _ in range(num_levels)]
+        num_cells = [0] * num_levels
+
+        # Chia đôi theo trung vị của chiều (lat/lon quy ra cùng đơn vị) dài hơn; nhóm đủ nhỏ
+        # cho mức l thành một cell mức l rồi tiếp tục chia cho mức l - 1
+        pending = [(list(range(n)), num_levels - 1)] if n else []
+        while pending:
+            members, level = pending.pop()
+            if len(members) <= limits[level]:
+                cell = num_cells[level]
+                num_cells[level] += 1
+                for u in members:
+                    cell_of[level][u] = cell
+                if level > 0:
+                    pending.append((members, level - 1))
+                continue
+            lat_span = max(lats[u] for u in members) - min(lats[u] for u in members)
+            lon_span = (max(lons[u] for u in members) - min(lons[u] for u in members)) * lon_scale
+            coordinate = lats if lat_span >= lon_span else lons
+            members.sort(key=coordinate.__getitem__)
+            middle = len(members) // 2
+            pending.append((members[middle:], level))
+            pending.append((members[:middle], level))
+
+        offsets, targets, edge_ids = csr.offsets, csr.targets, csr.edge_ids
+        boundary_position = [array('i', [-1]) * n for _ in range(num_levels)]
+        boundary = [[array('i') for _ in range(num_cells[level])] for level in range(num_levels)]
+        edge_cells: Dict[int, Tuple[int, int]] = {}
+        for u in range(n):
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                level = 0
+                while level < num_levels and cell_of[level][u] != cell_of[level][v]:
+                    if boundary_position[level][u] == -1:
+                        cell = cell_of[level][u]
+                        boundary_position[level][u] = len(boundary[level][cell])
+                        boundary[level][cell].append(u)
+                    level += 1
+                if level < num_levels:
+                    edge_cells[edge_ids[slot]] = (level, u)
+
+        return cls(offsets, cell_of, boundary, boundary_position, edge_cells)
+
+    def to_arrays(self) -> Dict[str, ArrayLike]:
+        """Mảng phẳng theo từng mức (cell_of_l, boundary_position_l, boundary_l + boundary_offsets_l)
+        và edge_cells theo edge_id tăng dần, đọc lại bằng from_arrays"""
+        arrays: Dict[str, ArrayLike] = {}
+        for level in range(self.num_levels):
+            arrays[f"cell_of_{level}"] = self.cell_of[level]
+            arrays[f"boundary_position_{level}"] = self.boundary_position[level]
+            arrays[f"boundary_{level}"], arrays[f"boundary_offsets_{level}"] = _pack_rows(self.boundary[level], 'i')
+        edge_ids = sorted(self.edge_cells)
+        arrays['edge_cell_ids'] = array('q', edge_ids)
+        arrays['edge_cell_levels'] = array('i', (self.edge_cells[edge_id][0] for edge_id in edge_ids))
+        arrays['edge_cell_nodes'] = array('i', (self.edge_cells[edge_id][1] for edge_id in edge_ids))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, csr: CSRGraph, num_levels: int, arrays: Dict[str, ArrayLike]) -> 'CellPartition':
+        """Partition đã lưu của csr (cùng topology); các mảng dùng nguyên, không copy"""
+        return cls(csr.offsets,
+                   [arrays[f"cell_of_{level}"] for level in range(num_levels)],
+                   [_unpack_rows(arrays[f"boundary_{level}"], arrays[f"boundary_offsets_{level}"])
+                    for level in range(num_levels)],
+                   [arrays[f"boundary_position_{level}"] for level in range(num_levels)],
+                   PackedEdgeCells(arrays['edge_cell_ids'], arrays['edge_cell_levels'], arrays['edge_cell_nodes']))
+
+    def matches(self, csr: CSRGraph) -> bool:
+        # Bản copy()/with_weights() của csr dùng chung mảng topology
+        return csr.offsets is self.offsets
+
+    def cells_of_edges(self, edge_ids: Iterable[int]) -> List[Set[int]]:
+        """Theo từng mức, các cell có clique phụ thuộc weights của edge_ids"""
+        cells: List[Set[int]] = [set() for _ in range(self.num_levels)]
+        for edge_id in edge_ids:
+            entry = self.edge_cells.get(edge_id)
+            if entry is None:
+                continue
+            lowest, u = entry
+            for level in range(lowest, self.num_levels):
+                cells[level].add(self.cell_of[level][u])
+        return cells
+
+
+class PackedEdgeCells:
+    """edge_cells của CellPartition trên mảng đã lưu: tra edge_id bằng tìm nhị phân"""
+
+    def __init__(self, edge_ids: Sequence[int], levels: Sequence[int], nodes: Sequence[int]):
+        self.edge_ids = edge_ids
+        self.levels = levels
+        self.nodes = nodes
+
+    def get(self, edge_id: int, default=None):
+        i = bisect_left(self.edge_ids, edge_id)
+        if i == len(self.edge_ids) or self.edge_ids[i] != edge_id:
+            return default
+        return self.levels[i], self.nodes[i]
+
+    def __iter__(self):
+        return iter(self.edge_ids)
+
+    def __getitem__(self, edge_id: int) -> Tuple[int, int]:
+        entry = self.get(edge_id)
+        if entry is None:
+            raise KeyError(edge_id)
+        return entry
+
+
+class CellOverlay:
+    """Overlay kiểu multilevel Dijkstra / CRP: partition cố định + clique của từng cell theo weights hiện tại.
+
+    cliques[l][c][i * k + j] = đường ngắn nhất trong cell c mức l từ boundary[l][c][i] tới
+    boundary[l][c][j] (k = số boundary node). Clique mức 0 tính trên edge gốc, clique mức l
+    tính trên overlay mức l - 1 bên trong cell. Khi constraints đổi chỉ tính lại clique của các
+    cell chứa edge bị đổi (từ dưới lên), clique của cell khác dùng chung với overlay cũ.
+
+    Truy vấn là A* (heuristic haversine) trong đó mỗi node u dùng mức cao nhất mà cell của u không chứa start
+    hay end: đi clique của cell đó và các edge sang cell khác cùng mức. Trong cell mức 0 của
+    start/end thì đi từng edge gốc. Arc clique mức l được mở lại bằng search trong cell ở mức l - 1.
+    """
+
+    FILE_FORMAT = 1
+    # Số overlay (ứng với các bộ constraints khác nhau) giữ lại trong cache
+    CACHE_KEEP = 8
+
+    def __init__(self, partition: CellPartition, csr: CSRGraph, cliques: List[List[ArrayLike]]):
+        self.partition = partition
+        self.csr = csr
+        self.cliques = cliques
+
+    @classmethod
+    def build(cls, csr: CSRGraph, partition: Optional[CellPartition] = None) -> 'CellOverlay':
+        """Customize toàn bộ; partition chỉ được dựng khi chưa có (hoặc topology khác)"""
+        if partition is None or not partition.matches(csr):
+            partition = CellPartition.build(csr)
+        overlay = cls(partition, csr, [[] for _ in range(partition.num_levels)])
+        for level in range(partition.num_levels):
+            overlay.cliques[level] = [overlay._cell_clique(level, cell)
+                                      for cell in range(partition.num_cells(level))]
+        return overlay
+
+    @classmethod
+    def load_or_build(cls, csr: CSRGraph, cache_dir: str, use_mmap: bool = False) -> 'CellOverlay':
+        """Như ContractionHierarchy.load_or_build: partition và clique của signature csr lưu chung
+        một file; use_mmap=True để các worker process dùng chung. Overlay customize sau đó (khi
+        constraints đổi) chỉ có clique của cell bị đổi là bản riêng của process."""
+        signature = csr.signature()
+        path = os.path.join(cache_dir, f"crp_{signature[:16]}.bin")
+
+        with file_lock(os.path.join(cache_dir, 'crp')):
+            if os.path.exists(path):
+                try:
+                    overlay = cls.load(path, csr, use_mmap)
+                    if overlay is not None:
+                        return overlay
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error loading cell overlay: {e}")
+
+            overlay = cls.build(csr)
+            try:
+                overlay.save(path)
+                cls._prune_cache(cache_dir)
+            except OSError as e:
+                print(f"Error saving cell overlay: {e}")
+                return overlay
+        return (cls.load(path, csr, use_mmap) or overlay) if use_mmap else overlay
+
+    @classmethod
+    def _prune_cache(cls, cache_dir: str):
+        files = sorted(glob.glob(os.path.join(cache_dir, 'crp_*.bin')), key=os.path.getmtime, reverse=True)
+        for old_file in files[cls.CACHE_KEEP:]:
+            os.remove(old_file)
+
+    def save(self, path: str):
+        partition = self.partition
+        arrays = partition.to_arrays()
+        for level in range(partition.num_levels):
+            arrays[f"clique_{level}"], arrays[f"clique_offsets_{level}"] = _pack_rows(self.cliques[level], 'd')
+        save_arrays(path, {'format': self.FILE_FORMAT, 'signature': self.csr.signature(),
+                           'num_levels': partition.num_levels}, arrays)
+
+    @classmethod
+    def load(cls, path: str, csr: CSRGraph, use_mmap: bool = False) -> Optional['CellOverlay']:
+        """Overlay đã lưu cho csr; None nếu file thuộc signature khác"""
+        meta, arrays = load_arrays(path, use_mmap)
+        if meta.get('format') != cls.FILE_FORMAT:
+            raise ValueError(f"Unsupported cell overlay format: {meta.get('format')}")
+        if meta['signature'] != csr.signature():
+            return None
+        num_levels = meta['num_levels']
+        return cls(CellPartition.from_arrays(csr, num_levels, arrays), csr,
+                   [_unpack_rows(arrays[f"clique_{level}"], arrays[f"clique_offsets_{level}"])
+                    for level in range(num_levels)])
+
+    def customize(self, csr: CSRGraph, edge_ids: Iterable[int]) -> 'CellOverlay':
+        """Overlay mới cho csr (cùng topology, chỉ weights của edge_ids khác); overlay cũ không bị sửa"""
+        if not self.partition.matches(csr):
+            return CellOverlay.build(csr)
+        overlay = CellOverlay(self.partition, csr, [list(cliques) for cliques in self.cliques])
+        for level, cells in enumerate(self.partition.cells_of_edges(edge_ids)):
+            for cell in cells:
+                overlay.cliques[level][cell] = overlay._cell_clique(level, cell)
+        return overlay
+
+    @timed_search
+    def query(self, start: int, end: int,
+              stats: Optional[SearchStats] = None) -> Tuple[Optional[List[int]], Optional[float]]:
+        csr = self.csr
+        source = csr.index.get(start)
+        target = csr.index.get(end)
+        if source is None or target is None:
+            return None, None
+        if source == target:
+            return [start], 0.0
+
+        cell_of = self.partition.cell_of
+        top = self.partition.num_levels - 1
+        source_cells = [cells[source] for cells in cell_of]
+        target_cells = [cells[target] for cells in cell_of]
+
+        def level_of(u: int) -> int:
+            # Cell khác cell của start/end ở mức l thì cũng khác ở mọi mức thấp hơn
+            for level in range(top, -1, -1):
+                cell = cell_of[level][u]
+                if cell != source_cells[level] and cell != target_cells[level]:
+                    return level
+            return -1
+
+        workspace = csr.workspace()
+        heuristic = haversine_heuristic(csr, target)
+        generation = self._search(workspace, source, target, level_of, None, heuristic, stats)
+        if workspace.closed[target] != generation:
+            return None, None
+
+        path = self._expand(workspace, source, target, level_of)
+        node_ids = csr.node_ids
+        return [node_ids[u] for u in path], workspace.distances[target]
+
+    def _search(self, workspace: SearchWorkspace, source: int, target: int,
+                level_of: Callable[[int], int], within: Optional[Tuple[int, int]],
+                heuristic: Optional[Callable[[int], float]] = None,
+                stats: Optional[SearchStats] = None) -> int:
+        """Dijkstra (A* nếu có heuristic) trên overlay; level_of(u) = mức clique dùng tại u (-1: edge gốc),
+        within = (mức, cell) giới hạn search trong một cell. Trả về generation của workspace.
+        Heuristic haversine vẫn nhất quán trên arc clique vì clique không ngắn hơn đường thẳng.
+        previous[v] = u khi tới v bằng edge, -2 - u khi tới bằng arc clique u → v."""
+        partition = self.partition
+        cell_of, boundary, boundary_position = partition.cell_of, partition.boundary, partition.boundary_position
+        offsets, targets, weights = self.csr.offsets, self.csr.targets, self.csr.weights
+        within_cells, within_cell = (cell_of[within[0]], within[1]) if within is not None else (None, -1)
+
+        generation = workspace.next_generation()
+        distances, previous = workspace.distances, workspace.previous
+        seen, closed = workspace.seen, workspace.closed
+
+        seen[source] = generation
+        distances[source] = 0.0
+        previous[source] = -1
+
+        heap = [(0.0, source)]
+        settled = pushes = relaxations = 0
+
+        while heap:
+            _, u = heapq.heappop(heap)
+            if closed[u] == generation:
+                continue
+            closed[u] = generation
+            settled += 1
+
+            if u == target:
+                break
+
+            distance = distances[u]
+            level = level_of(u)
+            if level >= 0:
+                # u là boundary node mức level: tới các boundary node khác của cell qua clique
+                cells = cell_of[level]
+                cell = cells[u]
+                members = boundary[level][cell]
+                clique = self.cliques[level][cell]
+                k = len(members)
+                row = boundary_position[level][u] * k
+                relaxations += k
+                for j in range(k):
+                    candidate = distance + clique[row + j]
+                    v = members[j]
+                    if seen[v] != generation:
+                        if candidate == INF:
+                            continue
+                        seen[v] = generation
+                    elif candidate >= distances[v]:
+                        continue
+                    distances[v] = candidate
+                    previous[v] = -2 - u
+                    heapq.heappush(heap, (candidate + heuristic(v) if heuristic is not None else candidate, v))
+                    pushes += 1
+
+            first, last = offsets[u], offsets[u + 1]
+            relaxations += last - first
+            for slot in range(first, last):
+                v = targets[slot]
+                # Edge bên trong cell đã nằm trong clique, chỉ đi edge sang cell khác cùng mức
+                if level >= 0 and cells[v] == cell:
+                    continue
+                if within_cells is not None and within_cells[v] != within_cell:
+                    continue
+                candidate = distance + weights[slot]
+                if seen[v] != generation:
+                    if candidate == INF:
+                        continue
+                    seen[v] = generation
+                elif candidate >= distances[v]:
+                    continue
+                distances[v] = candidate
+                previous[v] = u
+                heapq.heappush(heap, (candidate + heuristic(v) if heuristic is not None else candidate, v))
+                pushes += 1
+
+        if stats is not None:
+            stats.record(settled, pushes, 1 + pushes - len(heap), relaxations)
+        return generation
+
+    def _expand(self, workspace: SearchWorkspace, source: int, target: int,
+                level_of: Callable[[int], int]) -> List[int]:
+        """Đường đi (chỉ số node) từ kết quả _search, mở lại mọi arc clique thành edge gốc"""
+        # Đọc hết previous trước khi mở arc clique (search trong cell dùng workspace khác)
+        arcs = []
+        v = target
+        while v != source:
+            u = workspace.previous[v]
+            if u >= 0:
+                arcs.append((u, v, -1))
+            else:
+                u = -2 - u
+                arcs.append((u, v, level_of(u)))
+            v = u
+        arcs.reverse()
+
+        path = [source]
+        for u, v, level in arcs:
+            if level < 0:
+                path.append(v)
+            else:
+                path.extend(self._unpack(level, u, v)[1:])
+        return path
+
+    def _unpack(self, level: int, source: int, target: int) -> List[int]:
+        """Đường đi trong cell mức level ứng với arc clique source → target"""
+        workspace = self.csr.workspace(f"cell{level}")
+        within = (level, self.partition.cell_of[level][source])
+        self._search(workspace, source, target, lambda u: level - 1, within)
+        return self._expand(workspace, source, target, lambda u: level - 1)
+
+    def _cell_clique(self, level: int, cell: int) -> array:
+        members = self.partition.boundary[level][cell]
+        k = len(members)
+        clique = array('d', [INF]) * (k * k)
+        workspace = self.csr.workspace(f"cell{level}")
+        for i, u in enumerate(members):
+            generation = self._search(workspace, u, -1, lambda x: level - 1, (level, cell))
+            for j, v in enumerate(members):
+                if workspace.closed[v] == generation:
+                    clique[i * k + j] = workspace.distances[v]
+        return clique
+
+
+def _pack_rows(rows: List[ArrayLike], typecode: str) -> Tuple[array, array]:
+    """List các mảng → (items nối liền, offsets): hàng i là items[offsets[i]:offsets[i + 1]]"""
+    items = array(typecode)
+    offsets = array('q', [0])
+    for row in rows:
+        items.extend(row)
+        offsets.append(len(items))
+    return items, offsets
+
+
+def _unpack_rows(items: ArrayLike, offsets: ArrayLike) -> List[ArrayLike]:
+    return [items[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
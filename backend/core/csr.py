@@ -0,0 +1,307 @@
+import hashlib
+import heapq
+import math
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .geometry import haversine_distance
+
+INF = float('inf')
+
+
+class SearchWorkspace:
+    """Mảng trạng thái search cấp phát một lần và dùng lại giữa các truy vấn.
+
+    Thay vì khởi tạo lại O(V) phần tử, mỗi truy vấn tăng generation; node i chỉ
+    có giá trị hợp lệ trong distances/previous khi seen[i] == generation, và đã
+    settle khi closed[i] == generation.
+    """
+
+    def __init__(self, num_nodes: int):
+        self.distances: List[float] = [INF] * num_nodes
+        self.previous: List[int] = [-1] * num_nodes
+        self.seen: List[int] = [0] * num_nodes
+        self.closed: List[int] = [0] * num_nodes
+        self.generation = 0
+
+    def next_generation(self) -> int:
+        self.generation += 1
+        return self.generation
+
+
+class WorkspacePool:
+    """Workspace riêng cho từng thread (và từng chiều search khi cần 2 workspace cùng lúc)"""
+
+    def __init__(self, num_nodes: int):
+        self.num_nodes = num_nodes
+        self._local = threading.local()
+
+    def get(self, name: str = 'forward') -> SearchWorkspace:
+        workspaces = getattr(self._local, 'items', None)
+        if workspaces is None:
+            workspaces = self._local.items = {}
+
+        workspace = workspaces.get(name)
+        if workspace is None:
+            workspace = workspaces[name] = SearchWorkspace(self.num_nodes)
+        return workspace
+
+
+class CSRGraph:
+    """Adjacency dạng compressed sparse row: các mảng liên tục thay cho dict/list/tuple.
+
+    Node id được ánh xạ sang chỉ số dày 0..n-1. Hàng của node u là các slot
+    offsets[u]..offsets[u+1]-1 trong targets/edge_ids/weights. Mỗi edge luôn có
+    đủ 2 slot (from→to và to→from); chiều không được đi có weight = inf, nên cấu
+    trúc chỉ phụ thuộc topology còn constraints chỉ thay đổi weights.
+
+    twins[slot] là slot của cùng edge theo chiều ngược lại. Đồ thị ngược (dùng cho
+    search chiều về) có cùng offsets/targets, chỉ khác reverse_weights[slot] =
+    weights[twins[slot]].
+    """
+
+    def __init__(self, node_ids: array, lats: array, lons: array,
+                 offsets: array, targets: array, edge_ids: array, weights: array,
+                 twins: array, reverse_weights: Optional[array] = None):
+        self.node_ids = node_ids
+        self.lats = lats
+        self.lons = lons
+        self.offsets = offsets
+        self.targets = targets
+        self.edge_ids = edge_ids
+        self.weights = weights
+        self.twins = twins
+        # reverse_weights cho sẵn (vd. đọc từ snapshot) phải khớp weights theo twins
+        self.reverse_weights = (reverse_weights if reverse_weights is not None
+                                else array('d', (weights[twin] for twin in twins)))
+        self._heuristic_scale: Optional[float] = None
+        self._signature: Optional[str] = None
+        self._radians: Optional[Tuple[array, array, array]] = None
+        self.index: Dict[int, int] = {node_id: i for i, node_id in enumerate(node_ids)}
+        self._workspaces = WorkspacePool(len(node_ids))
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_slots(self) -> int:
+        return len(self.targets)
+
+    @classmethod
+    def from_road_graph(cls, graph) -> 'CSRGraph':
+        node_ids = array('q', sorted(graph.nodes))
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        n = len(node_ids)
+
+        edges = [(edge_id, index[edge['from_node']], index[edge['to_node']])
+                 for edge_id, edge in graph.edges.items()
+                 if edge['from_node'] in index and edge['to_node'] in index]
+
+        degree = [0] * n
+        for _, u, v in edges:
+            degree[u] += 1
+            degree[v] += 1
+
+        offsets = array('q', [0]) * (n + 1)
+        for i in range(n):
+            offsets[i + 1] = offsets[i] + degree[i]
+
+        num_slots = offsets[n]
+        targets = array('i', [0]) * num_slots
+        edge_ids = array('q', [0]) * num_slots
+        weights = array('d', [INF]) * num_slots
+        twins = array('q', [0]) * num_slots
+
+        cursor = list(offsets[:n])
+        for edge_id, u, v in edges:
+            # Chi phí đã áp constraints (block/oneway/penalty), None → inf
+            forward_cost, backward_cost = graph.edge_direction_costs(edge_id)
+            forward_slot = cursor[u]
+            cursor[u] += 1
+            backward_slot = cursor[v]
+            cursor[v] += 1
+
+            for slot, b, cost, twin in ((forward_slot, v, forward_cost, backward_slot),
+                                        (backward_slot, u, backward_cost, forward_slot)):
+                targets[slot] = b
+                edge_ids[slot] = edge_id
+                twins[slot] = twin
+                if cost is not None:
+                    weights[slot] = cost
+
+        lats = array('d', (graph.nodes[node_id][0] for node_id in node_ids))
+        lons = array('d', (graph.nodes[node_id][1] for node_id in node_ids))
+
+        return cls(node_ids, lats, lons, offsets, targets, edge_ids, weights, twins)
+
+    def copy(self) -> 'CSRGraph':
+        """Bản sao chỉ copy weights; topology, tọa độ, index và workspace dùng chung (workspace
+        chỉ phụ thuộc số node và là riêng từng thread, nên sau mỗi lần sửa constraints thread
+        không phải cấp phát lại mảng O(V))"""
+        clone = CSRGraph.__new__(CSRGraph)
+        clone.__dict__.update(self.__dict__)
+        clone.weights = array('d', self.weights)
+        clone.reverse_weights = array('d', self.reverse_weights)
+        return clone
+
+    def with_weights(self, weights: array, reverse_weights: array,
+                     heuristic_scale: Optional[float] = None) -> 'CSRGraph':
+        """Cùng topology với weights cho sẵn (vd. memoryview chỉ đọc trên vùng nhớ dùng chung).
+        Bản trả về không được update_edge; muốn sửa thì copy() trước.
+        heuristic_scale: hệ số đã biết cho đúng weights này (vd. phát kèm weights), None thì
+        tính lại (O(E)) ở lần A* đầu tiên."""
+        clone = CSRGraph.__new__(CSRGraph)
+        clone.__dict__.update(self.__dict__)
+        clone.weights = weights
+        clone.reverse_weights = reverse_weights
+        clone._signature = None
+        clone._heuristic_scale = heuristic_scale
+        return clone
+
+    def update_edge(self, from_index: int, edge_id: int,
+                    forward_cost: Optional[float], backward_cost: Optional[float]) -> bool:
+        """Ghi lại weights 2 chiều của một edge tại chỗ (from_index là chỉ số dày của from_node)"""
+        forward_slot = self._forward_slot(from_index, edge_id)
+        if forward_slot == -1:
+            return False
+
+        backward_slot = self.twins[forward_slot]
+        forward_weight = INF if forward_cost is None else forward_cost
+        backward_weight = INF if backward_cost is None else backward_cost
+
+        self.weights[forward_slot] = forward_weight
+        self.weights[backward_slot] = backward_weight
+        self.reverse_weights[backward_slot] = forward_weight
+        self.reverse_weights[forward_slot] = backward_weight
+
+        self._signature = None
+        if self._heuristic_scale is not None:
+            # Weight giảm (penalty < 1) có thể làm heuristic không còn nhất quán
+            to_index = self.targets[forward_slot]
+            straight = haversine_distance(self.lats[from_index], self.lons[from_index],
+                                          self.lats[to_index], self.lons[to_index])
+            for weight in (forward_weight, backward_weight):
+                if straight > 0 and weight < straight * self._heuristic_scale:
+                    self._heuristic_scale = weight / straight
+        return True
+
+    def edge_weights(self, from_index: int, edge_id: int) -> Optional[Tuple[float, float]]:
+        """Weights hiện tại (from→to, to→from) của một edge; inf là chiều không được đi"""
+        forward_slot = self._forward_slot(from_index, edge_id)
+        if forward_slot == -1:
+            return None
+        return self.weights[forward_slot], self.weights[self.twins[forward_slot]]
+
+    def edge_slots(self, from_index: int, edge_id: int) -> Optional[Tuple[int, int]]:
+        """(slot from→to, slot to→from) của một edge, None nếu không có"""
+        forward_slot = self._forward_slot(from_index, edge_id)
+        if forward_slot == -1:
+            return None
+        return forward_slot, self.twins[forward_slot]
+
+    def _forward_slot(self, from_index: int, edge_id: int) -> int:
+        for slot in range(self.offsets[from_index], self.offsets[from_index + 1]):
+            if self.edge_ids[slot] == edge_id:
+                return slot
+        return -1
+
+    def radians(self) -> Tuple[array, array, array]:
+        """(lat, lon, cos(lat)) theo radian, tính một lần để heuristic không gọi lại radians/cos"""
+        if self._radians is None:
+            lat_rad = array('d', (math.radians(lat) for lat in self.lats))
+            lon_rad = array('d', (math.radians(lon) for lon in self.lons))
+            cos_lat = array('d', (math.cos(phi) for phi in lat_rad))
+            self._radians = (lat_rad, lon_rad, cos_lat)
+        return self._radians
+
+    def distances_from(self, source: int, reverse: bool = False) -> array:
+        """Dijkstra một-tới-tất-cả từ chỉ số dày source; reverse=True cho khoảng cách tới source"""
+        offsets, targets = self.offsets, self.targets
+        weights = self.reverse_weights if reverse else self.weights
+
+        distances = [INF] * self.num_nodes
+        distances[source] = 0.0
+        heap = [(0.0, source)]
+
+        while heap:
+            distance, u = heapq.heappop(heap)
+            if distance > distances[u]:
+                continue
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                candidate = distance + weights[slot]
+                if candidate < distances[v]:
+                    distances[v] = candidate
+                    heapq.heappush(heap, (candidate, v))
+
+        return array('d', distances)
+
+    @property
+    def heuristic_scale(self) -> float:
+        if self._heuristic_scale is None:
+            self._heuristic_scale = self._compute_heuristic_scale()
+        return self._heuristic_scale
+
+    def _compute_heuristic_scale(self) -> float:
+        """Hệ số <= 1 sao cho scale * haversine không vượt quá weight của bất kỳ slot nào.
+
+        distance trong edges.csv được làm tròn nên có edge ngắn hơn haversine giữa 2 đầu mút;
+        nhân heuristic với hệ số này giữ cho A* (và potential của A* 2 chiều) nhất quán.
+        """
+        scale = 1.0
+        offsets, targets, weights, lats, lons = \
+            self.offsets, self.targets, self.weights, self.lats, self.lons
+
+        for u in range(self.num_nodes):
+            for slot in range(offsets[u], offsets[u + 1]):
+                weight = weights[slot]
+                if weight == INF:
+                    continue
+                v = targets[slot]
+                straight = haversine_distance(lats[u], lons[u], lats[v], lons[v])
+                if straight > 0 and weight < straight * scale:
+                    scale = weight / straight
+        return scale
+
+    def neighbors(self, node_id: int) -> List[tuple]:
+        """Giống RoadGraph.get_neighbors, chỉ dùng để debug/so sánh"""
+        u = self.index.get(node_id)
+        if u is None:
+            return []
+        return [(self.node_ids[self.targets[slot]], self.edge_ids[slot], self.weights[slot])
+                for slot in range(self.offsets[u], self.offsets[u + 1])
+                if self.weights[slot] != INF]
+
+    @property
+    def workspaces(self) -> WorkspacePool:
+        """Pool dùng chung cho mọi bản copy()/with_weights() (và CH dựng từ chúng) cùng topology"""
+        return self._workspaces
+
+    def workspace(self, name: str = 'forward') -> SearchWorkspace:
+        return self._workspaces.get(name)
+
+    def signature(self) -> str:
+        """Hash của topology + weights; dùng để biết dữ liệu tiền xử lý (CH, ...) còn khớp không"""
+        if self._signature is None:
+            digest = hashlib.sha1()
+            for values in (self.node_ids, self.offsets, self.targets, self.edge_ids, self.weights):
+                digest.update(values.tobytes())
+            self._signature = digest.hexdigest()
+        return self._signature
+
+    def unpack_path(self, previous: List[int], target: int) -> List[int]:
+        path = []
+        current = target
+        while current != -1:
+            path.append(self.node_ids[current])
+            current = previous[current]
+        path.reverse()
+        return path
+
+    def memory_usage(self) -> int:
+        """Số byte của các mảng (không tính dict index)"""
+        arrays = (self.node_ids, self.lats, self.lons, self.offsets,
+                  self.targets, self.edge_ids, self.weights)
+        return sum(a.itemsize * len(a) for a in arrays)
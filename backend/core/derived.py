@@ -0,0 +1,51 @@
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+from .csr import CSRGraph
+
+T = TypeVar('T')
+
+
+class DerivedStructure(Generic[T]):
+    """Cấu trúc tiền xử lý (CH, landmarks, ...) gắn với signature của một CSRGraph.
+
+    Khi weights thay đổi, get() không chặn request: nó trả về None và dựng lại ở
+    thread nền trên một bản sao weights, nơi gọi tự dùng thuật toán dự phòng.
+    Cấu trúc được dựng phải có thuộc tính `signature`.
+    """
+
+    def __init__(self, name: str, build: Callable[[CSRGraph], T]):
+        self.name = name
+        self.build = build
+        self.value: Optional[T] = None
+        # _build_lock: chỉ một lần dựng tại một thời điểm; _state_lock: bảo vệ cờ _building
+        self._build_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._building = False
+
+    def get(self, csr: CSRGraph, wait: bool = False) -> Optional[T]:
+        value = self.value
+        if value is not None and value.signature == csr.signature():
+            return value
+
+        if wait:
+            with self._build_lock:
+                value = self.value
+                if value is None or value.signature != csr.signature():
+                    value = self.value = self.build(csr.copy())
+            return value
+
+        with self._state_lock:
+            if not self._building:
+                self._building = True
+                threading.Thread(target=self._rebuild, args=(csr.copy(),), daemon=True).start()
+        return None
+
+    def _rebuild(self, snapshot: CSRGraph):
+        try:
+            with self._build_lock:
+                self.value = self.build(snapshot)
+        except Exception as e:
+            print(f"Error rebuilding {self.name}: {e}")
+        finally:
+            self._building = False
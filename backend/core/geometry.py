@@ -0,0 +1,195 @@
+import math
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tùy chọn, không có thì dùng vòng lặp Python
+    np = None
+
+EARTH_RADIUS = 6371000
+# Dưới ngưỡng này chi phí tạo mảng NumPy lớn hơn phần tiết kiệm được, dùng vòng lặp Python
+BATCH_MIN_SIZE = 32
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS * c
+
+
+def haversine_many(lat: float, lon: float, lats: Sequence[float], lons: Sequence[float]) -> List[float]:
+    """Khoảng cách haversine từ (lat, lon) tới từng điểm (lats[i], lons[i]); vector hóa khi có NumPy"""
+    if np is None or len(lats) < BATCH_MIN_SIZE:
+        return [haversine_distance(lat, lon, other_lat, other_lon) for other_lat, other_lon in zip(lats, lons)]
+
+    phi = np.radians(np.asarray(lats, dtype=float))
+    delta_phi = phi - math.radians(lat)
+    delta_lambda = np.radians(np.asarray(lons, dtype=float)) - math.radians(lon)
+    a = np.sin(delta_phi / 2) ** 2 + \
+        math.cos(math.radians(lat)) * np.cos(phi) * np.sin(delta_lambda / 2) ** 2
+    return (2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).tolist()
+
+
+def min_distance_for_offset(delta_lat: float, delta_lon: float, max_abs_lat: float) -> float:
+    """Cận dưới khoảng cách haversine giữa 2 điểm lệch nhau ít nhất delta_lat hoặc delta_lon độ
+    (cả 2 điểm có |lat| <= max_abs_lat)"""
+    lat_bound = EARTH_RADIUS * math.radians(delta_lat)
+
+    # hav(d/R) >= cos(phi1) * cos(phi2) * hav(delta_lambda) >= cos^2(phi_max) * hav(delta_lambda)
+    cos_max = math.cos(math.radians(min(max_abs_lat, 90.0)))
+    half_lambda = math.radians(min(delta_lon, 180.0)) / 2
+    lon_bound = 2 * EARTH_RADIUS * math.asin(min(1.0, cos_max * math.sin(half_lambda)))
+
+    return min(lat_bound, lon_bound)
+
+
+def convex_hull(points: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Bao lồi (thuật toán monotone chain), các đỉnh theo chiều ngược kim đồng hồ"""
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower: List[Tuple[float, float]] = []
+    for point in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], point) <= 0:
+            lower.pop()
+        lower.append(point)
+
+    upper: List[Tuple[float, float]] = []
+    for point in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], point) <= 0:
+            upper.pop()
+        upper.append(point)
+
+    return lower[:-1] + upper[:-1]
+
+
+def point_in_polygon(point: Tuple[float, float], polygon: List[Tuple[float, float]]) -> bool:
+    """Ray casting; point và các đỉnh polygon cùng dạng (lat, lon)"""
+    x, y = point
+    n = len(polygon)
+    inside = False
+
+    p1x, p1y = polygon[0]
+    for i in range(1, n + 1):
+        p2x, p2y = polygon[i % n]
+        if y > min(p1y, p2y):
+            if y <= max(p1y, p2y):
+                if x <= max(p1x, p2x):
+                    if p1y != p2y:
+                        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                    if p1x == p2x or x <= xinters:
+                        inside = not inside
+        p1x, p1y = p2x, p2y
+
+    return inside
+
+
+def points_in_polygon(points: Sequence[Tuple[float, float]], polygon: List[Tuple[float, float]]) -> List[bool]:
+    """point_in_polygon cho nhiều điểm cùng lúc (vector hóa theo điểm khi có NumPy)"""
+    if np is None or len(points) < BATCH_MIN_SIZE:
+        return [point_in_polygon(point, polygon) for point in points]
+
+    coords = np.asarray(points, dtype=float)
+    x, y = coords[:, 0], coords[:, 1]
+    inside = np.zeros(len(coords), dtype=bool)
+
+    # Cùng quy tắc với point_in_polygon: cạnh (p1, p2) đổi trạng thái khi
+    # min(p1y, p2y) < y <= max(p1y, p2y), x <= max(p1x, p2x) và (p1x == p2x hoặc x <= xinters).
+    # Cạnh nằm ngang không bao giờ thỏa điều kiện đầu nên không cần xinters.
+    n = len(polygon)
+    p1x, p1y = polygon[0]
+    for i in range(1, n + 1):
+        p2x, p2y = polygon[i % n]
+        if p1y != p2y:
+            crosses = (y > min(p1y, p2y)) & (y <= max(p1y, p2y)) & (x <= max(p1x, p2x))
+            if p1x != p2x:
+                xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                crosses &= x <= xinters
+            inside ^= crosses
+        p1x, p1y = p2x, p2y
+
+    return inside.tolist()
+
+
+def radius_bbox(lat: float, lon: float, radius: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) chứa mọi điểm cách (lat, lon) không quá radius mét"""
+    delta_lat = math.degrees(radius / EARTH_RADIUS)
+    max_abs_lat = min(abs(lat) + delta_lat, 90.0)
+    cos_lat = math.cos(math.radians(max_abs_lat))
+    if cos_lat < 1e-9 or delta_lat >= 90.0:
+        return lat - delta_lat, -180.0, lat + delta_lat, 180.0
+    # hav(d) >= cos^2(phi_max) * hav(delta_lambda) nên delta_lambda <= 2 asin(sin(d/2) / cos(phi_max))
+    ratio = math.sin(radius / EARTH_RADIUS / 2) / cos_lat
+    if ratio >= 1.0:
+        return lat - delta_lat, -180.0, lat + delta_lat, 180.0
+    delta_lon = math.degrees(2 * math.asin(ratio))
+    return lat - delta_lat, lon - delta_lon, lat + delta_lat, lon + delta_lon
+
+
+def segment_intersects_bbox(a: Tuple[float, float], b: Tuple[float, float],
+                            min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> bool:
+    """Đoạn thẳng a-b (lat, lon) có điểm chung với bbox không (cắt đoạn theo Liang–Barsky)"""
+    t0, t1 = 0.0, 1.0
+    d_lat, d_lon = b[0] - a[0], b[1] - a[1]
+    for p, q in ((-d_lat, a[0] - min_lat), (d_lat, max_lat - a[0]),
+                 (-d_lon, a[1] - min_lon), (d_lon, max_lon - a[1])):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+    return True
+
+
+def simplify_polyline(points: List[Tuple[float, float]], tolerance: float) -> List[Tuple[float, float]]:
+    """Douglas–Peucker với sai số tolerance mét (chiếu phẳng cục bộ, đủ chính xác ở quy mô một phường).
+    Luôn giữ điểm đầu và cuối."""
+    if len(points) <= 2 or tolerance <= 0:
+        return list(points)
+
+    meters_per_lat = math.pi * EARTH_RADIUS / 180
+    meters_per_lon = meters_per_lat * math.cos(math.radians(points[0][0]))
+    xy = [(lon * meters_per_lon, lat * meters_per_lat) for lat, lon in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+
+        farthest, max_distance = -1, tolerance
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            if length == 0:
+                distance = math.hypot(x - x1, y - y1)
+            else:
+                distance = abs(dy * (x - x1) - dx * (y - y1)) / length
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+
+        if farthest != -1:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
@@ -1,15 +1,36 @@
-import math
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional, Sequence
+from .geometry import haversine_distance, haversine_many, points_in_polygon, radius_bbox, segment_intersects_bbox
+from .spatial import EdgeGridIndex, NodeGridIndex
+from .csr import CSRGraph, INF
+from .components import ComponentIndex
 
 class RoadGraph:
     def __init__(self):
         self.nodes: Dict[int, Tuple[float, float]] = {}
         self.edges: Dict[int, Dict] = {}
-        self.adjacency: Dict[int, List[Tuple[int, int, float]]] = {}
+        # None: chưa dựng (graph load từ snapshot chỉ cần CSR), dựng khi truy cập adjacency lần đầu
+        self._adjacency: Optional[Dict[int, List[Tuple[int, int, float]]]] = {}
         self.constraints: Dict[int, Dict] = {}
+        self.spatial_index: Optional[NodeGridIndex] = None
+        self.edge_index: Optional[EdgeGridIndex] = None
+        self.csr: Optional[CSRGraph] = None
+        # Nhãn SCC theo weights hiện tại của csr; None khi cần tính lại (build_components)
+        self.components: Optional[ComponentIndex] = None
+        # Tăng mỗi lần nhãn SCC hết hạn: nhãn dựng cho bản có cùng giá trị vẫn dùng được
+        self.components_version = 0
+        # Tăng mỗi khi weights thay đổi (rebuild hoặc cập nhật constraints từng phần)
+        self.constraint_version = 0
 
     def add_node(self, node_id: int, latitude: float, longitude: float):
         self.nodes[node_id] = (latitude, longitude)
+        if self.spatial_index is not None:
+            self.spatial_index.insert(node_id, latitude, longitude)
+
+    def build_spatial_index(self, cell_size: Optional[float] = None):
+        self.spatial_index = NodeGridIndex.from_nodes(self.nodes, cell_size)
+
+    def build_edge_index(self, cell_size: Optional[float] = None):
+        self.edge_index = EdgeGridIndex.from_edges(self.nodes, self.edges, cell_size)
 
     def add_edge(self, edge_id: int, from_node: int, to_node: int, distance: float, is_oneway: int):
         self.edges[edge_id] = {
@@ -18,11 +39,35 @@ class RoadGraph:
             'distance': distance,
             'is_oneway': is_oneway
         }
+        if self.edge_index is not None and from_node in self.nodes and to_node in self.nodes:
+            self.edge_index.insert(edge_id, self.nodes[from_node], self.nodes[to_node])
+
+        if self._adjacency is not None:
+            self._adjacency.setdefault(from_node, [])
+            self._adjacency.setdefault(to_node, [])
+
+    @property
+    def adjacency(self) -> Dict[int, List[Tuple[int, int, float]]]:
+        if self._adjacency is None:
+            self._adjacency = self._build_adjacency()
+        return self._adjacency
+
+    @adjacency.setter
+    def adjacency(self, value: Optional[Dict[int, List[Tuple[int, int, float]]]]):
+        self._adjacency = value
+
+    def clone(self) -> 'RoadGraph':
+        """Bản sao để sửa constraints rồi thay graph đang phục vụ bằng một phép gán.
 
-        if from_node not in self.adjacency:
-            self.adjacency[from_node] = []
-        if to_node not in self.adjacency:
-            self.adjacency[to_node] = []
+        nodes/edges/spatial index dùng chung (không đổi sau khi load); adjacency chỉ copy dict
+        vì apply_constraint_changes thay list mới chứ không sửa list cũ; CSR chỉ copy weights.
+        """
+        clone = RoadGraph.__new__(RoadGraph)
+        clone.__dict__.update(self.__dict__)
+        clone._adjacency = dict(self._adjacency) if self._adjacency is not None else None
+        clone.constraints = dict(self.constraints)
+        clone.csr = self.csr.copy() if self.csr is not None else None
+        return clone
 
     def add_constraint(self, edge_id: int, constraint_type: str, value: str, description: str = ""):
         self.constraints[edge_id] = {
@@ -31,47 +76,142 @@ class RoadGraph:
             'description': description
         }
 
+    def remove_constraint(self, edge_id: int):
+        self.constraints.pop(edge_id, None)
+
     def clear_constraints(self):
         self.constraints.clear()
 
     def rebuild_adjacency(self):
-        self.adjacency.clear()
+        """Dựng lại adjacency với chi phí đã áp sẵn constraints (block/oneway/penalty)"""
+        self._adjacency = self._build_adjacency()
+        self.csr = CSRGraph.from_road_graph(self)
+        self.components = None
+        self.components_version += 1
+        self.constraint_version += 1
 
+    def _build_adjacency(self) -> Dict[int, List[Tuple[int, int, float]]]:
+        adjacency: Dict[int, List[Tuple[int, int, float]]] = {}
         for edge_id, edge in self.edges.items():
+            forward_cost, backward_cost = self.edge_direction_costs(edge_id)
+
+            if forward_cost is not None:
+                adjacency.setdefault(edge['from_node'], []).append((edge['to_node'], edge_id, forward_cost))
+            if backward_cost is not None:
+                adjacency.setdefault(edge['to_node'], []).append((edge['from_node'], edge_id, backward_cost))
+        return adjacency
+
+    def apply_constraint_changes(self, edge_ids: Iterable[int]) -> List[int]:
+        """Cập nhật adjacency và CSR chỉ cho các edge vừa đổi constraint, không rebuild toàn bộ.
+
+        Gọi sau add_constraint/remove_constraint/clear_constraints. List adjacency của node
+        bị ảnh hưởng được thay bằng list mới (không sửa list cũ đang được search khác đọc).
+        Trả về các edge_id đã được cập nhật.
+        """
+        updated = []
+        # Nhãn SCC chỉ hết hạn khi có chiều đi được/bị chặn thay đổi (trừ chiều mới mở trong
+        # cùng một SCC); penalty chỉ đổi chi phí nên giữ nguyên nhãn. Không tính lại ở đây
+        # (Tarjan chạy trên cả graph): components = None, người gọi dựng lại bằng build_components
+        components_stale = self.components is None
+        for edge_id in dict.fromkeys(edge_ids):
+            edge = self.edges.get(edge_id)
+            if edge is None:
+                continue
+
             from_node = edge['from_node']
             to_node = edge['to_node']
-            distance = edge['distance']
-            is_oneway = edge['is_oneway']
-
-            constraint = self.constraints.get(edge_id)
-
-            # 1. Kiểm tra block constraint
-            if constraint and constraint['type'] == 'block':
-                continue # Bỏ qua
-
-            # 2. Xử lý oneway constraint
-            if constraint and constraint['type'] == 'oneway':
-                direction = constraint['value']
-
-                if direction == 'forward':
-                    # Chỉ thêm chiều từ from_node → to_node
-                    self._add_to_adjacency(from_node, to_node, edge_id, distance)
-                elif direction == 'backward':
-                    # Chỉ thêm chiều từ to_node → from_node
-                    self._add_to_adjacency(to_node, from_node, edge_id, distance)
-                elif direction == 'both':
-                    # Thêm cả 2 chiều (cho đường 1 chiều gốc)
-                    self._add_to_adjacency(from_node, to_node, edge_id, distance)
-                    self._add_to_adjacency(to_node, from_node, edge_id, distance)
-            else:
-                # 3. Không có constraint oneway, sử lý theo loại edge gốc
-                if is_oneway == 1:
-                    # Edge 1 chiều gốc
-                    self._add_to_adjacency(from_node, to_node, edge_id, distance)
-                else: 
-                    # Edge 2 chiều gốc (normal)
-                    self._add_to_adjacency(from_node, to_node, edge_id, distance)
-                    self._add_to_adjacency(to_node, from_node, edge_id, distance)
+            forward_cost, backward_cost = self.edge_direction_costs(edge_id)
+
+            # Adjacency chưa dựng thì khi dựng sẽ đọc constraints hiện tại, không cần patch
+            if self._adjacency is not None:
+                for node in (from_node, to_node):
+                    self._adjacency[node] = [entry for entry in self._adjacency.get(node, ())
+                                             if entry[1] != edge_id]
+                if forward_cost is not None:
+                    self._add_to_adjacency(from_node, to_node, edge_id, forward_cost)
+                if backward_cost is not None:
+                    self._add_to_adjacency(to_node, from_node, edge_id, backward_cost)
+
+            if self.csr is not None:
+                from_index = self.csr.index.get(from_node)
+                if from_index is not None:
+                    if not components_stale:
+                        components_stale = self._reachability_changed(
+                            from_index, self.csr.index[to_node], edge_id, forward_cost, backward_cost)
+                    self.csr.update_edge(from_index, edge_id, forward_cost, backward_cost)
+
+            updated.append(edge_id)
+
+        if components_stale:
+            self.components = None
+            self.components_version += 1
+        if updated:
+            self.constraint_version += 1
+        return updated
+
+    def _reachability_changed(self, from_index: int, to_index: int, edge_id: int,
+                              forward_cost: Optional[float], backward_cost: Optional[float]) -> bool:
+        previous = self.csr.edge_weights(from_index, edge_id)
+        if previous is None:
+            return True
+        labels = self.components.labels
+        for (u, v), old_cost, new_cost in (((from_index, to_index), previous[0], forward_cost),
+                                           ((to_index, from_index), previous[1], backward_cost)):
+            was_open, is_open = old_cost != INF, new_cost is not None
+            if was_open != is_open and not (is_open and labels[u] == labels[v]):
+                return True
+        return False
+
+    def build_components(self) -> Optional[ComponentIndex]:
+        """Nhãn SCC cho weights hiện tại của csr (O(V + E)); không gán vào graph"""
+        return ComponentIndex.build(self.csr) if self.csr is not None else None
+
+    def can_reach(self, start: Optional[int], end: Optional[int]) -> bool:
+        """O(1): False khi chắc chắn không có đường start → end (khác thành phần liên thông, hoặc
+        SCC của end không nằm dưới SCC của start trên DAG các SCC). True khi chưa loại trừ được,
+        kể cả lúc nhãn đang được tính lại"""
+        if self.components is None or self.csr is None:
+            return True
+        source = self.csr.index.get(start)
+        target = self.csr.index.get(end)
+        if source is None or target is None:
+            return False
+        return self.components.can_reach(source, target)
+
+    def edge_direction_costs(self, edge_id: int) -> Tuple[Optional[float], Optional[float]]:
+        """Chi phí (from_node → to_node, to_node → from_node) của edge sau khi áp constraint.
+        None nghĩa là không được đi theo chiều đó."""
+        edge = self.edges[edge_id]
+        distance = edge['distance']
+        constraint = self.constraints.get(edge_id)
+
+        # 1. Kiểm tra block constraint
+        if constraint and constraint['type'] == 'block':
+            return None, None
+
+        # 2. Xử lý oneway constraint
+        if constraint and constraint['type'] == 'oneway':
+            direction = constraint['value']
+
+            if direction == 'forward':
+                # Chỉ đi chiều từ from_node → to_node
+                return distance, None
+            elif direction == 'backward':
+                # Chỉ đi chiều từ to_node → from_node
+                return None, distance
+            elif direction == 'both':
+                # Cả 2 chiều (cho đường 1 chiều gốc)
+                return distance, distance
+            return None, None
+
+        # 3. Không có constraint oneway, xử lý theo loại edge gốc.
+        # Penalty được nhân sẵn vào chi phí để search không phải parse lại mỗi lần mở rộng node
+        cost = self.get_edge_cost(edge_id, distance)
+        if edge['is_oneway'] == 1:
+            # Edge 1 chiều gốc
+            return cost, None
+        # Edge 2 chiều gốc (normal)
+        return cost, cost
 
     def _add_to_adjacency(self, from_node: int, to_node: int, edge_id: int, distance: float):
             """Helper method để thêm edge vào adjacency list"""
@@ -97,53 +237,95 @@ class RoadGraph:
 
         return base_distance
 
-    def is_edge_allowed(self, edge_id: int, from_node: int, to_node: int) -> bool:
-        
-        if edge_id not in self.constraints:
-            return True
-        
-        constraint = self.constraints[edge_id]
-
-        if constraint['type'] == 'block':
-            return False
-        
-        return True
-
-    def get_neighbors(self, node_id: int) -> List[Tuple[int, int, float]]:
-        
-        """Lấy danh sách neighbors của node, đã tính đến constraints"""
-        neighbors = []
-        if node_id in self.adjacency:
-            for neighbor_id, edge_id, distance in self.adjacency[node_id]:
-                if self.is_edge_allowed(edge_id, node_id, neighbor_id):
-                    cost = self.get_edge_cost(edge_id, distance)
-                    if cost is not None:
-                        neighbors.append((neighbor_id, edge_id, cost))
-        return neighbors
+    def get_neighbors(self, node_id: int) -> Sequence[Tuple[int, int, float]]:
+        """Lấy danh sách neighbors của node, constraints đã được áp sẵn trong rebuild_adjacency.
+        Trả về trực tiếp list trong adjacency (không copy), nơi gọi không được sửa list này."""
+        return self.adjacency.get(node_id, ())
 
     @staticmethod
     def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        R = 6371000
+        return haversine_distance(lat1, lon1, lat2, lon2)
+
+    def find_nearest_node(self, latitude: float, longitude: float,
+                          max_distance: Optional[float] = None,
+                          main_component: bool = False) -> Tuple[Optional[int], float]:
+        """Node gần nhất; trả về (None, inf) nếu không có node nào trong max_distance.
+        main_component: chỉ xét node thuộc SCC lớn nhất (đi được tới/từ phần lớn graph)"""
+        results = self.find_k_nearest_nodes(latitude, longitude, 1, max_distance, main_component)
+        if not results:
+            return None, float('inf')
+        return results[0]
+
+    def find_k_nearest_nodes(self, latitude: float, longitude: float, k: int,
+                             max_distance: Optional[float] = None,
+                             main_component: bool = False) -> List[Tuple[int, float]]:
+        if self.spatial_index is None:
+            self.build_spatial_index()
+        predicate = None
+        if main_component and self.components is not None and self.csr is not None:
+            index, components = self.csr.index, self.components
+
+            def predicate(node_id: int) -> bool:
+                u = index.get(node_id)
+                return u is not None and components.in_main(u)
+
+        return [(node_id, distance) for distance, node_id in
+                self.spatial_index.nearest(latitude, longitude, k, max_distance, predicate)]
+
+    def find_nodes_within_radius(self, latitude: float, longitude: float,
+                                 radius: float) -> List[Tuple[int, float]]:
+        if self.spatial_index is None:
+            self.build_spatial_index()
+        return [(node_id, distance) for distance, node_id in
+                self.spatial_index.within_radius(latitude, longitude, radius)]
+
+    def find_edges_in_polygon(self, polygon: List[Tuple[float, float]]) -> List[int]:
+        """Edge có ít nhất một đầu mút nằm trong polygon (đỉnh dạng (lat, lon))"""
+        if len(polygon) < 3:
+            return []
+        if self.edge_index is None:
+            self.build_edge_index()
+
+        lats = [lat for lat, _ in polygon]
+        lons = [lon for _, lon in polygon]
+        candidates = self.edge_index.query_bbox(min(lats), min(lons), max(lats), max(lons))
+
+        nodes = self._edge_endpoints(candidates)
+        inside = dict(zip(nodes, points_in_polygon([self.nodes[node_id] for node_id in nodes], polygon)))
+        return self._edges_with_endpoint(candidates, inside)
+
+    def find_edges_in_circle(self, latitude: float, longitude: float, radius: float) -> List[int]:
+        """Edge có ít nhất một đầu mút cách tâm không quá radius mét"""
+        if self.edge_index is None:
+            self.build_edge_index()
 
-        phi1 = math.radians(lat1)
-        phi2 = math.radians(lat2)
-        delta_phi = math.radians(lat2 - lat1)
-        delta_lambda = math.radians(lon2 - lon1)
+        candidates = self.edge_index.query_bbox(*radius_bbox(latitude, longitude, radius))
 
-        a = math.sin(delta_phi / 2) ** 2 + \
-            math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        nodes = self._edge_endpoints(candidates)
+        distances = haversine_many(latitude, longitude,
+                                   [self.nodes[node_id][0] for node_id in nodes],
+                                   [self.nodes[node_id][1] for node_id in nodes])
+        inside = {node_id: distance <= radius for node_id, distance in zip(nodes, distances)}
+        return self._edges_with_endpoint(candidates, inside)
 
-        return R * c
+    def find_edges_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+        """Edge có đoạn thẳng giao bbox (kể cả edge chỉ đi ngang qua, không có đầu mút bên trong)"""
+        if self.edge_index is None:
+            self.build_edge_index()
 
-    def find_nearest_node(self, latitude: float, longitude: float) -> Tuple[int, float]:
-        min_distance = float('inf')
-        nearest_node = None
+        return [edge_id for edge_id in self.edge_index.query_bbox(min_lat, min_lon, max_lat, max_lon)
+                if segment_intersects_bbox(self.nodes[self.edges[edge_id]['from_node']],
+                                           self.nodes[self.edges[edge_id]['to_node']],
+                                           min_lat, min_lon, max_lat, max_lon)]
 
-        for node_id, (node_lat, node_lon) in self.nodes.items():
-            distance = self.haversine_distance(latitude, longitude, node_lat, node_lon)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_node = node_id
+    def _edge_endpoints(self, edge_ids: List[int]) -> List[int]:
+        nodes = {}
+        for edge_id in edge_ids:
+            edge = self.edges[edge_id]
+            nodes[edge['from_node']] = None
+            nodes[edge['to_node']] = None
+        return list(nodes)
 
-        return nearest_node, min_distance
\ No newline at end of file
+    def _edges_with_endpoint(self, edge_ids: List[int], inside: Dict[int, bool]) -> List[int]:
+        return [edge_id for edge_id in edge_ids
+                if inside[self.edges[edge_id]['from_node']] or inside[self.edges[edge_id]['to_node']]]
@@ -0,0 +1,150 @@
+import glob
+import os
+from array import array
+from typing import Callable, List
+
+from .arrayfile import file_lock, load_arrays, save_arrays
+from .csr import CSRGraph, INF
+
+
+class LandmarkTable:
+    """Bảng khoảng cách tới/từ các landmark cho heuristic ALT (A*, Landmarks, Triangle inequality).
+
+    Lưu phẳng theo landmark: from_landmark[i * n + v] = d(L_i, v), to_landmark[i * n + v] = d(v, L_i).
+    Cận dưới: d(v, t) >= max(d(v, L) - d(t, L), d(L, t) - d(L, v)).
+    """
+
+    DEFAULT_LANDMARKS = 8
+    # Số landmark dùng cho mỗi truy vấn (chọn những landmark cho cận dưới tốt nhất tại start)
+    ACTIVE_LANDMARKS = 4
+    FILE_FORMAT = 1
+    # Số bảng (ứng với các bộ constraints khác nhau) giữ lại trong cache
+    CACHE_KEEP = 8
+
+    def __init__(self, signature: str, num_nodes: int, landmarks: array,
+                 from_landmark: array, to_landmark: array):
+        self.signature = signature
+        self.num_nodes = num_nodes
+        self.landmarks = landmarks
+        self.from_landmark = from_landmark
+        self.to_landmark = to_landmark
+
+    @classmethod
+    def build(cls, csr: CSRGraph, num_landmarks: int = DEFAULT_LANDMARKS) -> 'LandmarkTable':
+        """Chọn landmark theo kiểu farthest: mỗi landmark mới là node xa nhất các landmark đã chọn"""
+        n = csr.num_nodes
+        landmarks = array('i')
+        from_landmark = array('d')
+        to_landmark = array('d')
+
+        if n == 0:
+            return cls(csr.signature(), n, landmarks, from_landmark, to_landmark)
+
+        closeness = list(csr.distances_from(0))
+        candidate = _farthest(closeness)
+
+        while candidate != -1 and len(landmarks) < num_landmarks:
+            from_distances = csr.distances_from(candidate)
+            landmarks.append(candidate)
+            from_landmark.extend(from_distances)
+            to_landmark.extend(csr.distances_from(candidate, reverse=True))
+
+            if len(landmarks) == 1:
+                closeness = list(from_distances)
+            else:
+                closeness = [min(a, b) for a, b in zip(closeness, from_distances)]
+            candidate = _farthest(closeness)
+
+        return cls(csr.signature(), n, landmarks, from_landmark, to_landmark)
+
+    @classmethod
+    def load_or_build(cls, csr: CSRGraph, num_landmarks: int, cache_dir: str,
+                      use_mmap: bool = False) -> 'LandmarkTable':
+        """Như ContractionHierarchy.load_or_build: đọc bảng đã lưu cho signature của csr hoặc
+        dựng rồi lưu; use_mmap=True để các worker process dùng chung một bản trong page cache"""
+        signature = csr.signature()
+        path = os.path.join(cache_dir, f"landmarks_{num_landmarks}_{signature[:16]}.bin")
+
+        with file_lock(os.path.join(cache_dir, 'landmarks')):
+            if os.path.exists(path):
+                try:
+                    table = cls.load(path, use_mmap)
+                    if table.signature == signature:
+                        return table
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error loading landmark table: {e}")
+
+            table = cls.build(csr, num_landmarks)
+            try:
+                table.save(path)
+                cls._prune_cache(cache_dir)
+            except OSError as e:
+                print(f"Error saving landmark table: {e}")
+                return table
+        return cls.load(path, use_mmap) if use_mmap else table
+
+    @classmethod
+    def _prune_cache(cls, cache_dir: str):
+        files = sorted(glob.glob(os.path.join(cache_dir, 'landmarks_*.bin')), key=os.path.getmtime, reverse=True)
+        for old_file in files[cls.CACHE_KEEP:]:
+            os.remove(old_file)
+
+    def save(self, path: str):
+        save_arrays(path, {'format': self.FILE_FORMAT, 'signature': self.signature, 'num_nodes': self.num_nodes}, {
+            'landmarks': self.landmarks,
+            'from_landmark': self.from_landmark,
+            'to_landmark': self.to_landmark
+        })
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = False) -> 'LandmarkTable':
+        meta, arrays = load_arrays(path, use_mmap)
+        if meta.get('format') != cls.FILE_FORMAT:
+            raise ValueError(f"Unsupported landmark table format: {meta.get('format')}")
+        return cls(meta['signature'], meta['num_nodes'], arrays['landmarks'],
+                   arrays['from_landmark'], arrays['to_landmark'])
+
+    def memory_usage(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.landmarks, self.from_landmark, self.to_landmark))
+
+    def heuristic(self, source: int, target: int,
+                  active: int = ACTIVE_LANDMARKS) -> Callable[[int], float]:
+        """Hàm cận dưới d(v, target) theo chỉ số dày; trả về inf khi chắc chắn v không tới được target"""
+        n = self.num_nodes
+        to_landmark, from_landmark = self.to_landmark, self.from_landmark
+
+        terms = [(i * n, to_landmark[i * n + target], from_landmark[i * n + target])
+                 for i in range(len(self.landmarks))]
+
+        def lower_bound(v: int, selected: List[tuple]) -> float:
+            best = 0.0
+            for base, to_target, from_target in selected:
+                # d(v, t) >= d(v, L) - d(t, L); to_target = inf thì không có thông tin
+                if to_target != INF:
+                    bound = to_landmark[base + v] - to_target
+                    if bound > best:
+                        best = bound
+                # d(v, t) >= d(L, t) - d(L, v); from_v = inf thì không có thông tin
+                from_v = from_landmark[base + v]
+                if from_v != INF:
+                    bound = from_target - from_v
+                    if bound > best:
+                        best = bound
+            return best
+
+        if active and len(terms) > active:
+            terms.sort(key=lambda term: lower_bound(source, [term]), reverse=True)
+            terms = terms[:active]
+
+        return lambda v: lower_bound(v, terms)
+
+
+def _farthest(distances: List[float]) -> int:
+    """Node xa nhất còn tới được; landmark đã chọn có khoảng cách 0 nên không bị chọn lại"""
+    best = -1
+    best_distance = 0.0
+    for v, distance in enumerate(distances):
+        if distance != INF and distance > best_distance:
+            best = v
+            best_distance = distance
+    return best
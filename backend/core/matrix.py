@@ -0,0 +1,222 @@
+import glob
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from .algorithms import one_to_many
+from .arrayfile import load_arrays, save_arrays
+from .csr import CSRGraph
+from .graph import RoadGraph
+
+Point = Tuple[float, float]
+Snap = Tuple[Optional[int], float]
+
+
+def distance_matrix(graph: RoadGraph, sources: List[Point], destinations: List[Point],
+                    workers: int = 1, pool: Optional['MatrixPool'] = None
+                    ) -> Tuple[List[List[Optional[float]]], List[Snap], List[Snap]]:
+    """Ma trận khoảng cách trên graph giữa các điểm (lat, lon).
+
+    Mỗi điểm được snap một lần về node gần nhất; mỗi node nguồn khác nhau chạy một
+    one_to_many (Dijkstra dừng khi đã settle hết các node đích). workers > 1 chia các
+    node nguồn cho pool (MatrixPool) nếu có. Trả về (distances, source_snaps, destination_snaps),
+    snap là (node_id, khoảng cách từ điểm tới node); distances[i][j] = None khi không có đường.
+    """
+    source_snaps = [graph.find_nearest_node(lat, lon) for lat, lon in sources]
+    destination_snaps = [graph.find_nearest_node(lat, lon) for lat, lon in destinations]
+
+    # Node trùng nhau chỉ tính một lần
+    start_nodes = list(dict.fromkeys(node for node, _ in source_snaps if node is not None))
+    end_nodes = list(dict.fromkeys(node for node, _ in destination_snaps if node is not None))
+
+    rows = None
+    if pool is not None and workers > 1 and len(start_nodes) > 1:
+        rows = pool.rows(graph.csr, start_nodes, end_nodes, workers)
+    if rows is None:
+        rows = [one_to_many(graph.csr, start, end_nodes) for start in start_nodes]
+
+    row_of = dict(zip(start_nodes, rows))
+    column_of = {node: j for j, node in enumerate(end_nodes)}
+
+    distances = []
+    for start, _ in source_snaps:
+        row = row_of.get(start)
+        distances.append([None if row is None or end is None else row[column_of[end]]
+                          for end, _ in destination_snaps])
+
+    return distances, source_snaps, destination_snaps
+
+
+class MatrixPool:
+    """Process pool của distance_matrix, tạo lần đầu khi cần và dùng lại cho mọi request.
+
+    Worker được tạo bằng forkserver (hoặc spawn), không fork process web đang có nhiều thread.
+    Topology được worker mmap từ graph snapshot; weights hiện tại (đã áp constraints) được ghi
+    một lần cho mỗi bộ weights ra matrix_weights_<tag>_<signature>.bin, worker mmap file đó và
+    giữ CSR tới khi weights đổi. Mỗi task chỉ gửi đường dẫn file và danh sách node.
+    """
+
+    # Số file weights giữ lại cho các lần gọi sau; file đã bị đẩy ra chỉ bị xóa khi không còn
+    # request nào có task đang dùng nó (_weights_refs)
+    KEEP_WEIGHTS = 2
+
+    def __init__(self, snapshot_path: str, max_workers: int, directory: str, tag: str = ''):
+        self.snapshot_path = snapshot_path
+        self.max_workers = max(1, max_workers)
+        self.directory = directory
+        self.tag = tag or str(os.getpid())
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Snapshot đã kiểm tra khớp topology: (mtime, offsets của csr đã so sánh)
+        self._checked: Optional[Tuple[float, object]] = None
+        self._weights_files: List[str] = []
+        # Số request đang có task đọc từng file weights
+        self._weights_refs: Dict[str, int] = {}
+
+    def rows(self, csr: CSRGraph, start_nodes: List[int], end_nodes: List[int],
+             workers: int) -> Optional[List[List[Optional[float]]]]:
+        """Các hàng one_to_many tính trên pool; None nếu snapshot không khớp topology của csr
+        (vd. chưa có snapshot), khi đó người gọi tự tính tuần tự."""
+        with self._lock:
+            snapshot_mtime = self._snapshot_mtime(csr)
+            if snapshot_mtime is None:
+                return None
+            weights_path = self._weights_file(csr)
+            executor = self._get_executor()
+            self._weights_refs[weights_path] = self._weights_refs.get(weights_path, 0) + 1
+
+        workers = min(workers, self.max_workers)
+        chunk_size = max(1, -(-len(start_nodes) // (workers * 4)))
+        chunks = [start_nodes[i:i + chunk_size] for i in range(0, len(start_nodes), chunk_size)]
+
+        futures = []
+        rows = []
+        try:
+            for chunk in chunks:
+                futures.append(executor.submit(_worker_rows, self.snapshot_path, snapshot_mtime,
+                                               weights_path, chunk, end_nodes))
+            for future in futures:
+                rows.extend(future.result())
+        except BrokenProcessPool as e:
+            # Worker chết giữa chừng: bỏ pool hỏng (request sau tạo lại), request này tính tuần tự
+            print(f"Error in distance matrix process pool: {e}")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            return None
+        except OSError as e:
+            # Worker không đọc được snapshot/weights (vd. snapshot vừa bị ghi lại): tính tuần tự
+            print(f"Error reading graph files in distance matrix worker: {e}")
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
+            self._release_weights(weights_path)
+        return rows
+
+    def _release_weights(self, path: str):
+        with self._lock:
+            refs = self._weights_refs.pop(path) - 1
+            if refs > 0:
+                self._weights_refs[path] = refs
+            elif path not in self._weights_files:
+                self._remove_weights(path)
+
+    @staticmethod
+    def _remove_weights(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _snapshot_mtime(self, csr: CSRGraph) -> Optional[float]:
+        try:
+            mtime = os.path.getmtime(self.snapshot_path)
+        except OSError:
+            return None
+        # Topology dùng chung giữa các bản copy của csr nên chỉ cần so một lần mỗi graph
+        if self._checked is not None and self._checked[0] == mtime and self._checked[1] is csr.offsets:
+            return mtime
+
+        try:
+            _, arrays = load_arrays(self.snapshot_path, use_mmap=True)
+            matches = all(memoryview(arrays[name]) == memoryview(values) for name, values in (
+                ('csr_node_ids', csr.node_ids), ('offsets', csr.offsets),
+                ('targets', csr.targets), ('slot_edge_ids', csr.edge_ids)))
+        except Exception as e:
+            print(f"Error checking graph snapshot for distance matrix: {e}")
+            return None
+        if not matches:
+            return None
+        self._checked = (mtime, csr.offsets)
+        return mtime
+
+    def _weights_file(self, csr: CSRGraph) -> str:
+        path = os.path.join(self.directory, f"matrix_weights_{self.tag}_{csr.signature()}.bin")
+        if path in self._weights_files:
+            return path
+
+        save_arrays(path, {'signature': csr.signature()}, {
+            'weights': csr.weights,
+            'reverse_weights': csr.reverse_weights
+        })
+        self._weights_files.append(path)
+        while len(self._weights_files) > self.KEEP_WEIGHTS:
+            old_path = self._weights_files.pop(0)
+            # Task của request khác còn đọc file thì _release_weights xóa khi request đó xong
+            if old_path not in self._weights_refs:
+                self._remove_weights(old_path)
+        return path
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            for path in glob.glob(os.path.join(self.directory, f"matrix_weights_{self.tag}_*.bin")):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Error removing {path}: {e}")
+            self._weights_files = []
+            self._checked = None
+
+
+# Trong worker: topology mmap từ snapshot (theo mtime) và CSR với weights đang dùng
+_worker_topology: Optional[Tuple[str, float, CSRGraph]] = None
+_worker_csr: Optional[Tuple[str, CSRGraph]] = None
+
+
+def _worker_graph(snapshot_path: str, snapshot_mtime: float, weights_path: str) -> CSRGraph:
+    global _worker_topology, _worker_csr
+
+    if _worker_topology is None or _worker_topology[:2] != (snapshot_path, snapshot_mtime):
+        _, arrays = load_arrays(snapshot_path, use_mmap=True)
+        base = CSRGraph(arrays['csr_node_ids'], arrays['csr_lats'], arrays['csr_lons'],
+                        arrays['offsets'], arrays['targets'], arrays['slot_edge_ids'],
+                        arrays['base_weights'], arrays['twins'])
+        _worker_topology = (snapshot_path, snapshot_mtime, base)
+        _worker_csr = None
+
+    if _worker_csr is None or _worker_csr[0] != weights_path:
+        _, arrays = load_arrays(weights_path, use_mmap=True)
+        _worker_csr = (weights_path,
+                       _worker_topology[2].with_weights(arrays['weights'], arrays['reverse_weights']))
+    return _worker_csr[1]
+
+
+def _worker_rows(snapshot_path: str, snapshot_mtime: float, weights_path: str,
+                 start_nodes: List[int], end_nodes: List[int]) -> List[List[Optional[float]]]:
+    csr = _worker_graph(snapshot_path, snapshot_mtime, weights_path)
+    return [one_to_many(csr, start, end_nodes) for start in start_nodes]
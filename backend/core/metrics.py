@@ -0,0 +1,151 @@
+import bisect
+import functools
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Mốc (giây) của histogram độ trễ, từ 0.1 ms tới 5 s
+DEFAULT_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class SearchStats:
+    """Bộ đếm của một lần search, được điền khi truyền stats=... vào hàm search.
+
+    relaxations là số cạnh (slot) đã xét khi mở rộng các node được settle;
+    stale_pops là số lần pop ra node đã settle trước đó (bản ghi cũ còn trong heap).
+    """
+
+    __slots__ = ('settled', 'pushes', 'pops', 'relaxations', 'elapsed')
+
+    def __init__(self):
+        self.settled = 0
+        self.pushes = 0
+        self.pops = 0
+        self.relaxations = 0
+        self.elapsed = 0.0
+
+    @property
+    def stale_pops(self) -> int:
+        return self.pops - self.settled
+
+    def record(self, settled: int, pushes: int, pops: int, relaxations: int):
+        self.settled += settled
+        self.pushes += pushes
+        self.pops += pops
+        self.relaxations += relaxations
+
+    def to_dict(self) -> Dict:
+        return {
+            'settled': self.settled,
+            'heap_pushes': self.pushes,
+            'heap_pops': self.pops,
+            'stale_pops': self.stale_pops,
+            'relaxations': self.relaxations,
+            'elapsed_ms': round(self.elapsed * 1000, 3)
+        }
+
+
+def timed_search(search):
+    """Decorator cho hàm search có tham số stats: khi gọi với stats=SearchStats(),
+    cộng thêm thời gian chạy vào stats.elapsed"""
+    @functools.wraps(search)
+    def wrapper(*args, stats: Optional[SearchStats] = None, **kwargs):
+        if stats is None:
+            return search(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return search(*args, stats=stats, **kwargs)
+        finally:
+            stats.elapsed += time.perf_counter() - started
+    return wrapper
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histogram và counter theo nhãn, xuất ra định dạng text của Prometheus.
+
+    Số liệu nằm trong bộ nhớ của từng tiến trình (mỗi worker gunicorn có bộ đếm riêng).
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # name -> (help, type, {labels: Histogram | số đếm})
+        self._metrics: Dict[str, Tuple[str, str, Dict[Labels, object]]] = {}
+
+    def observe(self, name: str, value: float, help_text: str = '', **labels: str):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._series(name, help_text, 'histogram')
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, help_text: str = '', **labels: str):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._series(name, help_text, 'counter')
+            series[key] = series.get(key, 0) + amount
+
+    def _series(self, name: str, help_text: str, metric_type: str) -> Dict[Labels, object]:
+        entry = self._metrics.get(name)
+        if entry is None:
+            entry = self._metrics[name] = (help_text, metric_type, {})
+        return entry[2]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, (help_text, metric_type, series) in sorted(self._metrics.items()):
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in sorted(series.items()):
+                    if metric_type == 'histogram':
+                        lines.extend(_histogram_lines(name, labels, value))
+                    else:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name: str, labels: Labels, histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    bounds = [_format_value(bound) for bound in histogram.buckets] + ['+Inf']
+    for bound, count in zip(bounds, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+
+def _labels_key(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
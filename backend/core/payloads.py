@@ -0,0 +1,75 @@
+import gzip
+import hashlib
+import threading
+from typing import Callable, Dict, Hashable, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, không có thì chỉ nén gzip
+    brotli = None
+
+# Body nhỏ hơn ngưỡng này không nén (header gzip/br còn lớn hơn phần tiết kiệm được)
+MIN_COMPRESS_SIZE = 256
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Content-Encoding hỗ trợ, theo thứ tự ưu tiên"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class Payload:
+    """Body đã serialize sẵn của một response, kèm ETag và các bản nén (tạo khi cần lần đầu)"""
+
+    def __init__(self, body: bytes, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self._encoded: Dict[str, bytes] = {'identity': body}
+
+    def encoding_for(self, accepted: Callable[[str], float]) -> str:
+        """Chọn encoding theo hàm accepted(encoding) -> quality (của header Accept-Encoding)"""
+        if len(self.body) >= MIN_COMPRESS_SIZE:
+            for encoding in available_encodings():
+                if accepted(encoding) > 0:
+                    return encoding
+        return 'identity'
+
+    def encoded(self, encoding: str) -> bytes:
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == 'gzip':
+                # mtime=0: cùng body luôn cho cùng bytes (ETag ổn định giữa các worker)
+                data = gzip.compress(self.body, GZIP_LEVEL, mtime=0)
+            elif encoding == 'br' and brotli is not None:
+                data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            else:
+                raise ValueError(f"Unsupported encoding: {encoding}")
+            self._encoded[encoding] = data
+        return data
+
+    def etag_for(self, encoding: str) -> str:
+        # ETag mạnh phải khác nhau giữa các bản nén của cùng nội dung
+        return self.etag if encoding == 'identity' else f"{self.etag}-{encoding}"
+
+
+class PayloadCache:
+    """Payload theo tên, dựng lại khi đối tượng nguồn (vd. graph.nodes) không còn là đối tượng cũ.
+
+    So sánh nguồn bằng 'is' và giữ tham chiếu tới nó, nên không nhầm với đối tượng mới
+    tình cờ được cấp cùng địa chỉ.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Tuple[object, Payload]] = {}
+
+    def get(self, name: Hashable, source: object, build: Callable[[], Payload]) -> Payload:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] is source:
+                return entry[1]
+            payload = build()
+            self._entries[name] = (source, payload)
+            return payload
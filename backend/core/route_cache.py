@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from .csr import INF
+
+RouteKey = Tuple[int, int, str]
+NodePair = Tuple[int, int]
+
+
+class RouteCache:
+    """LRU cache kết quả tìm đường theo (start_node, end_node, algorithm).
+
+    Cache gắn với graph.constraint_version. Khi constraints đổi, invalidate() chỉ bỏ các
+    route đi qua edge bị đổi nếu mọi chi phí chỉ tăng (hoặc bị cấm): các route khác vẫn
+    tối ưu vì không đường nào khác rẻ đi. Nếu có chiều nào rẻ đi hoặc được mở lại thì
+    route nào cũng có thể đổi nên xóa toàn bộ. Kết quả "không có đường" cũng được cache
+    (path = None) và chỉ bị xóa trong trường hợp sau.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version: Optional[int] = None
+        self._entries: 'OrderedDict[RouteKey, tuple]' = OrderedDict()
+        # (node nhỏ, node lớn) → các route đi qua cặp node đó
+        self._by_pair: Dict[NodePair, Set[RouteKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: RouteKey, version: int) -> Optional[tuple]:
+        """(path, distance) nếu có trong cache, ngược lại None"""
+        with self._lock:
+            if self.version is None or version > self.version:
+                # Graph đổi mà không qua invalidate() (vd. load lại): không biết edge nào đổi
+                self._clear()
+                self.version = version
+
+            entry = None if version < self.version else self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: RouteKey, version: int, path: Optional[List[int]], distance: Optional[float]):
+        """version là constraint_version lúc bắt đầu tìm; kết quả cũ hơn cache thì bỏ qua"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = (path, distance, time.monotonic())
+            for pair in _path_pairs(path):
+                self._by_pair.setdefault(pair, set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, graph, previous_costs: Dict[int, Tuple[float, float]]):
+        """Gọi sau graph.apply_constraint_changes; previous_costs[edge_id] là weights 2 chiều trước khi đổi"""
+        with self._lock:
+            pairs = set()
+            flush = False
+            for edge_id, (old_forward, old_backward) in previous_costs.items():
+                forward_cost, backward_cost = graph.edge_direction_costs(edge_id)
+                new_forward = INF if forward_cost is None else forward_cost
+                new_backward = INF if backward_cost is None else backward_cost
+                if new_forward < old_forward or new_backward < old_backward:
+                    flush = True
+                    break
+                if new_forward != old_forward or new_backward != old_backward:
+                    edge = graph.edges[edge_id]
+                    pairs.add(_pair(edge['from_node'], edge['to_node']))
+
+            if flush:
+                self.invalidations += len(self._entries)
+                self._clear()
+            else:
+                for pair in pairs:
+                    for key in list(self._by_pair.get(pair, ())):
+                        self._drop(key)
+                        self.invalidations += 1
+            self.version = graph.constraint_version
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.version = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'version': self.version
+            }
+
+    def _drop(self, key: RouteKey):
+        path = self._entries.pop(key)[0]
+        for pair in _path_pairs(path):
+            keys = self._by_pair.get(pair)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_pair[pair]
+
+    def _clear(self):
+        self._entries.clear()
+        self._by_pair.clear()
+
+
+def _pair(a: int, b: int) -> NodePair:
+    return (a, b) if a <= b else (b, a)
+
+
+def _path_pairs(path: Optional[List[int]]) -> Set[NodePair]:
+    if not path:
+        return set()
+    return {_pair(a, b) for a, b in zip(path, path[1:])}
@@ -0,0 +1,130 @@
+import glob
+import multiprocessing
+import os
+import re
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+from .arrayfile import ArrayLike, load_arrays, save_arrays
+from .csr import CSRGraph
+
+# tmpfs: file ở đây nằm hẳn trong RAM, các process mmap cùng một vùng nhớ
+DEFAULT_SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class SharedGraphState:
+    """Trạng thái graph dùng chung giữa các worker process (tạo trong process cha trước khi fork).
+
+    Topology, spatial index và nhãn SCC nằm trong graph snapshot (snapshot.py) được mọi worker
+    mmap; CH/landmarks/overlay theo signature nằm trong cache dir (load_or_build với use_mmap).
+    Ở đây chỉ có weights (kèm heuristic_scale): mỗi version có một file delta_<tag>_<version>.bin
+    ghi các constraint vừa đổi và weights của mọi slot đã đổi kể từ checkpoint gần nhất; cứ
+    CHECKPOINT_INTERVAL version mới ghi lại toàn bộ weights (weights_<tag>_<version>.bin). Worker mmap checkpoint
+    (copy-on-write, chỉ các trang chứa slot trong delta thành bản riêng) rồi áp delta, và áp các
+    constraint trong delta thay vì đọc lại file constraints. `write_lock` đảm bảo mỗi lúc chỉ
+    một worker sửa constraints.
+    """
+
+    # Số version giữa 2 lần ghi lại toàn bộ weights; delta tích lũy không dài hơn số lần sửa này
+    CHECKPOINT_INTERVAL = 16
+
+    def __init__(self, directory: str, tag: str = ''):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.tag = tag or str(os.getpid())
+        self._version = multiprocessing.Value('q', 0)
+        # Version có file weights đầy đủ mà các delta hiện tại dựa vào
+        self._checkpoint = multiprocessing.Value('q', 0)
+        self.write_lock = multiprocessing.Lock()
+
+    def current_version(self) -> int:
+        return self._version.value
+
+    def weights_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"weights_{self.tag}_{version}.bin")
+
+    def delta_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"delta_{self.tag}_{version}.bin")
+
+    def publish(self, csr: CSRGraph, changes: Optional[Dict[int, Optional[Dict]]] = None,
+                slots: Iterable[int] = ()) -> int:
+        """Phát weights của csr thành version mới; gọi khi đang giữ write_lock.
+
+        changes: edge_id → constraint mới (None: đã xóa) so với version trước, slots: các slot có
+        weights vừa đổi. changes=None (vd. lần phát đầu) thì worker khác phải đọc lại toàn bộ
+        constraints và version này luôn là checkpoint.
+        """
+        version = self._version.value + 1
+        checkpoint = self._checkpoint.value
+        if changes is None or checkpoint == 0 or version - checkpoint >= self.CHECKPOINT_INTERVAL:
+            save_arrays(self.weights_path(version), {'version': version, 'signature': csr.signature()}, {
+                'weights': csr.weights,
+                'reverse_weights': csr.reverse_weights
+            })
+            previous_checkpoint, checkpoint = checkpoint, version
+            delta_slots = array('q')
+        else:
+            previous_checkpoint = None
+            # Delta tích lũy từ checkpoint: slot của delta trước cộng slot vừa đổi
+            _, previous = load_arrays(self.delta_path(version - 1))
+            delta_slots = array('q', sorted(set(previous['slots']).union(slots)))
+
+        save_arrays(self.delta_path(version), {
+            'version': version,
+            'checkpoint': checkpoint,
+            # Phát kèm để worker không phải quét lại mọi slot (O(E)) ở request A* đầu tiên
+            'heuristic_scale': csr.heuristic_scale,
+            'changes': None if changes is None else [[edge_id, constraint] for edge_id, constraint in changes.items()]
+        }, {
+            'slots': delta_slots,
+            'weights': array('d', (csr.weights[slot] for slot in delta_slots)),
+            'reverse_weights': array('d', (csr.reverse_weights[slot] for slot in delta_slots))
+        })
+        self._checkpoint.value = checkpoint
+        self._version.value = version
+
+        if previous_checkpoint:
+            # Giữ lại chuỗi checkpoint trước cho worker đang đọc dở; file cũ hơn thì xóa
+            self._remove_files(lambda old_version: old_version < previous_checkpoint)
+        return version
+
+    def load_weights(self, version: int) -> Tuple[ArrayLike, ArrayLike, float]:
+        """(weights, reverse_weights, heuristic_scale) của version, dùng cho CSRGraph.with_weights"""
+        meta, delta = load_arrays(self.delta_path(version))
+        slots = delta['slots']
+        _, arrays = load_arrays(self.weights_path(meta['checkpoint']), use_mmap=True,
+                                copy_on_write=len(slots) > 0)
+        weights, reverse_weights = arrays['weights'], arrays['reverse_weights']
+        for slot, weight, reverse_weight in zip(slots, delta['weights'], delta['reverse_weights']):
+            weights[slot] = weight
+            reverse_weights[slot] = reverse_weight
+        return weights, reverse_weights, meta['heuristic_scale']
+
+    def load_changes(self, from_version: int, to_version: int) -> Optional[Dict[int, Optional[Dict]]]:
+        """Constraint đã đổi sau from_version tới to_version (edge_id → constraint mới, None: đã xóa);
+        None khi không đủ delta (worker tụt quá xa, hoặc có version phát không kèm thay đổi)"""
+        changes: Dict[int, Optional[Dict]] = {}
+        for version in range(from_version + 1, to_version + 1):
+            try:
+                meta, _ = load_arrays(self.delta_path(version))
+            except FileNotFoundError:
+                return None
+            if meta['changes'] is None:
+                return None
+            for edge_id, constraint in meta['changes']:
+                changes[edge_id] = constraint
+        return changes
+
+    def _remove_files(self, should_remove):
+        pattern = re.compile(rf"(?:weights|delta)_{re.escape(self.tag)}_(\d+)\.bin")
+        for path in glob.glob(os.path.join(self.directory, f"*_{self.tag}_*.bin")):
+            match = pattern.fullmatch(os.path.basename(path))
+            if match is None or not should_remove(int(match.group(1))):
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing {path}: {e}")
+
+    def cleanup(self):
+        self._remove_files(lambda version: True)
@@ -0,0 +1,203 @@
+import os
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from .arrayfile import load_arrays, save_arrays
+from .components import ComponentIndex
+from .csr import CSRGraph
+from .graph import RoadGraph
+from .spatial import EdgeGridIndex, NodeGridIndex, PackedCells
+
+SNAPSHOT_FORMAT = 2
+
+
+class NodeArrayView(Mapping):
+    """graph.nodes của graph load từ snapshot: node_id → (lat, lon) đọc thẳng trên mảng mmap,
+    không dựng dict. Duyệt theo thứ tự trong nodes.csv, tra cứu qua csr.index."""
+
+    def __init__(self, node_ids: Sequence[int], lats: Sequence[float], lons: Sequence[float],
+                 csr: CSRGraph):
+        self._node_ids = node_ids
+        self._lats = lats
+        self._lons = lons
+        self._index = csr.index
+        self._csr_lats = csr.lats
+        self._csr_lons = csr.lons
+
+    def __getitem__(self, node_id: int) -> Tuple[float, float]:
+        i = self._index[node_id]
+        return self._csr_lats[i], self._csr_lons[i]
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._index
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._node_ids)
+
+    def __len__(self) -> int:
+        return len(self._node_ids)
+
+    def values(self) -> Iterator[Tuple[float, float]]:
+        return zip(self._lats, self._lons)
+
+    def items(self) -> Iterator[Tuple[int, Tuple[float, float]]]:
+        return zip(self._node_ids, zip(self._lats, self._lons))
+
+
+class EdgeArrayView(Mapping):
+    """graph.edges của graph load từ snapshot: edge_id → dict thuộc tính, dict được tạo khi đọc.
+    Duyệt theo thứ tự trong edges.csv; tra cứu bằng tìm nhị phân trên sorted_ids (order[i] là vị
+    trí của sorted_ids[i] trong các mảng thuộc tính)."""
+
+    def __init__(self, edge_ids: Sequence[int], from_nodes: Sequence[int], to_nodes: Sequence[int],
+                 distances: Sequence[float], oneway: Sequence[int],
+                 sorted_ids: Sequence[int], order: Sequence[int]):
+        self._edge_ids = edge_ids
+        self._from_nodes = from_nodes
+        self._to_nodes = to_nodes
+        self._distances = distances
+        self._oneway = oneway
+        self._sorted_ids = sorted_ids
+        self._order = order
+
+    def _position(self, edge_id) -> int:
+        try:
+            i = bisect_left(self._sorted_ids, edge_id)
+        except TypeError:
+            return -1
+        if i == len(self._sorted_ids) or self._sorted_ids[i] != edge_id:
+            return -1
+        return self._order[i]
+
+    def _record(self, position: int) -> Dict:
+        return {
+            'from_node': self._from_nodes[position],
+            'to_node': self._to_nodes[position],
+            'distance': self._distances[position],
+            'is_oneway': self._oneway[position]
+        }
+
+    def __getitem__(self, edge_id: int) -> Dict:
+        position = self._position(edge_id)
+        if position == -1:
+            raise KeyError(edge_id)
+        return self._record(position)
+
+    def __contains__(self, edge_id) -> bool:
+        return self._position(edge_id) != -1
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._edge_ids)
+
+    def __len__(self) -> int:
+        return len(self._edge_ids)
+
+    def values(self) -> Iterator[Dict]:
+        return map(self._record, range(len(self._edge_ids)))
+
+    def items(self) -> Iterator[Tuple[int, Dict]]:
+        return zip(self._edge_ids, self.values())
+
+
+def build_snapshot(nodes: List[Dict], edges: List[Dict], path: str):
+    """Biên dịch nodes/edges (chưa có constraints) thành file nhị phân gồm mảng node, edge,
+    topology CSR, nhãn thành phần liên thông và các ô của lưới spatial, để load_snapshot chỉ
+    cần mmap file, không parse CSV hay dựng lại cấu trúc nào."""
+    graph = RoadGraph()
+    for node in nodes:
+        graph.add_node(node['node_id'], node['latitude'], node['longitude'])
+    for edge in edges:
+        graph.add_edge(edge['edge_id'], edge['from_node'], edge['to_node'],
+                       edge['distance'], edge['is_oneway'])
+    graph.rebuild_adjacency()
+    graph.build_spatial_index()
+    graph.build_edge_index()
+    csr = graph.csr
+    components = graph.build_components()
+    node_cells, node_grid = graph.spatial_index.pack()
+    edge_cells, edge_grid = graph.edge_index.pack()
+
+    edge_ids = array('q', graph.edges.keys())
+    edge_order = array('q', sorted(range(len(edge_ids)), key=edge_ids.__getitem__))
+
+    save_arrays(path, {
+        'format': SNAPSHOT_FORMAT,
+        'node_grid': dict(node_grid, layout=node_cells.layout),
+        'edge_grid': dict(edge_grid, layout=edge_cells.layout)
+    }, {
+        'edge_ids': edge_ids,
+        'edge_from': array('q', (edge['from_node'] for edge in graph.edges.values())),
+        'edge_to': array('q', (edge['to_node'] for edge in graph.edges.values())),
+        'edge_distance': array('d', (edge['distance'] for edge in graph.edges.values())),
+        'edge_oneway': array('b', (edge['is_oneway'] for edge in graph.edges.values())),
+        'edge_sorted_ids': array('q', (edge_ids[i] for i in edge_order)),
+        'edge_order': edge_order,
+        # Thứ tự node như trong nodes.csv (CSR sắp xếp theo node_id)
+        'node_ids': array('q', graph.nodes.keys()),
+        'lats': array('d', (lat for lat, _ in graph.nodes.values())),
+        'lons': array('d', (lon for _, lon in graph.nodes.values())),
+        'csr_node_ids': csr.node_ids,
+        'csr_lats': csr.lats,
+        'csr_lons': csr.lons,
+        'offsets': csr.offsets,
+        'targets': csr.targets,
+        'slot_edge_ids': csr.edge_ids,
+        'base_weights': csr.weights,
+        'base_reverse_weights': csr.reverse_weights,
+        'twins': csr.twins,
+        'scc_labels': components.labels,
+        'scc_sizes': array('q', components.sizes),
+        'scc_depths': components.depths,
+        'scc_lows': components.lows,
+        'weak_labels': components.weak_labels,
+        'node_grid_keys': node_cells.keys,
+        'node_grid_offsets': node_cells.offsets,
+        'node_grid_items': node_cells.items_array,
+        'edge_grid_keys': edge_cells.keys,
+        'edge_grid_offsets': edge_cells.offsets,
+        'edge_grid_items': edge_cells.items_array
+    })
+
+
+def is_snapshot_fresh(path: str, *source_paths: str) -> bool:
+    if not os.path.exists(path):
+        return False
+    snapshot_mtime = os.path.getmtime(path)
+    return all(os.path.getmtime(source) <= snapshot_mtime
+               for source in source_paths if os.path.exists(source))
+
+
+def load_snapshot(path: str) -> RoadGraph:
+    """RoadGraph chưa áp constraints. Mọi mảng nằm trên file được mmap (dùng chung page cache giữa
+    các worker); chỉ weights được copy vì sẽ bị sửa khi áp constraints. nodes/edges là view trên
+    mảng, adjacency dict chỉ dựng khi có nơi cần tới (backend 'dict', get_neighbors)."""
+    meta, arrays = load_arrays(path, use_mmap=True)
+    if meta.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported graph snapshot format: {meta.get('format')}")
+
+    graph = RoadGraph()
+    graph.csr = CSRGraph(arrays['csr_node_ids'], arrays['csr_lats'], arrays['csr_lons'],
+                         arrays['offsets'], arrays['targets'], arrays['slot_edge_ids'],
+                         array('d', arrays['base_weights']), arrays['twins'],
+                         array('d', arrays['base_reverse_weights']))
+    graph.nodes = NodeArrayView(arrays['node_ids'], arrays['lats'], arrays['lons'], graph.csr)
+    graph.edges = EdgeArrayView(arrays['edge_ids'], arrays['edge_from'], arrays['edge_to'],
+                                arrays['edge_distance'], arrays['edge_oneway'],
+                                arrays['edge_sorted_ids'], arrays['edge_order'])
+    graph.adjacency = None
+    graph.components = ComponentIndex(arrays['scc_labels'], list(arrays['scc_sizes']),
+                                      arrays['weak_labels'], arrays['scc_depths'], arrays['scc_lows'])
+
+    node_grid, edge_grid = meta['node_grid'], meta['edge_grid']
+    graph.spatial_index = NodeGridIndex.from_packed(
+        PackedCells(*node_grid['layout'], arrays['node_grid_keys'], arrays['node_grid_offsets'],
+                    arrays['node_grid_items']),
+        node_grid, graph.nodes)
+    graph.edge_index = EdgeGridIndex.from_packed(
+        PackedCells(*edge_grid['layout'], arrays['edge_grid_keys'], arrays['edge_grid_offsets'],
+                    arrays['edge_grid_items']),
+        edge_grid)
+    graph.constraint_version += 1
+    return graph
@@ -0,0 +1,351 @@
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from .geometry import haversine_many, min_distance_for_offset
+
+Cell = Tuple[int, int]
+
+
+class PackedCells:
+    """Các ô của lưới dưới dạng mảng phẳng (vd. mmap từ graph snapshot), đọc như dict ô → list id.
+
+    Ô (r, c) có khóa (r - min_row) * num_cols + (c - min_col); keys tăng dần, ô thứ i chứa
+    items[offsets[i]:offsets[i + 1]]. Chỉ đọc.
+    """
+
+    def __init__(self, min_row: int, min_col: int, num_cols: int,
+                 keys: Sequence[int], offsets: Sequence[int], items: Sequence[int]):
+        self.min_row = min_row
+        self.min_col = min_col
+        self.num_cols = num_cols
+        self.keys = keys
+        self.offsets = offsets
+        self.items_array = items
+
+    @classmethod
+    def from_cells(cls, cells: Mapping[Cell, List[int]]) -> 'PackedCells':
+        if not cells:
+            return cls(0, 0, 1, array('q'), array('q', [0]), array('q'))
+        min_row = min(r for r, _ in cells)
+        min_col = min(c for _, c in cells)
+        num_cols = max(c for _, c in cells) - min_col + 1
+
+        keys = array('q')
+        offsets = array('q', [0])
+        items = array('q')
+        for (r, c), bucket in sorted(cells.items()):
+            keys.append((r - min_row) * num_cols + (c - min_col))
+            items.extend(bucket)
+            offsets.append(len(items))
+        return cls(min_row, min_col, num_cols, keys, offsets, items)
+
+    def get(self, cell: Cell, default=None):
+        r, c = cell
+        col = c - self.min_col
+        if col < 0 or col >= self.num_cols or r < self.min_row:
+            return default
+        key = (r - self.min_row) * self.num_cols + col
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return default
+        return self.items_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def items(self) -> Iterator[Tuple[Cell, Sequence[int]]]:
+        offsets = self.offsets
+        for i, key in enumerate(self.keys):
+            row, col = divmod(key, self.num_cols)
+            yield (row + self.min_row, col + self.min_col), self.items_array[offsets[i]:offsets[i + 1]]
+
+    @property
+    def layout(self) -> List[int]:
+        """[min_row, min_col, num_cols]: cùng keys/offsets/items đủ để dựng lại PackedCells"""
+        return [self.min_row, self.min_col, self.num_cols]
+
+    def to_dict(self) -> Dict[Cell, List[int]]:
+        return {cell: list(bucket) for cell, bucket in self.items()}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class NodeGridIndex:
+    """Lưới đều theo (lat, lon) để tìm node gần nhất mà không phải quét toàn bộ graph.nodes"""
+
+    # Số node trung bình mong muốn trong mỗi ô khi tự chọn cell_size
+    TARGET_NODES_PER_CELL = 4
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Cell, List[int]] = {}
+        self.coords: Dict[int, Tuple[float, float]] = {}
+        # None khi cells là PackedCells chỉ đọc (from_packed)
+        self._node_cell: Optional[Dict[int, Cell]] = {}
+        self._min_row = self._max_row = 0
+        self._min_col = self._max_col = 0
+        self._max_abs_lat = 0.0
+
+    @classmethod
+    def from_nodes(cls, nodes: Dict[int, Tuple[float, float]],
+                   cell_size: Optional[float] = None) -> 'NodeGridIndex':
+        if cell_size is None:
+            cell_size = cls.suggest_cell_size(nodes)
+
+        index = cls(cell_size)
+        for node_id, (lat, lon) in nodes.items():
+            index.insert(node_id, lat, lon)
+        return index
+
+    @classmethod
+    def suggest_cell_size(cls, nodes: Dict[int, Tuple[float, float]]) -> float:
+        if len(nodes) < 2:
+            return 0.01
+
+        lats = [lat for lat, _ in nodes.values()]
+        lons = [lon for _, lon in nodes.values()]
+        area = max(max(lats) - min(lats), 1e-6) * max(max(lons) - min(lons), 1e-6)
+        return max(math.sqrt(area * cls.TARGET_NODES_PER_CELL / len(nodes)), 1e-5)
+
+    @classmethod
+    def from_packed(cls, cells: PackedCells, meta: Dict,
+                    coords: Mapping[int, Tuple[float, float]]) -> 'NodeGridIndex':
+        """Index chỉ đọc dựng từ kết quả pack() đã lưu (graph snapshot), không duyệt lại node nào.
+        coords: mapping node_id → (lat, lon), vd. graph.nodes. insert/remove chuyển về dict trước."""
+        index = cls(meta['cell_size'])
+        index.cells = cells
+        index.coords = coords
+        index._node_cell = None
+        index._min_row, index._max_row, index._min_col, index._max_col = meta['bounds']
+        index._max_abs_lat = meta['max_abs_lat']
+        return index
+
+    def pack(self) -> Tuple[PackedCells, Dict]:
+        """(ô dạng mảng, meta dạng JSON) để lưu rồi dựng lại bằng from_packed"""
+        return PackedCells.from_cells(self.cells), {
+            'cell_size': self.cell_size,
+            'bounds': [self._min_row, self._max_row, self._min_col, self._max_col],
+            'max_abs_lat': self._max_abs_lat
+        }
+
+    def _thaw(self):
+        if self._node_cell is None:
+            self.cells = self.cells.to_dict()
+            self.coords = dict(self.coords)
+            self._node_cell = {node_id: cell for cell, bucket in self.cells.items() for node_id in bucket}
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def _cell_of(self, lat: float, lon: float) -> Cell:
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def insert(self, node_id: int, lat: float, lon: float):
+        self._thaw()
+        if node_id in self._node_cell:
+            self.remove(node_id)
+
+        cell = self._cell_of(lat, lon)
+        if not self.cells:
+            self._min_row = self._max_row = cell[0]
+            self._min_col = self._max_col = cell[1]
+        else:
+            self._min_row = min(self._min_row, cell[0])
+            self._max_row = max(self._max_row, cell[0])
+            self._min_col = min(self._min_col, cell[1])
+            self._max_col = max(self._max_col, cell[1])
+
+        self.cells.setdefault(cell, []).append(node_id)
+        self.coords[node_id] = (lat, lon)
+        self._node_cell[node_id] = cell
+        self._max_abs_lat = max(self._max_abs_lat, abs(lat))
+
+    def remove(self, node_id: int):
+        self._thaw()
+        cell = self._node_cell.pop(node_id, None)
+        if cell is None:
+            return
+
+        bucket = self.cells[cell]
+        bucket.remove(node_id)
+        if not bucket:
+            del self.cells[cell]
+        del self.coords[node_id]
+
+    def _iter_rings(self, lat: float, lon: float) -> Iterator[Tuple[List[int], float]]:
+        """Duyệt các vòng ô quanh điểm truy vấn, trả về (node trong vòng, cận dưới khoảng cách
+        tới mọi node ở các vòng tiếp theo)"""
+        if not self.cells:
+            return
+
+        row, col = self._cell_of(lat, lon)
+        max_abs_lat = max(self._max_abs_lat, abs(lat))
+
+        # Bỏ qua các vòng chắc chắn nằm ngoài vùng có dữ liệu
+        first_ring = max(self._min_row - row, row - self._max_row,
+                         self._min_col - col, col - self._max_col, 0)
+        last_ring = max(row - self._min_row, self._max_row - row,
+                        col - self._min_col, self._max_col - col)
+
+        for ring in range(first_ring, last_ring + 1):
+            found: List[int] = []
+            for r in range(max(row - ring, self._min_row), min(row + ring, self._max_row) + 1):
+                if r == row - ring or r == row + ring:
+                    cols = range(max(col - ring, self._min_col), min(col + ring, self._max_col) + 1)
+                else:
+                    cols = [c for c in (col - ring, col + ring)
+                            if self._min_col <= c <= self._max_col]
+                for c in cols:
+                    bucket = self.cells.get((r, c))
+                    if bucket:
+                        found.extend(bucket)
+
+            if ring == last_ring:
+                bound = float('inf')
+            else:
+                offset = ring * self.cell_size
+                bound = min_distance_for_offset(offset, offset, max_abs_lat)
+            yield found, bound
+
+    def _distances(self, lat: float, lon: float, node_ids: List[int]) -> List[float]:
+        coords = self.coords
+        return haversine_many(lat, lon, [coords[node_id][0] for node_id in node_ids],
+                              [coords[node_id][1] for node_id in node_ids])
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                max_distance: Optional[float] = None,
+                predicate: Optional[Callable[[int], bool]] = None) -> List[Tuple[float, int]]:
+        """k node gần nhất (distance, node_id), tùy chọn giới hạn bán kính và điều kiện lọc node"""
+        if k <= 0:
+            return []
+
+        limit = float('inf') if max_distance is None else max_distance
+        # Max-heap (giá trị âm) giữ k ứng viên tốt nhất
+        best: List[Tuple[float, int]] = []
+
+        for found, bound in self._iter_rings(lat, lon):
+            if predicate is not None:
+                found = [node_id for node_id in found if predicate(node_id)]
+            for node_id, distance in zip(found, self._distances(lat, lon, found)):
+                if distance > limit:
+                    continue
+                item = (-distance, -node_id)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+
+            if len(best) == k and -best[0][0] <= bound:
+                break
+            if bound > limit:
+                break
+
+        return sorted((-d, -n) for d, n in best)
+
+    def within_radius(self, lat: float, lon: float, radius: float) -> List[Tuple[float, int]]:
+        results: List[Tuple[float, int]] = []
+
+        for found, bound in self._iter_rings(lat, lon):
+            for node_id, distance in zip(found, self._distances(lat, lon, found)):
+                if distance <= radius:
+                    results.append((distance, node_id))
+            if bound > radius:
+                break
+
+        results.sort()
+        return results
+
+
+class EdgeGridIndex:
+    """Lưới đều lưu bounding box của edge: mỗi edge nằm trong mọi ô mà bbox của nó phủ lên.
+
+    Dùng để lọc sơ bộ các edge có thể giao một vùng (bbox) trước khi kiểm tra chính xác.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Cell, List[int]] = {}
+        # None khi cells là PackedCells chỉ đọc (from_packed)
+        self._edge_cells: Optional[Dict[int, List[Cell]]] = {}
+        self._num_edges = 0
+
+    @classmethod
+    def from_edges(cls, nodes: Dict[int, Tuple[float, float]], edges: Dict[int, Dict],
+                   cell_size: Optional[float] = None) -> 'EdgeGridIndex':
+        if cell_size is None:
+            cell_size = NodeGridIndex.suggest_cell_size(nodes)
+
+        index = cls(cell_size)
+        for edge_id, edge in edges.items():
+            from_coords = nodes.get(edge['from_node'])
+            to_coords = nodes.get(edge['to_node'])
+            if from_coords is not None and to_coords is not None:
+                index.insert(edge_id, from_coords, to_coords)
+        return index
+
+    @classmethod
+    def from_packed(cls, cells: PackedCells, meta: Dict) -> 'EdgeGridIndex':
+        """Index chỉ đọc dựng từ kết quả pack() đã lưu (graph snapshot); insert/remove chuyển về dict trước"""
+        index = cls(meta['cell_size'])
+        index.cells = cells
+        index._edge_cells = None
+        index._num_edges = meta['num_edges']
+        return index
+
+    def pack(self) -> Tuple[PackedCells, Dict]:
+        return PackedCells.from_cells(self.cells), {'cell_size': self.cell_size, 'num_edges': len(self)}
+
+    def _thaw(self):
+        if self._edge_cells is None:
+            self.cells = self.cells.to_dict()
+            self._edge_cells = {}
+            for cell, bucket in self.cells.items():
+                for edge_id in bucket:
+                    self._edge_cells.setdefault(edge_id, []).append(cell)
+
+    def __len__(self) -> int:
+        return self._num_edges if self._edge_cells is None else len(self._edge_cells)
+
+    def _cell_range(self, min_lat: float, min_lon: float,
+                    max_lat: float, max_lon: float) -> Tuple[range, range]:
+        rows = range(math.floor(min_lat / self.cell_size), math.floor(max_lat / self.cell_size) + 1)
+        cols = range(math.floor(min_lon / self.cell_size), math.floor(max_lon / self.cell_size) + 1)
+        return rows, cols
+
+    def insert(self, edge_id: int, from_coords: Tuple[float, float], to_coords: Tuple[float, float]):
+        self._thaw()
+        if edge_id in self._edge_cells:
+            self.remove(edge_id)
+
+        rows, cols = self._cell_range(min(from_coords[0], to_coords[0]), min(from_coords[1], to_coords[1]),
+                                      max(from_coords[0], to_coords[0]), max(from_coords[1], to_coords[1]))
+        cells = [(r, c) for r in rows for c in cols]
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(edge_id)
+        self._edge_cells[edge_id] = cells
+
+    def remove(self, edge_id: int):
+        self._thaw()
+        for cell in self._edge_cells.pop(edge_id, ()):
+            bucket = self.cells[cell]
+            bucket.remove(edge_id)
+            if not bucket:
+                del self.cells[cell]
+
+    def query_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+        """Các edge có ô chung với bbox (có thể dư, không bao giờ thiếu)"""
+        rows, cols = self._cell_range(min_lat, min_lon, max_lat, max_lon)
+        found = set()
+        if len(rows) * len(cols) > len(self.cells):
+            # bbox lớn hơn vùng dữ liệu: duyệt các ô có dữ liệu thay vì mọi ô trong bbox
+            for (r, c), bucket in self.cells.items():
+                if r in rows and c in cols:
+                    found.update(bucket)
+        else:
+            for r in rows:
+                for c in cols:
+                    bucket = self.cells.get((r, c))
+                    if bucket:
+                        found.update(bucket)
+        return sorted(found)
@@ -0,0 +1,191 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .geometry import EARTH_RADIUS, simplify_polyline
+from .graph import RoadGraph
+
+BBox = Tuple[float, float, float, float]
+
+# Từ zoom này trở lên trả về từng edge như /api/edges (không gộp, không đơn giản hóa)
+DETAIL_ZOOM = 17
+MAX_ZOOM = 22
+TILE_SIZE = 256
+# Sai số cho phép khi đơn giản hóa, tính bằng pixel màn hình ở zoom được yêu cầu
+SIMPLIFY_PIXELS = 1.0
+
+
+def tile_bbox(z: int, x: int, y: int) -> BBox:
+    """(min_lat, min_lon, max_lat, max_lon) của tile z/x/y theo lưới Web Mercator (như Leaflet/OSM)"""
+    n = 2 ** z
+
+    def lat_of(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat_of(y + 1), x / n * 360.0 - 180.0, lat_of(y), (x + 1) / n * 360.0 - 180.0
+
+
+def meters_per_pixel(zoom: int, lat: float) -> float:
+    return 2 * math.pi * EARTH_RADIUS * math.cos(math.radians(lat)) / (TILE_SIZE * 2 ** zoom)
+
+
+def edge_features(graph: RoadGraph, edge_ids: List[int], zoom: int) -> List[Dict]:
+    """Feature để vẽ các edge ở zoom cho trước.
+
+    Dưới DETAIL_ZOOM, các chuỗi edge nối qua node bậc 2 (trong tập edge_ids) có cùng trạng thái
+    (is_oneway + constraint) được gộp thành một polyline rồi đơn giản hóa bằng Douglas–Peucker với
+    sai số SIMPLIFY_PIXELS pixel. Chuỗi có hướng (một chiều) chỉ gộp khi các edge cùng chiều.
+    Mỗi feature: edge_ids, nodes (theo thứ tự trên polyline), coordinates [[lat, lon], ...],
+    distance, is_oneway, constraint.
+    """
+    if zoom >= DETAIL_ZOOM:
+        chains = [([edge_id], [graph.edges[edge_id]['from_node'], graph.edges[edge_id]['to_node']])
+                  for edge_id in edge_ids]
+        tolerance = 0.0
+    else:
+        chains = _merge_chains(graph, edge_ids)
+        lats = [graph.nodes[nodes[0]][0] for _, nodes in chains]
+        tolerance = SIMPLIFY_PIXELS * meters_per_pixel(zoom, sum(lats) / len(lats)) if lats else 0.0
+
+    features = []
+    for chain_edges, chain_nodes in chains:
+        first = graph.edges[chain_edges[0]]
+        coordinates = simplify_polyline([graph.nodes[node_id] for node_id in chain_nodes], tolerance)
+        features.append({
+            'edge_ids': chain_edges,
+            'nodes': chain_nodes,
+            'coordinates': [[lat, lon] for lat, lon in coordinates],
+            'distance': round(sum(graph.edges[edge_id]['distance'] for edge_id in chain_edges), 1),
+            'is_oneway': first['is_oneway'],
+            'constraint': _constraint_json(graph.constraints.get(chain_edges[0]))
+        })
+    return features
+
+
+def _constraint_json(constraint: Optional[Dict]) -> Optional[Dict]:
+    if constraint is None:
+        return None
+    return {
+        'constraint_type': constraint['type'],
+        'value': constraint['value'],
+        'description': constraint['description']
+    }
+
+
+def _state(graph: RoadGraph, edge_id: int) -> Tuple:
+    constraint = graph.constraints.get(edge_id)
+    if constraint is None:
+        return graph.edges[edge_id]['is_oneway'], None, None, None
+    return graph.edges[edge_id]['is_oneway'], constraint['type'], constraint['value'], constraint['description']
+
+
+def _is_directed(state: Tuple) -> bool:
+    return state[0] == 1 or (state[1] == 'oneway' and state[2] != 'both')
+
+
+def _merge_chains(graph: RoadGraph, edge_ids: List[int]) -> List[Tuple[List[int], List[int]]]:
+    """Gộp edge thành các chuỗi (edge_ids, nodes); chuỗi có hướng giữ chiều from → to của edge"""
+    incident: Dict[int, List[int]] = {}
+    for edge_id in edge_ids:
+        edge = graph.edges[edge_id]
+        incident.setdefault(edge['from_node'], []).append(edge_id)
+        if edge['to_node'] != edge['from_node']:
+            incident.setdefault(edge['to_node'], []).append(edge_id)
+
+    states = {edge_id: _state(graph, edge_id) for edge_id in edge_ids}
+    visited = set()
+
+    def next_edge(node_id: int, edge_id: int, leaving: bool) -> Optional[int]:
+        """Edge nối tiếp edge_id qua node_id nếu được gộp; leaving: chuỗi đi ra khỏi node_id
+        theo edge tiếp theo (tức edge_id đi vào node_id)"""
+        edges_here = incident[node_id]
+        if len(edges_here) != 2:
+            return None
+        other = edges_here[0] if edges_here[1] == edge_id else edges_here[1]
+        if other == edge_id or other in visited or states[other] != states[edge_id]:
+            return None
+        if _is_directed(states[other]):
+            other_edge = graph.edges[other]
+            if (other_edge['from_node'] == node_id) != leaving:
+                return None
+        return other
+
+    chains = []
+    for edge_id in edge_ids:
+        if edge_id in visited:
+            continue
+        visited.add(edge_id)
+        edge = graph.edges[edge_id]
+        chain_edges = [edge_id]
+        chain_nodes = [edge['from_node'], edge['to_node']]
+
+        # Nối tiếp phía to_node
+        current, node_id = edge_id, edge['to_node']
+        while True:
+            other = next_edge(node_id, current, leaving=True)
+            if other is None:
+                break
+            visited.add(other)
+            other_edge = graph.edges[other]
+            node_id = other_edge['to_node'] if other_edge['from_node'] == node_id else other_edge['from_node']
+            chain_edges.append(other)
+            chain_nodes.append(node_id)
+            current = other
+
+        # Nối ngược phía from_node
+        current, node_id = edge_id, edge['from_node']
+        while True:
+            other = next_edge(node_id, current, leaving=False)
+            if other is None:
+                break
+            visited.add(other)
+            other_edge = graph.edges[other]
+            node_id = other_edge['to_node'] if other_edge['from_node'] == node_id else other_edge['from_node']
+            chain_edges.insert(0, other)
+            chain_nodes.insert(0, node_id)
+            current = other
+
+        chains.append((chain_edges, chain_nodes))
+    return chains
+
+
+class TileCache:
+    """LRU cache theo tile, gắn với graph.constraint_version: version mới hơn thì xóa toàn bộ,
+    kết quả dựng từ version cũ hơn thì không được lưu"""
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self.version: Optional[int] = None
+        self._entries: 'OrderedDict[Hashable, object]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: int) -> Optional[object]:
+        with self._lock:
+            self._sync_version(version)
+            if version < self.version:
+                return None
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, version: int, value: object):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._sync_version(version)
+            if version != self.version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _sync_version(self, version: int):
+        if self.version is None or version > self.version:
+            self._entries.clear()
+            self.version = version
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,39 @@
+"""Chạy nhiều worker process dùng chung graph:
+
+    gunicorn -c gunicorn.conf.py
+
+Process cha dựng graph snapshot (nếu cần) và phát weights ban đầu trước khi fork; mỗi worker
+mmap topology từ snapshot và weights từ vùng nhớ dùng chung (/dev/shm). Sửa constraints ở
+một worker sẽ phát delta (constraint và weights vừa đổi), các worker khác áp delta ở request kế tiếp.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('ROUTING_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('ROUTING_WORKERS', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('ROUTING_THREADS', 4))
+wsgi_app = 'wsgi:app'
+# Mỗi worker tự load graph (từ vùng nhớ dùng chung) sau khi fork
+preload_app = False
+
+shared_state = None
+
+
+def on_starting(server):
+    global shared_state
+    from app import prepare_shared_graph
+
+    shared_state = prepare_shared_graph()
+    if shared_state is None:
+        raise SystemExit("Failed to load graph data. Please check your CSV files.")
+
+
+def post_fork(server, worker):
+    import app
+
+    app.configure_shared_state(shared_state)
+
+
+def on_exit(server):
+    if shared_state is not None:
+        shared_state.cleanup()
@@ -1,6 +1,8 @@
 import csv
 import os
 
+from core.snapshot import build_snapshot
+
 def import_nodes(csv_path):
     print(f"Importing nodes from {csv_path}...")
 
@@ -16,6 +18,7 @@ def import_nodes(csv_path):
             })
 
     print(f"Successfully imported {len(nodes)} nodes")
+    return nodes
 
 def import_edges(csv_path):
     print(f"Importing edges from {csv_path}...")
@@ -34,6 +37,7 @@ def import_edges(csv_path):
             })
 
     print(f"Successfully imported {len(edges)} edges")
+    return edges
 
 def import_constraints(csv_path):
     if not os.path.exists(csv_path):
@@ -62,17 +66,23 @@ if __name__ == '__main__':
     nodes_path = os.path.join(data_dir, 'nodes.csv')
     edges_path = os.path.join(data_dir, 'edges.csv')
     constraints_path = os.path.join(data_dir, 'constraints', 'constraints_edges.csv')
+    snapshot_path = os.path.join(data_dir, 'cache', 'graph.snapshot')
 
+    nodes = edges = None
     if os.path.exists(nodes_path):
-        import_nodes(nodes_path)
+        nodes = import_nodes(nodes_path)
     else:
         print(f"Nodes file not found: {nodes_path}")
 
     if os.path.exists(edges_path):
-        import_edges(edges_path)
+        edges = import_edges(edges_path)
     else:
         print(f"Edges file not found: {edges_path}")
 
+    if nodes is not None and edges is not None:
+        build_snapshot(nodes, edges, snapshot_path)
+        print(f"Graph snapshot written to {snapshot_path}")
+
     if os.path.exists(constraints_path):
         import_constraints(constraints_path)
 
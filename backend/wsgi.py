@@ -0,0 +1,30 @@
+"""Entry point cho production (không bật debug/reloader của Flask).
+
+    gunicorn -w 1 --threads 8 -b 0.0.0.0:5000 wsgi:app
+    python wsgi.py          # waitress nếu đã cài, ngược lại server threaded của Flask
+
+Với lệnh gunicorn trên mỗi process giữ graph riêng nên chỉ chạy 1 worker; muốn nhiều
+worker process dùng chung graph thì chạy `gunicorn -c gunicorn.conf.py`.
+"""
+import os
+
+from app import app, load_graph_data
+
+THREADS = int(os.environ.get('ROUTING_THREADS', 8))
+
+if not load_graph_data():
+    raise SystemExit("Failed to load graph data. Please check your CSV files.")
+
+if __name__ == '__main__':
+    host = os.environ.get('ROUTING_HOST', '0.0.0.0')
+    port = int(os.environ.get('ROUTING_PORT', 5000))
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+
+    print(f"Starting server on http://{host}:{port} ({THREADS} threads)")
+    if serve is not None:
+        serve(app, host=host, port=port, threads=THREADS)
+    else:
+        app.run(host=host, port=port, threaded=True, debug=False, use_reloader=False)